@@ -0,0 +1,432 @@
+from array import array
+
+from compiler.comparisons import comparison
+from compiler.inliner import FunctionIndex
+from compiler.scopes import UNDEFINED
+from system.builtin_functions.main import *
+from utils.constants import *
+from utils.data_classes import *
+
+# Every instruction is two words of a Code's array: an opcode and an
+# argument, which is a slot, a jump target or the index of a constant.
+LOAD_CONST = 0  # push constants[arg]
+LOAD_LOCAL = 1  # push slot arg of the current frame
+LOAD_DEREF = 2  # push slot arg >> 16 of the frame at depth arg & 0xffff
+STORE_LOCAL = 3  # pop into slot arg of the current frame
+ASSIGN_LOCAL = 4  # pop into slot arg of the current frame, if it is defined
+ASSIGN_DEREF = 5  # the same for a (depth, slot) packed like LOAD_DEREF
+ASSIGN_CHECKED = 6  # the same, type checked; constants[arg] is (depth, slot, type)
+DECLARE = 7  # pop into the slots of a declaration; constants[arg] is (slots, type)
+DECLARE_FUNCTION = 8  # store a Closure in a slot; constants[arg] is (slot, FunctionDecl)
+BINARY = 9  # apply OPERATORS[arg] to the two topmost values
+UNARY_POSITIVE = 10
+UNARY_NEGATIVE = 11
+CONCAT = 12
+COMPARE = 13  # apply the comparison function constants[arg]
+NOT = 14
+OR_ELSE = 15  # keep the topmost value and jump to arg unless it is False, which is popped
+AND_THEN = 16  # pop the topmost value if it is True, else jump to arg
+TEST_TRUE = 17  # replace the topmost value by whether it is True
+JUMP = 18  # to arg
+JUMP_IF_NOT_TRUE = 19  # pop, jump to arg unless it is True
+POP = 20
+LOAD_FUNCTION = 21  # push the Closure the CallSite constants[arg] calls
+CALL = 22  # call the function below the arguments of the CallSite constants[arg]
+CALL_BUILTIN = 23  # constants[arg] is (function, number of arguments)
+RETURN_VALUE = 24
+CLEAR = 25  # reset a range of slots; constants[arg] is (start, stop, blank)
+SETUP_LOOP = 26  # a loop whose POP_LOOP is at arg starts
+POP_LOOP = 27
+COUNT_LOOP = 28  # fail once the loop ran too many times
+BREAK_OUT = 29  # break outside of a loop of the function
+INDUCTION_INIT = 30  # constants[arg] is (variable slot, ((slot, factor), ...))
+INDUCTION_STEP = 31  # constants[arg] is ((slot, step), ...)
+LOAD_HOISTED = 32  # constants[arg] is (slot, target): push the slot and jump if it is set
+STORE_HOISTED = 33  # store the topmost value in slot arg, without popping it
+ENTER_INLINED = 34  # constants[arg] is (depth, slot, function, target of the regular call)
+CHECK_ARGUMENTS = 35  # type check arguments of an inlined call; constants[arg] is (slots, guards, function)
+
+# name of every opcode, indexed by the opcode
+OPCODES = (
+    'LOAD_CONST',
+    'LOAD_LOCAL',
+    'LOAD_DEREF',
+    'STORE_LOCAL',
+    'ASSIGN_LOCAL',
+    'ASSIGN_DEREF',
+    'ASSIGN_CHECKED',
+    'DECLARE',
+    'DECLARE_FUNCTION',
+    'BINARY',
+    'UNARY_POSITIVE',
+    'UNARY_NEGATIVE',
+    'CONCAT',
+    'COMPARE',
+    'NOT',
+    'OR_ELSE',
+    'AND_THEN',
+    'TEST_TRUE',
+    'JUMP',
+    'JUMP_IF_NOT_TRUE',
+    'POP',
+    'LOAD_FUNCTION',
+    'CALL',
+    'CALL_BUILTIN',
+    'RETURN_VALUE',
+    'CLEAR',
+    'SETUP_LOOP',
+    'POP_LOOP',
+    'COUNT_LOOP',
+    'BREAK_OUT',
+    'INDUCTION_INIT',
+    'INDUCTION_STEP',
+    'LOAD_HOISTED',
+    'STORE_HOISTED',
+    'ENTER_INLINED',
+    'CHECK_ARGUMENTS',
+)
+
+OPERATORS = (K_PLUS, K_MINUS, K_MULT, K_INTEGER_DIV, K_FLOAT_DIV)
+
+
+class Code:
+    """
+    Bytecode of the program or of one function.
+
+    nodes has the node each instruction was compiled from, for the position
+    and the names in error messages.
+    """
+
+    __slots__ = ('name', 'depth', 'frame_size', 'code', 'constants', 'nodes')
+
+    def __init__(self, name, depth, frame_size):
+        self.name = name
+        self.depth = depth
+        self.frame_size = frame_size
+        # 64 bit words: a C long is 32 bits on Windows, too small for the
+        # (slot << 16 | depth) arguments of frames with more than 32767 slots
+        self.code = array('q')
+        self.constants = []
+        self.nodes = []
+
+    def __repr__(self):
+        return f'<code {self.name} at depth {self.depth}>'
+
+
+class CallSite:
+    # what a CALL instruction needs about the call
+    __slots__ = ('depth', 'slot', 'function', 'code', 'guards', 'argc')
+
+    def __init__(self, depth, slot, function, code, guards, argc):
+        self.depth = depth
+        self.slot = slot
+        # the function the call was resolved to and its code, or None
+        self.function = function
+        self.code = code
+        self.guards = guards
+        self.argc = argc
+
+    def __repr__(self):
+        return f'<call {self.depth}:{self.slot} {self.code}>'
+
+
+class BytecodeCompiler(NodeVisitor):
+    """
+    Compiles a tree checked by the SemanticAnalyzer (and optimized, if
+    asked for) to a Code for the program and one for every function.
+    Statements leave the value stack as they found it.
+    """
+
+    def __init__(self, tree: Program):
+        self.tree = tree
+        self.code = None
+        # Code of every function
+        self.codes = {}
+        self.functions = {}
+        # jump instructions of the breaks of the loops being compiled
+        self.breaks = None
+
+    def code_of(self, function: FunctionDecl):
+        code = self.codes.get(function)
+        if code is None:
+            code = self.codes[function] = Code(function.name, function.depth, function.frame_size)
+        return code
+
+    def emit(self, opcode, arg=0, node=None):
+        # returns the offset of the instruction
+        code = self.code
+        offset = len(code.code)
+        code.code.append(opcode)
+        code.code.append(arg)
+        code.nodes.append(node)
+        return offset
+
+    def constant(self, value):
+        constants = self.code.constants
+        constants.append(value)
+        return len(constants) - 1
+
+    def offset(self):
+        return len(self.code.code)
+
+    def patch(self, offset, target=None):
+        # jump at offset goes to target, by default the next instruction
+        self.code.code[offset + 1] = self.offset() if target is None else target
+
+    def visit_BinOp(self, node: BinOp):
+        self.visit(node.left)
+        self.visit(node.right)
+        self.emit(BINARY, OPERATORS.index(node.op), node)
+
+    def visit_UnaryOp(self, node: UnaryOp):
+        self.visit(node.expr)
+        self.emit(UNARY_POSITIVE if node.op == K_PLUS else UNARY_NEGATIVE, 0, node)
+
+    def visit_Num(self, node):
+        self.emit(LOAD_CONST, self.constant(node.value))
+
+    visit_Str = visit_BooleanSymbol = visit_Num
+
+    def visit_NoneType(self, node):
+        self.emit(LOAD_CONST, self.constant(None))
+
+    def visit_StrOp(self, node: StrOp):
+        self.visit(node.left)
+        self.visit(node.right)
+        self.emit(CONCAT, 0, node)
+
+    def visit_NotOp(self, node: NotOp):
+        self.visit(node.expr)
+        self.emit(NOT, 0, node)
+
+    def visit_BoolOp(self, node: BoolOp):
+        # comparisons
+        self.visit(node.left)
+        self.visit(node.right)
+        self.emit(COMPARE, self.constant(comparison(node)), node)
+
+    visit_BoolNotEqual = visit_BoolGreaterThan = visit_BoolGreaterThanOrEqual = visit_BoolOp
+    visit_BoolLessThan = visit_BoolLessThanOrEqual = visit_BoolIsEqual = visit_BoolOp
+
+    def visit_BoolOr(self, node: BoolOr):
+        # the right operand is evaluated only if the left one is False;
+        # operands that are not booleans are false
+        self.visit(node.left)
+        skip = self.emit(OR_ELSE)
+        self.visit(node.right)
+        self.emit(TEST_TRUE)
+        self.patch(skip)
+
+    def visit_BoolAnd(self, node: BoolAnd):
+        self.visit(node.left)
+        skip = self.emit(AND_THEN)
+        self.visit(node.right)
+        self.emit(TEST_TRUE)
+        self.patch(skip)
+
+    def visit_Var(self, node: Var):
+        if node.depth == self.code.depth:
+            self.emit(LOAD_LOCAL, node.slot, node)
+        else:
+            self.emit(LOAD_DEREF, node.slot << 16 | node.depth, node)
+
+    def visit_Hoisted(self, node: Hoisted):
+        load = self.emit(LOAD_HOISTED, self.constant(None))
+        self.visit(node.expr)
+        self.emit(STORE_HOISTED, node.slot)
+        self.code.constants[self.code.code[load + 1]] = (node.slot, self.offset())
+
+    def visit_Assign(self, node: Assign):
+        var = node.left
+        self.visit(node.right)
+        if node.guarded:
+            self.emit(ASSIGN_CHECKED, self.constant((var.depth, var.slot, node.type)), var)
+        elif var.depth == self.code.depth:
+            self.emit(ASSIGN_LOCAL, var.slot, var)
+        else:
+            self.emit(ASSIGN_DEREF, var.slot << 16 | var.depth, var)
+
+    def visit_VarDecs(self, node: VarDecs):
+        self.visit(node.get_value())
+        base_type = node.get_type() if node.guarded else None
+        self.emit(DECLARE, self.constant((tuple(node.slots), base_type)), node)
+
+    def statements(self, statements):
+        for statement in statements:
+            self.visit(statement)
+            if isinstance(statement, (FunctionCall, Inlined)):
+                self.emit(POP)
+
+    def visit_Block(self, node: Block):
+        self.statements(node.var_decs)
+        self.visit(node.compound_statement)
+
+    def visit_Compound(self, node: Compound):
+        self.statements(node.get_children())
+
+    def visit_NoOp(self, node):
+        pass
+
+    def visit_Program(self, node: Program):
+        self.code = Code('<program>', 0, node.frame_size)
+        self.visit(node.block)
+        self.emit(LOAD_CONST, self.constant(None))
+        self.emit(RETURN_VALUE)
+        return self.code
+
+    def visit_FunctionDecl(self, node: FunctionDecl):
+        code, breaks = self.code, self.breaks
+        self.code, self.breaks = self.code_of(node), None
+        self.visit(node.block)
+        self.emit(LOAD_CONST, self.constant(None))
+        self.emit(RETURN_VALUE)
+        self.code, self.breaks = code, breaks
+
+        self.emit(DECLARE_FUNCTION, self.constant((node.slot, node)), node)
+
+    def visit_FunctionCall(self, node: FunctionCall):
+        argc = len(node.actual_params)
+        if node.slot is None:
+            # system function call
+            for param in node.actual_params:
+                self.visit(param)
+            self.emit(CALL_BUILTIN, self.constant((get_system_function(node.name), argc)), node)
+            return
+
+        # function the call was resolved to, if its slot never holds another
+        function = self.functions.get((node.depth, node.slot)) if node.guards is not None else None
+        code = self.code_of(function) if function is not None else None
+        site = self.constant(CallSite(node.depth, node.slot, function, code, node.guards, argc))
+        # the function is looked up before its arguments are evaluated
+        self.emit(LOAD_FUNCTION, site, node)
+        for param in node.actual_params:
+            self.visit(param)
+        self.emit(CALL, site, node)
+
+    def visit_Inlined(self, node: Inlined):
+        call = node.call
+        enter = self.emit(ENTER_INLINED, self.constant(None), call)
+        for slot, param in zip(node.slots, call.actual_params):
+            self.visit(param)
+            self.emit(STORE_LOCAL, slot)
+        if call.guards:
+            self.emit(CHECK_ARGUMENTS, self.constant((node.slots, call.guards, node.function)), call)
+        self.visit(node.expr)
+        end = self.emit(JUMP)
+
+        # the function is not declared yet
+        fallback = self.offset()
+        self.visit(call)
+        self.patch(end)
+        self.code.constants[self.code.code[enter + 1]] = (call.depth, call.slot, node.function, fallback)
+
+    def clear(self, scope):
+        if scope:
+            self.emit(CLEAR, self.constant((scope.start, scope.stop, [UNDEFINED] * len(scope))))
+
+    def visit_IfStat(self, node: IfStat):
+        ends = []
+        for index, if_block in enumerate(node.if_blocks):
+            self.visit(if_block.expr)
+            skip = self.emit(JUMP_IF_NOT_TRUE)
+            self.clear(if_block.scope)
+            self.visit(if_block.block)
+            if index + 1 < len(node.if_blocks) or node.else_block is not None:
+                ends.append(self.emit(JUMP))
+            self.patch(skip)
+        if node.else_block is not None:
+            self.visit(node.else_block)
+        for end in ends:
+            self.patch(end)
+
+    def visit_Break(self, node: Break):
+        if self.breaks is None:
+            self.emit(BREAK_OUT, 0, node)
+        else:
+            self.breaks.append(self.emit(JUMP))
+
+    def visit_ReturnStat(self, node: ReturnStat):
+        self.visit(node.base_expr)
+        self.emit(RETURN_VALUE)
+
+    def visit_ForLoop(self, node: ForLoop):
+        setup = self.emit(SETUP_LOOP)
+        self.clear(node.scope)
+        self.clear(node.invariants)
+        self.visit(node.base.right)
+        self.emit(STORE_LOCAL, node.base.left.slot)
+        if node.inductions:
+            factors = tuple((slot, factor) for slot, factor, _ in node.inductions)
+            self.emit(INDUCTION_INIT, self.constant((node.base.left.slot, factors)))
+
+        start = self.offset()
+        self.visit(node.bool_expr)
+        exit_jump = self.emit(JUMP_IF_NOT_TRUE)
+
+        breaks, self.breaks = self.breaks, []
+        self.visit(node.block)
+        loop_breaks, self.breaks = self.breaks, breaks
+
+        self.visit(node.then)
+        if node.inductions:
+            steps = tuple((slot, step) for slot, _, step in node.inductions)
+            self.emit(INDUCTION_STEP, self.constant(steps))
+        self.emit(COUNT_LOOP, 0, node)
+        self.emit(JUMP, start)
+
+        self.patch(exit_jump)
+        for jump in loop_breaks:
+            self.patch(jump)
+        self.patch(setup)
+        self.emit(POP_LOOP)
+
+    def compile(self):
+        # functions by the (depth, slot) they are declared in, for the slots
+        # written by nothing else
+        index = FunctionIndex(self.tree)
+        index.visit(self.tree)
+        self.functions = {(function.depth - 1, function.slot): function for function in index.functions
+                          if index.writes[function.depth - 1, function.slot] == 1}
+        return self.visit(self.tree)
+
+
+def disassemble(code: Code, codes=None):
+    """
+    Readable listing of a Code, followed by the listings of the functions
+    declared in it.
+    """
+    lines = [f'{code!r}, {code.frame_size} slots:']
+    nested = []
+    instructions = code.code
+    for offset in range(0, len(instructions), 2):
+        opcode, arg = instructions[offset], instructions[offset + 1]
+        name = OPCODES[opcode]
+        if opcode in (LOAD_CONST, ASSIGN_CHECKED, DECLARE, DECLARE_FUNCTION, LOAD_FUNCTION, CALL, CALL_BUILTIN, CLEAR,
+                      INDUCTION_INIT, INDUCTION_STEP, LOAD_HOISTED, ENTER_INLINED, CHECK_ARGUMENTS, COMPARE):
+            detail = repr(code.constants[arg])
+            if opcode == DECLARE_FUNCTION:
+                function = code.constants[arg][1]
+                detail = f'{function.name} in slot {function.slot}'
+                if codes is not None:
+                    nested.append(codes[function])
+            elif opcode == CALL_BUILTIN:
+                detail = f'{code.constants[arg][1]} arguments'
+            elif opcode == CLEAR:
+                detail = f'slots {code.constants[arg][0]} to {code.constants[arg][1]}'
+            elif opcode == COMPARE:
+                detail = code.constants[arg].__name__
+        elif opcode in (LOAD_DEREF, ASSIGN_DEREF):
+            detail = f'depth {arg & 0xffff}, slot {arg >> 16}'
+        elif opcode == BINARY:
+            detail = TOKEN_TYPES[OPERATORS[arg]]
+        else:
+            detail = ''
+        node = code.nodes[offset >> 1]
+        if isinstance(node, (Var, FunctionCall)):
+            detail = f'{detail} ({node.value if isinstance(node, Var) else node.name})'.strip()
+        lines.append(f'{offset:>6} {name:<18} {arg:<6} {detail}'.rstrip())
+
+    for function_code in nested:
+        lines.append('')
+        lines.append(disassemble(function_code, codes))
+    return '\n'.join(lines)
@@ -0,0 +1,125 @@
+import hashlib
+import os
+import pickle
+import tempfile
+import zlib
+
+from utils.constants import LANGUAGE_VERSION
+
+CACHE_DIR = '__dycache__'
+CACHE_SUFFIX = '.dyc'
+
+# every cached file starts with this header; bump the version whenever the
+# AST classes change so that trees pickled by older compilers are not loaded
+MAGIC = b'DYC'
+CACHE_VERSION = 10
+HEADER = MAGIC + CACHE_VERSION.to_bytes(2, 'little')
+
+DEFAULT_MAX_SIZE = 64 * 1024 * 1024
+_READ_SIZE = 1 << 16
+
+
+class CompileCache:
+    """
+    On-disk cache of analyzed Program trees, like __pycache__ for .py files.
+
+    Entries are keyed by the hash of the source, the language version and
+    the compiler options, written atomically and evicted least recently used
+    first once the directory grows over max_size bytes.
+    """
+
+    def __init__(self, directory, max_size=DEFAULT_MAX_SIZE):
+        self.directory = directory
+        self.max_size = max_size
+
+    @classmethod
+    def for_source(cls, source_path, max_size=DEFAULT_MAX_SIZE):
+        # __dycache__ directory next to the source file
+        return cls(os.path.join(os.path.dirname(source_path), CACHE_DIR), max_size)
+
+    @staticmethod
+    def key(source_path, options=None):
+        digest = hashlib.sha256()
+        digest.update('{}:{}:{}\0'.format(LANGUAGE_VERSION, CACHE_VERSION, sorted((options or {}).items())).encode())
+        with open(source_path, 'rb') as f:
+            for chunk in iter(lambda: f.read(_READ_SIZE), b''):
+                digest.update(chunk)
+        return digest.hexdigest()
+
+    def get_path(self, key):
+        return os.path.join(self.directory, key + CACHE_SUFFIX)
+
+    def load(self, key):
+        path = self.get_path(key)
+        try:
+            with open(path, 'rb') as f:
+                data = f.read()
+        except OSError:
+            return None
+
+        if not data.startswith(HEADER):
+            self.remove(path)
+            return None
+
+        try:
+            tree = pickle.loads(zlib.decompress(data[len(HEADER):]))
+        except Exception:
+            # corrupted or written by an incompatible compiler
+            self.remove(path)
+            return None
+
+        # mark as recently used for eviction
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+        return tree
+
+    def store(self, key, tree):
+        try:
+            data = HEADER + zlib.compress(pickle.dumps(tree, pickle.HIGHEST_PROTOCOL))
+        except RecursionError:
+            # too deeply nested to be pickled, compile it every time
+            return False
+
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+            try:
+                with os.fdopen(fd, 'wb') as f:
+                    f.write(data)
+                os.replace(tmp_path, self.get_path(key))
+            except BaseException:
+                self.remove(tmp_path)
+                raise
+        except OSError:
+            # caching is best effort, e.g. read-only source directories
+            return False
+
+        self.evict()
+        return True
+
+    def evict(self):
+        entries = []
+        try:
+            with os.scandir(self.directory) as it:
+                for entry in it:
+                    if entry.name.endswith(CACHE_SUFFIX):
+                        stat = entry.stat()
+                        entries.append((stat.st_mtime, stat.st_size, entry.path))
+        except OSError:
+            return
+
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total <= self.max_size:
+                break
+            self.remove(path)
+            total -= size
+
+    @staticmethod
+    def remove(path):
+        try:
+            os.remove(path)
+        except OSError:
+            pass
@@ -0,0 +1,423 @@
+import operator
+
+from compiler.comparisons import comparison
+from compiler.inliner import FunctionIndex
+from compiler.memo import Memos, MEMO_SIZE
+from compiler.scopes import UNDEFINED, Closure, function_of, enter_closure, leave_closure
+from compiler.type_inference import parameter_guards
+from system.builtin_functions.main import *
+from utils.constants import *
+from utils.data_classes import *
+from utils.errors import InterpreterError, ErrorCode
+# after the star imports, whose BREAK is the name of the keyword
+from compiler.signals import BREAK, Return, BreakOut
+
+OPERATORS = {
+    K_PLUS: operator.add,
+    K_MINUS: operator.sub,
+    K_MULT: operator.mul,
+    K_INTEGER_DIV: operator.floordiv,
+    K_FLOAT_DIV: operator.truediv,
+}
+
+
+class FunctionCode:
+    # compiled body of a function, filled in when its declaration is compiled
+    __slots__ = ('body',)
+
+    def __init__(self):
+        self.body = None
+
+
+class ClosureCompiler(NodeVisitor):
+    """
+    Runs a tree checked by the SemanticAnalyzer by first turning every node
+    into a python closure. Operators, child closures, frame slots and
+    called functions are bound once, when the closure is built, so running
+    a node is a single call with no dispatch by class name.
+
+    Expressions compile to closures returning their value. Statements
+    compile to closures returning None, BREAK or a Return, which the loops,
+    functions and blocks around them pass on.
+    """
+
+    def __init__(self, tree, memo_size=MEMO_SIZE):
+        self.tree = tree
+        self.source_index = getattr(tree, 'source_index', None)
+        # frames of the running functions by depth, shared by all closures
+        self.display = []
+        # frame depth of the code being compiled
+        self.depth = 0
+        # whether the statements being compiled are in a loop of their function
+        self.in_loop = False
+        self.codes = {}
+        self.functions = {}
+        # results of the pure functions
+        self.memos = Memos(memo_size)
+
+    def error(self, message, node=None):
+        raise InterpreterError(ErrorCode.INTERPRETER_ERROR, message, getattr(node, 'pos', None), self.source_index)
+
+    def can_not_assign_error(self, var_name, value, base_type, node=None):
+        self.error("can't assign {} to var {} as type of {} is {}".format(
+            to_string(value), var_name, var_name, base_type), node)
+
+    def code_of(self, function: FunctionDecl):
+        code = self.codes.get(function)
+        if code is None:
+            code = self.codes[function] = FunctionCode()
+        return code
+
+    def statement(self, node):
+        run = self.visit(node)
+        if not isinstance(node, (FunctionCall, Inlined)):
+            return run
+
+        def call():
+            # the value of a call is not a signal
+            run()
+        return call
+
+    def sequence(self, statements):
+        statements = tuple(self.statement(statement) for statement in statements if not isinstance(statement, NoOp))
+        if len(statements) == 1:
+            return statements[0]
+
+        def run():
+            for statement in statements:
+                signal = statement()
+                if signal is not None:
+                    return signal
+        return run
+
+    def clear(self, scope):
+        # closure resetting the slots of a scope, or None if it has none
+        if not scope:
+            return None
+        display, depth = self.display, self.depth
+        start, stop, blank = scope.start, scope.stop, [UNDEFINED] * len(scope)
+
+        def clear():
+            display[depth][start:stop] = blank
+        return clear
+
+    def visit_BinOp(self, node: BinOp):
+        left, right, op, error = self.visit(node.left), self.visit(node.right), OPERATORS[node.op], self.error
+
+        def binary():
+            try:
+                return op(left(), right())
+            except (ArithmeticError, TypeError) as ex:
+                # e.g. division by zero or an operand of a wrong type
+                error(str(ex), node)
+        return binary
+
+    def visit_UnaryOp(self, node: UnaryOp):
+        expr = self.visit(node.expr)
+        if node.op == K_PLUS:
+            return lambda: +expr()
+        return lambda: -expr()
+
+    @staticmethod
+    def visit_Num(node: Num):
+        value = node.value
+        return lambda: value
+
+    visit_Str = visit_BooleanSymbol = visit_Num
+
+    @staticmethod
+    def visit_NoneType(node):
+        return lambda: None
+
+    def visit_StrOp(self, node: StrOp):
+        left, right, error = self.visit(node.left), self.visit(node.right), self.error
+
+        def concatenate():
+            left_value, right_value = left(), right()
+            if type(left_value) is not str or type(right_value) is not str:
+                error("can only concatenate string and string", node)
+            return left_value + right_value
+        return concatenate
+
+    def visit_NotOp(self, node: NotOp):
+        expr = self.visit(node.expr)
+        return lambda: not_bool(expr())
+
+    def visit_BoolOp(self, node: BoolOp):
+        # comparisons
+        left, right, compare = self.visit(node.left), self.visit(node.right), comparison(node)
+        return lambda: compare(left(), right())
+
+    visit_BoolNotEqual = visit_BoolGreaterThan = visit_BoolGreaterThanOrEqual = visit_BoolOp
+    visit_BoolLessThan = visit_BoolLessThanOrEqual = visit_BoolIsEqual = visit_BoolOp
+
+    def visit_BoolOr(self, node: BoolOr):
+        left, right = self.visit(node.left), self.visit(node.right)
+
+        def bool_or():
+            # the right operand is evaluated only if the left one is False
+            value = left()
+            return value is True or (value is False and right() is True)
+        return bool_or
+
+    def visit_BoolAnd(self, node: BoolAnd):
+        left, right = self.visit(node.left), self.visit(node.right)
+        return lambda: left() is True and right() is True
+
+    def visit_Var(self, node: Var):
+        display, depth, slot, error = self.display, node.depth, node.slot, self.error
+        message = "variable '" + node.value + "' is not defined"
+
+        def var():
+            value = display[depth][slot]
+            if value is UNDEFINED:
+                error(message, node)
+            return value
+        return var
+
+    def visit_Hoisted(self, node: Hoisted):
+        display, depth, slot, expr = self.display, self.depth, node.slot, self.visit(node.expr)
+
+        def hoisted():
+            frame = display[depth]
+            value = frame[slot]
+            if value is UNDEFINED:
+                value = frame[slot] = expr()
+            return value
+        return hoisted
+
+    def visit_Assign(self, node: Assign):
+        var = node.left
+        display, depth, slot, value = self.display, var.depth, var.slot, self.visit(node.right)
+        base_type, guarded = node.type, node.guarded
+
+        def assign():
+            val = value()
+            frame = display[depth]
+            if frame[slot] is UNDEFINED:
+                self.error(f"value {var.value} is not defined", var)
+            if guarded and not is_val_of_type(val, base_type):
+                self.can_not_assign_error(var.value, val, base_type, var)
+            frame[slot] = val
+        return assign
+
+    def visit_VarDecs(self, node: VarDecs):
+        display, depth, slots, value = self.display, self.depth, node.slots, self.visit(node.get_value())
+        base_type, guarded = node.get_type(), node.guarded
+
+        def declare():
+            val = value()
+            if val is not None and guarded and not is_val_of_type(val, base_type):
+                self.can_not_assign_error(node.get_var_names(), val, base_type, node)
+            frame = display[depth]
+            for slot in slots:
+                frame[slot] = val
+        return declare
+
+    def visit_Block(self, node: Block):
+        return self.sequence(node.var_decs + node.compound_statement.get_children())
+
+    def visit_Compound(self, node: Compound):
+        return self.sequence(node.get_children())
+
+    def visit_NoOp(self, node):
+        return lambda: None
+
+    def visit_Program(self, node: Program):
+        display, size, block = self.display, node.frame_size, self.visit(node.block)
+
+        def program():
+            display.append([UNDEFINED] * size)
+            try:
+                block()
+            except BreakOut:
+                self.error("Break is used outside of for-loop (0 len)")
+            finally:
+                display.pop()
+        return program
+
+    def visit_FunctionDecl(self, node: FunctionDecl):
+        depth, in_loop = self.depth, self.in_loop
+        self.depth, self.in_loop = node.depth, False
+        self.code_of(node).body = self.visit(node.block)
+        self.depth, self.in_loop = depth, in_loop
+
+        display, slot, scopes = self.display, node.slot, node.depth
+
+        def declare():
+            display[depth][slot] = Closure(node, display[:scopes])
+        return declare
+
+    def visit_FunctionCall(self, node: FunctionCall):
+        args = tuple(self.visit(param) for param in node.actual_params)
+        if node.slot is None:
+            # system function call
+            function = get_system_function(node.name)
+            return lambda: function(*[arg() for arg in args])
+
+        display, depth, slot = self.display, node.depth, node.slot
+        # function the call was resolved to, if its slot never holds another
+        declared = self.functions.get((depth, slot)) if node.guards is not None else None
+        code = self.code_of(declared) if declared is not None else None
+        static_guards = node.guards
+        run, memoized, memoize = self.run_function, self.memos.get, self.memos.size > 0
+
+        def call():
+            closure = display[depth][slot]
+            if closure.__class__ is not Closure:
+                self.error("no such function: " + node.name, node)
+            function = closure.function
+            by_name = function is declared
+            if by_name:
+                body, guards = code.body, static_guards
+            else:
+                # a function stored in a variable
+                body = self.codes[function].body
+                guards = parameter_guards(function, len(args))
+
+            # parameters are the first slots of the new frame
+            frame = [UNDEFINED] * function.frame_size
+            for index, arg in enumerate(args):
+                frame[index] = arg()
+            for index, param_type in guards:
+                if not is_val_of_type(frame[index], param_type):
+                    self.can_not_assign_error(function.params[index].name, frame[index], param_type, node)
+
+            if not by_name:
+                return self.run_closure(closure, body, frame)
+            if function.pure and memoize:
+                cache = memoized(function) or self.memoize(function, body)
+                return cache(*frame[:len(args)])
+            return run(function, body, frame)
+        return call
+
+    def run_closure(self, closure: Closure, body, frame):
+        # a function called from any scope runs in the ones it was declared in
+        function = closure.function
+        previous = enter_closure(self.display, closure)
+        try:
+            if function.pure and self.memos.size:
+                cache = self.memos.get(function) or self.memoize(function, body)
+                return cache(*frame[:len(function.params)])
+            return self.run_function(function, body, frame)
+        finally:
+            leave_closure(self.display, previous)
+
+    def memoize(self, function: FunctionDecl, body):
+        blank = [UNDEFINED] * (function.frame_size - len(function.params))
+        return self.memos.add(function, lambda *args: self.run_function(function, body, [*args, *blank]))
+
+    def run_function(self, function: FunctionDecl, body, frame):
+        display, depth = self.display, function.depth
+        if depth == len(display):
+            display.append(None)
+        previous = display[depth]
+        display[depth] = frame
+        try:
+            signal = body()
+        finally:
+            display[depth] = previous
+        if signal is not None:
+            return signal.value
+        return None
+
+    def visit_Inlined(self, node: Inlined):
+        call = node.call
+        display, depth, slot, function = self.display, call.depth, call.slot, node.function
+        fallback, expr, guards = self.visit(call), self.visit(node.expr), call.guards
+        args = tuple(zip(node.slots, (self.visit(param) for param in call.actual_params)))
+        current = self.depth
+
+        def inlined():
+            if function_of(display[depth][slot]) is not function:
+                # the function is not declared yet
+                return fallback()
+            frame = display[current]
+            for arg_slot, arg in args:
+                frame[arg_slot] = arg()
+            for index, param_type in guards:
+                value = frame[node.slots[index]]
+                if not is_val_of_type(value, param_type):
+                    self.can_not_assign_error(function.params[index].name, value, param_type, call)
+            return expr()
+        return inlined
+
+    def visit_IfStat(self, node: IfStat):
+        blocks = tuple((self.visit(if_block.expr), self.clear(if_block.scope), self.visit(if_block.block))
+                       for if_block in node.if_blocks)
+        else_block = self.visit(node.else_block) if node.else_block is not None else None
+
+        def if_stat():
+            for condition, clear, block in blocks:
+                if condition() is True:
+                    if clear is not None:
+                        clear()
+                    return block()
+            if else_block is not None:
+                return else_block()
+        return if_stat
+
+    def visit_Break(self, node: Break):
+        if self.in_loop:
+            return lambda: BREAK
+
+        def break_out():
+            raise BreakOut()
+        return break_out
+
+    def visit_ReturnStat(self, node: ReturnStat):
+        expr = self.visit(node.base_expr)
+        return lambda: Return(expr())
+
+    def visit_ForLoop(self, node: ForLoop):
+        display, depth = self.display, self.depth
+        base = node.base
+        init, var_slot = self.visit(base.right), base.left.slot
+        clear_scope, clear_invariants = self.clear(node.scope), self.clear(node.invariants)
+        inductions = node.inductions
+        condition = self.visit(node.bool_expr)
+        in_loop, self.in_loop = self.in_loop, True
+        block, then = self.visit(node.block), self.visit(node.then)
+        self.in_loop = in_loop
+        error = self.error
+
+        def loop():
+            if clear_scope is not None:
+                clear_scope()
+            if clear_invariants is not None:
+                clear_invariants()
+            frame = display[depth]
+            value = frame[var_slot] = init()
+            for slot, factor, _ in inductions:
+                frame[slot] = value * factor
+
+            count = 0
+            try:
+                while condition() is True:
+                    signal = block()
+                    if signal is not None:
+                        if signal is BREAK:
+                            break
+                        return signal
+                    then()
+                    for slot, _, step in inductions:
+                        frame[slot] += step
+                    count += 1
+                    if count + 1 > MAX_INT:
+                        error("too much calls from while")
+            except BreakOut:
+                # break in a function called from the loop
+                pass
+        return loop
+
+    def compile(self):
+        # functions by the (depth, slot) they are declared in, for the slots
+        # written by nothing else
+        index = FunctionIndex(self.tree)
+        index.visit(self.tree)
+        self.functions = {(function.depth - 1, function.slot): function for function in index.functions
+                          if index.writes[function.depth - 1, function.slot] == 1}
+        return self.visit(self.tree)
+
+    def interpret(self):
+        return self.compile()()
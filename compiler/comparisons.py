@@ -0,0 +1,36 @@
+import operator
+
+from compiler.type_inference import INT, NUMBER, NUMBERS, STR, BOOL
+from system.builtin_functions.main import *
+from utils.data_classes import *
+
+# Functions of the comparison nodes, by the type of their operands the
+# semantic analyzer inferred (BoolOp.operands); None is the function for
+# operands of any type. A function for typed operands gives the same result
+# as the one for any type would, for those operands.
+COMPARISONS = {
+    BoolIsEqual: {None: bool_is_equal, INT: operator.eq, NUMBER: operator.eq, STR: operator.eq, BOOL: operator.is_},
+    BoolNotEqual: {None: not_equal, INT: operator.ne, NUMBER: operator.ne, STR: operator.ne, BOOL: operator.is_not},
+    BoolGreaterThan: {None: bool_greater_than, INT: operator.gt, NUMBER: number_greater_than, STR: operator.gt},
+    BoolGreaterThanOrEqual: {None: bool_greater_than_or_equal, INT: operator.ge,
+                             NUMBER: number_greater_than_or_equal, STR: operator.ge},
+    BoolLessThan: {None: bool_less_than, INT: operator.lt, NUMBER: number_less_than, STR: operator.lt},
+    BoolLessThanOrEqual: {None: bool_less_than_or_equal, INT: operator.le,
+                          NUMBER: number_less_than_or_equal, STR: operator.le},
+}
+
+
+def operands_type(left, right):
+    # type shared by operands of the inferred types left and right that
+    # comparisons are specialized for, or None
+    if left == right and left in (INT, STR, BOOL):
+        return left
+    if left in NUMBERS and right in NUMBERS:
+        return NUMBER
+    return None
+
+
+def comparison(node: BoolOp):
+    # function comparing the operands of a comparison node
+    functions = COMPARISONS[node.__class__]
+    return functions.get(node.operands) or functions[None]
@@ -0,0 +1,208 @@
+from bisect import bisect_left, bisect_right
+from itertools import islice
+
+from compiler.lexer import Lexer
+from compiler.parser import Parser
+from compiler.token_buffer import TokenBuffer
+from utils.constants import *
+from utils.data_classes import *
+from utils.errors import LexerError, ParserError, ErrorCode
+from utils.source_index import SourceIndex
+
+
+class Item:
+    """
+    Top level piece of a program: one VAR section, one function declaration
+    or one statement, together with the token range [start, end) it was
+    parsed from and its nodes which have a source position.
+    """
+
+    def __init__(self, start, end, nodes, is_declaration, positioned):
+        self.start = start
+        self.end = end
+        self.nodes = nodes
+        self.is_declaration = is_declaration
+        self.positioned = positioned
+
+
+class IncrementalParser:
+    """
+    Keeps the text, tokens and top level items of a program between edits.
+
+    An edit re-lexes the text from the token before the changed region until
+    the new tokens line up with old ones again, and re-parses only the items
+    whose tokens were touched. Other items, with their FunctionDecl and Block
+    subtrees, are reused as they are.
+
+    Lexing and parsing are limited to the edited region, but an edit still
+    does some work for the whole file: it rebuilds the text and its
+    SourceIndex, lists the positions of the tokens to bisect them, splices
+    the token list, moves the positions of the tokens and nodes after the
+    edit and builds a new Program of all items. That is
+    cheap per token, about 1% of parsing the file again, but it grows with
+    the size of the file. Dy parses files from scratch; this is for callers
+    that keep a program between edits, such as an editor.
+    """
+
+    def __init__(self, text):
+        self.text = text
+        self.source_index = SourceIndex(text)
+        self.tokens = None
+        self.items = None
+        self.header_end = 0
+        self.tree = None
+        self.parse_all()
+
+    def error(self, message):
+        raise ParserError(
+            error_code=ErrorCode.PARSER_ERROR,
+            message=f'{ErrorCode.PARSER_ERROR.value} -> {message}',
+        )
+
+    def parse_all(self):
+        self.tree = self.tokens = self.items = None
+
+        lexer = Lexer(self.text, self.source_index)
+        tokens = list(lexer.tokens())
+        parser = Parser.from_tokens(TokenBuffer(tokens), self.source_index)
+        parser.match(K_PROGRAM)
+        parser.variable()
+        parser.match(K_LCBRACE)
+        header_end = parser.tokens.get_position()
+
+        items, _ = self.parse_items(parser, [])
+        self.parse_end(parser)
+
+        self.tokens, self.items, self.header_end = tokens, items, header_end
+        self.tree = self.build_tree()
+        return self.tree
+
+    @staticmethod
+    def parse_items(parser, following):
+        """
+        parses items until the end of the block, or until the cursor reaches
+        the start of one of the following (already parsed) items; returns the
+        new items and the index of the first following item to reuse
+        """
+        items = []
+        tokens = parser.tokens
+        next_item = 0
+        while True:
+            while next_item < len(following) and following[next_item].start < tokens.get_position():
+                next_item += 1
+            if next_item < len(following) and following[next_item].start == tokens.get_position():
+                return items, next_item
+
+            start = tokens.get_position()
+            parser.positioned = []
+            if tokens.get_current_token().kind in (K_VAR, K_FUNCTION):
+                nodes, is_declaration = parser.declaration(), True
+            elif parser.is_compound_statement():
+                node = parser.statement()
+                nodes, is_declaration = node if isinstance(node, list) else [node], False
+            else:
+                break
+            items.append(Item(start, tokens.get_position(), nodes, is_declaration, parser.positioned))
+
+        return items, len(following)
+
+    def parse_end(self, parser):
+        parser.match(K_RCBRACE)
+        if not parser.tokens.is_exhausted():
+            self.error("Syntax error at position " + str(parser.tokens.get_position()))
+
+    def build_tree(self):
+        # leading declarations are the block's var_decs, same as Parser.block()
+        var_decs, children = [], []
+        for item in self.items:
+            if item.is_declaration and not children:
+                var_decs.extend(item.nodes)
+            else:
+                children.extend(item.nodes)
+
+        return Program(Block(var_decs, Compound(children if children else [NoOp()])), self.source_index)
+
+    def edit(self, start, end, new_text) -> Program:
+        """
+        replaces text[start:end] with new_text and returns the updated Program;
+        takes time linear in the size of the text, see the class docstring
+        """
+        self.text = self.text[:start] + new_text + self.text[end:]
+        self.source_index = SourceIndex(self.text)
+
+        if self.tree is None:
+            return self.parse_all()
+
+        try:
+            return self.reparse(start, end, new_text)
+        except (LexerError, ParserError):
+            # the error is reported by parsing the whole text again
+            return self.parse_all()
+
+    def reparse(self, start, end, new_text):
+        tokens = self.tokens
+
+        # restart lexing one token before the one containing the edit, as
+        # the edit may join it with the previous token
+        # positions to bisect, as bisect takes no key before python 3.10
+        positions = [token.pos for token in tokens]
+        index = bisect_right(positions, start) - 1
+        restart = max(index - 1, 0)
+        if restart < self.header_end:
+            return self.parse_all()
+
+        # old tokens after the edit move by the change in length
+        delta = len(new_text) - (end - start)
+        new_end = start + len(new_text)
+
+        lexer = Lexer(self.text, self.source_index)
+        lexer.seek(tokens[restart].pos)
+
+        old = bisect_left(positions, end)
+        new_tokens = []
+        while True:
+            token = lexer.get_current_token()
+            if token.pos >= new_end:
+                while old < len(tokens) and tokens[old].pos + delta < token.pos:
+                    old += 1
+                if old == len(tokens):
+                    return self.parse_all()
+                synced = tokens[old]
+                if synced.pos + delta == token.pos and synced.kind == token.kind and synced.value == token.value:
+                    break
+            new_tokens.append(token)
+            lexer.go_forward()
+
+        # tokens[restart:old] are replaced; everything from tokens[old] is kept
+        tokens[restart:old] = new_tokens
+        shift = len(new_tokens) - (old - restart)
+        if delta:
+            # positions are absolute, so every token after the edit moves
+            for token in islice(tokens, restart + len(new_tokens), None):
+                token.pos += delta
+
+        # re-parse the items touched by the edit, then reuse the rest. The item
+        # before them is parsed again too, as new tokens may continue it
+        # (an elif after an if statement or more variables in a VAR section)
+        items = self.items
+        first = max(bisect_right([item.end for item in items], restart) - 1, 0)
+        following = items[bisect_left([item.start for item in items], old):]
+        for item in following:
+            item.start += shift
+            item.end += shift
+        if delta:
+            # nodes of the reused items move with their tokens
+            for item in following:
+                for node in item.positioned:
+                    node.pos += delta
+
+        parser = Parser.from_tokens(TokenBuffer(tokens), self.source_index)
+        parser.tokens.reset(items[first].start if first < len(items) else (
+            items[-1].end if items else self.header_end))
+        new_items, reused = self.parse_items(parser, following)
+        if reused == len(following):
+            self.parse_end(parser)
+
+        self.items = items[:first] + new_items + following[reused:]
+        self.tree = self.build_tree()
+        return self.tree
@@ -0,0 +1,137 @@
+from collections import Counter
+from copy import copy, deepcopy
+
+from compiler.walker import ProgramWalker, map_operands
+from utils.data_classes import *
+
+# largest expression a function may return to be inlined, in nodes; 0
+# disables inlining
+INLINE_SIZE = 16
+# functions with more parameters are not inlined
+INLINE_PARAMS = 4
+
+
+def expression_size(node):
+    size = 1
+    if isinstance(node, (BinOp, StrOp, BoolOp)):
+        size += expression_size(node.left) + expression_size(node.right)
+    elif isinstance(node, (UnaryOp, NotOp)):
+        size += expression_size(node.expr)
+    elif isinstance(node, FunctionCall):
+        size += sum(expression_size(param) for param in node.actual_params)
+    return size
+
+
+def calls(node, function: FunctionDecl):
+    # whether an expression calls function
+    if isinstance(node, FunctionCall):
+        if (node.depth, node.slot) == (function.depth - 1, function.slot):
+            return True
+        return any(calls(param, function) for param in node.actual_params)
+    if isinstance(node, (BinOp, StrOp, BoolOp)):
+        return calls(node.left, function) or calls(node.right, function)
+    if isinstance(node, (UnaryOp, NotOp)):
+        return calls(node.expr, function)
+    return False
+
+
+class FunctionIndex(ProgramWalker):
+    """
+    Functions declared in a program and the number of times each slot of
+    it is written; the slot of a function written only by its declaration
+    holds that function whenever it holds one.
+    """
+
+    def __init__(self, tree: Program):
+        super().__init__(tree)
+        self.functions = []
+        self.writes = Counter()
+
+    def write(self, depth, slot):
+        self.writes[depth, slot] += 1
+
+    def visit_FunctionDecl(self, node: FunctionDecl):
+        self.functions.append(node)
+        return super().visit_FunctionDecl(node)
+
+
+class Inliner(ProgramWalker):
+    """
+    Replaces calls of small functions whose body is a single return
+    statement by Inlined nodes evaluating the returned expression in the
+    caller's frame. Runs after the Optimizer, on trees resolved to frame
+    slots.
+
+    Arguments are evaluated once, in order, into new slots of the caller's
+    frame, to which the parameters of the copied expression are renamed;
+    every other variable is addressed by its absolute depth, which means the
+    same in every scope the function can be called from. Functions calling
+    themselves are not inlined, and calls are expanded at most once per
+    function in a chain, so mutually recursive functions stay finite.
+    """
+
+    def __init__(self, tree: Program, max_size=INLINE_SIZE):
+        super().__init__(tree)
+        self.max_size = max_size
+        # (depth, slot) calls resolve to -> function and a copy of its
+        # return expression
+        self.inlinable = {}
+        # functions being expanded
+        self.expanding = []
+
+    def return_expression(self, function: FunctionDecl, writes):
+        # the expression function returns if it can be inlined, else None
+        block = function.block
+        statements = block.compound_statement.get_children()
+        if block.var_decs or len(statements) != 1 or not isinstance(statements[0], ReturnStat):
+            return None
+        if len(function.params) > INLINE_PARAMS or writes[function.depth - 1, function.slot] != 1:
+            return None
+
+        expr = statements[0].base_expr
+        if expression_size(expr) > self.max_size or calls(expr, function):
+            return None
+        return expr
+
+    def rename(self, node, function: FunctionDecl, slots):
+        # copy of an expression of function, its parameters moved to slots
+        if isinstance(node, (Num, Str, BooleanSymbol)) or node is None:
+            return node
+        node = copy(node)
+        if isinstance(node, (Var, FunctionCall)) and node.depth == function.depth:
+            node.depth, node.slot = self.depth, slots[node.slot]
+        return map_operands(node, lambda operand: self.rename(operand, function, slots))
+
+    def expression(self, node):
+        map_operands(node, self.expression)
+        # a call through a variable (no guards) may call any function, which
+        # the slot of an inlinable one in another frame can hold as well
+        if not isinstance(node, FunctionCall) or node.guards is None \
+                or (node.depth, node.slot) not in self.inlinable:
+            return node
+
+        function, expr = self.inlinable[node.depth, node.slot]
+        if function in self.expanding:
+            return node
+        slots = [self.allocate() for _ in function.params]
+        expr = self.rename(expr, function, slots)
+
+        # calls in the copy are inlined as well
+        self.expanding.append(function)
+        expr = self.expression(expr) if expr is not None else None
+        self.expanding.pop()
+        return Inlined(node, function, slots, expr)
+
+    def optimize(self):
+        if self.max_size <= 0:
+            return self.tree
+
+        index = FunctionIndex(self.tree)
+        index.visit(self.tree)
+        for function in index.functions:
+            expr = self.return_expression(function, index.writes)
+            if expr is not None:
+                # the bodies of the functions may get calls inlined too
+                self.inlinable[function.depth - 1, function.slot] = function, deepcopy(expr)
+
+        return self.visit(self.tree)
@@ -1,44 +1,58 @@
-from compiler.scopes import NestedScopeable
-from compiler.symbol_table import SymbolTable
+from compiler.comparisons import comparison
+from compiler.memo import Memos, MEMO_SIZE
+from compiler.scopes import Framed, UNDEFINED, Closure, function_of, enter_closure, leave_closure
+from compiler.type_inference import parameter_guards
 from system.builtin_functions.main import *
 from utils.constants import *
 from utils.data_classes import *
 from utils.errors import InterpreterError, ErrorCode
+# after the star imports, whose BREAK is the name of the keyword
+from compiler.signals import Signal, BREAK, Return, BreakOut, TailCall
 
 
-class Interpreter(BeforeNodeVisitor, NestedScopeable):
-    def __init__(self, tree):
-        self.call_stack = list()
-        self.terminated_call_stack = list()
-        self.function_return_stat_list = list()
-        self.tree = tree
-        super().__init__(SymbolTable())
+class Interpreter(NodeVisitor, Framed):
+    """
+    Runs a tree checked by the SemanticAnalyzer: variables are read and
+    written through the (depth, slot) it resolved them to.
+
+    Statements return None, or the Signal of a break or a return, which
+    the blocks, loops and calls around them pass on or handle. A function
+    returning the result of a call of itself is run again in the same
+    frame, so tail recursion does not grow the Python stack.
+    """
 
-    def error(self, message):
-        raise InterpreterError(ErrorCode.INTERPRETER_ERROR, message)
+    def __init__(self, tree, memo_size=MEMO_SIZE):
+        self.tree = tree
+        self.source_index = getattr(tree, 'source_index', None)
+        # results of the pure functions
+        self.memos = Memos(memo_size)
+        super().__init__()
 
-    def is_terminated(self):
-        return len(self.terminated_call_stack) > 0
+    def error(self, message, node=None):
+        raise InterpreterError(ErrorCode.INTERPRETER_ERROR, message, getattr(node, 'pos', None), self.source_index)
 
     def visit_BinOp(self, node: BinOp):
         left = self.visit(node.left)
         right = self.visit(node.right)
-        operator = node.token.type
+        operator = node.op
 
         types = {
-            PLUS: lambda x, y: x + y,
-            MINUS: lambda x, y: x - y,
-            MULT: lambda x, y: x * y,
-            INTEGER_DIV: lambda x, y: x // y,
-            FLOAT_DIV: lambda x, y: x / y,
+            K_PLUS: lambda x, y: x + y,
+            K_MINUS: lambda x, y: x - y,
+            K_MULT: lambda x, y: x * y,
+            K_INTEGER_DIV: lambda x, y: x // y,
+            K_FLOAT_DIV: lambda x, y: x / y,
         }
 
-        return types[operator](left, right)
+        try:
+            return types[operator](left, right)
+        except (ArithmeticError, TypeError) as ex:
+            # e.g. division by zero or an operand of a wrong type
+            self.error(str(ex), node)
 
     def visit_UnaryOp(self, node: UnaryOp):
-        op: Token = node.op
         expr = node.expr
-        if op.type is PLUS:
+        if node.op == K_PLUS:
             return +self.visit(expr)
         else:
             return -self.visit(expr)
@@ -56,269 +70,277 @@ class Interpreter(BeforeNodeVisitor, NestedScopeable):
         right = self.visit(node.right)
 
         if type(left) is not str or type(right) is not str:
-            self.error("can only concatenate string and string")
+            self.error("can only concatenate string and string", node)
 
         return left + right
 
     def visit_Compound(self, node: Compound):
         for sub_node in node.get_children():
-            self.visit(sub_node)
+            signal = self.visit(sub_node)
+            # calls return values, which are never signals
+            if signal is not None and isinstance(signal, Signal):
+                return signal
 
     @staticmethod
     def can_assign(base_type, value):
         return is_val_of_type(value, base_type)
 
-    def can_not_assign_error(self, var_name, value, base_type):
-        self.error(
-            "can't assign {} to var {} as type of {} is {}".format(value, var_name, var_name, base_type))
+    def can_not_assign_error(self, var_name, value, base_type, node=None):
+        self.error("can't assign {} to var {} as type of {} is {}".format(
+            to_string(value), var_name, var_name, base_type), node)
 
     def visit_Assign(self, node: Assign):
-        var_name = node.left.value
+        var = node.left
         value = self.visit(node.right)
 
-        if self.symbol_table.is_defined(var_name):
-            # type checking
-            symbol: Symbol = self.symbol_table.lookup(var_name)
-            base_type = symbol.type
-            if not self.can_assign(base_type, value):
-                self.can_not_assign_error(var_name, value, symbol.type)
-            return self.symbol_table.assign(var_name, Symbol(var_name, value, base_type))
-        else:
-            raise ValueError(f"value {var_name} is not defined")
+        frame = self.display[var.depth]
+        if frame[var.slot] is UNDEFINED:
+            self.error(f"value {var.value} is not defined", var)
 
-    def visit_Var(self, node: Var):
-        var_name = node.value
-
-        # type: Symbol
-        symbol = self.symbol_table.lookup(var_name)
-        if symbol is None:
-            raise SyntaxError("variable '" + var_name + "' is not defined")
+        # type checking, unless the semantic analyzer proved the value valid
+        if node.guarded and not self.can_assign(node.type, value):
+            self.can_not_assign_error(var.value, value, node.type, var)
+        frame[var.slot] = value
 
-        if isinstance(symbol, FunctionDecl):
-            return symbol
+    def visit_Var(self, node: Var):
+        value = self.display[node.depth][node.slot]
+        if value is UNDEFINED:
+            self.error("variable '" + node.value + "' is not defined", node)
 
-        return symbol.value
+        return value
 
     def visit_NoOp(self, node):
         pass
 
-    def visit_Program(self, node: Program):
-        nested_symbol_table = SymbolTable(enclosed_parent=None)
-        self.symbol_table = nested_symbol_table
-
-        self.visit(node.block)
+    def visit_Hoisted(self, node: Hoisted):
+        frame = self.frame
+        value = frame[node.slot]
+        if value is UNDEFINED:
+            value = frame[node.slot] = self.visit(node.expr)
+        return value
 
-        self.symbol_table = self.symbol_table.enclosed_parent
+    def visit_Program(self, node: Program):
+        previous = self.enter_frame(0, [UNDEFINED] * node.frame_size)
+        try:
+            signal = self.visit(node.block)
+        except BreakOut:
+            signal = BREAK
+        finally:
+            self.leave_frame(0, previous)
+        if signal is BREAK:
+            self.error("Break is used outside of for-loop (0 len)")
 
     def visit_Block(self, node: Block):
         for declaration in node.var_decs:
             self.visit(declaration)
-        self.visit(node.compound_statement)
+        return self.visit(node.compound_statement)
 
     def visit_VarDecs(self, node: VarDecs):
-        declarations = node.get_declarations()
-        base_type = node.get_type().value
+        base_type = node.get_type()
         val = self.visit(node.get_value())
 
-        if val is not None:
+        if val is not None and node.guarded:
             if not self.can_assign(base_type, val):
-                self.can_not_assign_error(node.get_var_names(), val, base_type)
-
-        # print(base_type)
-        for var in declarations:
-            symbol = VarSymbol(var.value, val, base_type)
-            self.symbol_table.define(symbol)
+                self.can_not_assign_error(node.get_var_names(), val, base_type, node)
 
-    def visit_VarSymbol(self, node: VarSymbol):
-        self.symbol_table.define(node)
+        frame = self.frame
+        for slot in node.slots:
+            frame[slot] = val
 
     def visit_FunctionDecl(self, node: FunctionDecl):
-        self.symbol_table.define(node)
+        self.frame[node.slot] = Closure(node, self.display[:node.depth])
 
     def visit_FunctionCall(self, node: FunctionCall):
-        if self.symbol_table.is_defined(node.name) is False:
+        if node.slot is None:
             # system function call
-            if is_system_function(node.name):
-                params = [self.visit(param) for param in node.actual_params]
-                return call_system_function(node.name, *params)
-            else:
-                raise NameError("no such function: " + node.name)
-
-        function: FunctionDecl = self.symbol_table.lookup(node.name)
-        parameter_names: List[Symbol] = function.params
-        parameter_values = node.actual_params
-        params = {}
-        for var, val in zip(parameter_names, parameter_values):
-            params[var.name] = self.visit(val)
-
-        self.define_new_scope()
-        for param, item in params.items():
-            self.symbol_table.define(Symbol(param, item))
-
-        block = function.block
-        self.visit(block)
-
-        returns = None
-        if len(self.terminated_call_stack) > 0:
-            terminated_by = self.terminated_call_stack[-1]
-            if terminated_by == RETURN:
-                # we need to clear terminated_call_stack otherwise every visit call will be stopped
-                self.terminated_call_stack.pop()
-                # check if function has returned something
-                if len(self.function_return_stat_list) > 0:
-                    # take last node and remove it
-                    ret: ReturnStat = self.function_return_stat_list[-1]
-                    self.function_return_stat_list.pop()
-                    # as we save node itself, we need to evaluate it for now
-                    returns = self.visit(ret.base_expr)
-
-        self.destroy_current_scope()
-
-        return returns
+            params = [self.visit(param) for param in node.actual_params]
+            return call_system_function(node.name, *params)
+
+        closure = self.display[node.depth][node.slot]
+        if closure.__class__ is not Closure:
+            self.error("no such function: " + node.name, node)
+        function = closure.function
+
+        # parameters are the first slots of the new frame, bound by position
+        visit = self.visit
+        frame = [UNDEFINED] * function.frame_size
+        for slot, val in enumerate(node.actual_params):
+            frame[slot] = visit(val)
+
+        guards = node.guards
+        if guards is None:
+            # a function stored in a variable
+            return self.run_closure(closure, frame, node)
+        for index, param_type in guards:
+            if not self.can_assign(param_type, frame[index]):
+                self.can_not_assign_error(function.params[index].name, frame[index], param_type, node)
+
+        if function.pure and self.memos.size:
+            return self.memoized(function)(*frame[:len(function.params)])
+        return self.run_function(function, frame)
+
+    def run_closure(self, closure: Closure, frame, node: FunctionCall):
+        # a function called from any scope runs in the ones it was declared in
+        function = closure.function
+        for index, param_type in parameter_guards(function, len(node.actual_params)):
+            if not self.can_assign(param_type, frame[index]):
+                self.can_not_assign_error(function.params[index].name, frame[index], param_type, node)
+
+        previous = enter_closure(self.display, closure)
+        try:
+            if function.pure and self.memos.size:
+                return self.memoized(function)(*frame[:len(function.params)])
+            return self.run_function(function, frame)
+        finally:
+            leave_closure(self.display, previous)
+
+    def memoized(self, function: FunctionDecl):
+        cache = self.memos.get(function)
+        if cache is None:
+            blank = [UNDEFINED] * (function.frame_size - len(function.params))
+            cache = self.memos.add(function, lambda *args: self.run_function(function, [*args, *blank]))
+        return cache
+
+    def run_function(self, function: FunctionDecl, frame):
+        # enter_frame and leave_frame, inlined: only the frame at the depth of
+        # the function is swapped
+        display, depth = self.display, function.depth
+        if depth == len(display):
+            display.append(None)
+        previous, previous_frame = display[depth], self.frame
+        display[depth] = self.frame = frame
+        try:
+            signal = self.visit(function.block)
+            if signal is not None and signal.__class__ is TailCall:
+                # a new frame every time: closures declared by the previous
+                # run keep theirs
+                blank = [UNDEFINED] * (function.frame_size - len(function.params))
+                while signal is not None and signal.__class__ is TailCall:
+                    frame = [*signal.arguments, *blank]
+                    display[depth] = self.frame = frame
+                    signal = self.visit(function.block)
+        finally:
+            display[depth], self.frame = previous, previous_frame
+
+        if signal is None:
+            return None
+        if signal is BREAK:
+            # break outside of a loop of the function
+            raise BreakOut()
+        return signal.value
+
+    def visit_Inlined(self, node: Inlined):
+        call = node.call
+        if function_of(self.display[call.depth][call.slot]) is not node.function:
+            # the function is not declared yet
+            return self.visit_FunctionCall(call)
+
+        frame = self.frame
+        for slot, param in zip(node.slots, call.actual_params):
+            frame[slot] = self.visit(param)
+        for index, param_type in call.guards:
+            value = frame[node.slots[index]]
+            if not self.can_assign(param_type, value):
+                self.can_not_assign_error(node.function.params[index].name, value, param_type, call)
+
+        return self.visit(node.expr)
 
     @staticmethod
     def visit_BooleanSymbol(node: BooleanSymbol):
         return node.value
 
-    # def visit_BoolOp(self, node: BoolOp):
-    #     left = self.visit(node.left)
-    #     op = node.op.value
-    #     right = self.visit(node.right)
-    #     return evaluate_bool_expression(left, op, right)
-
     def visit_NotOp(self, node: NotOp):
         val = self.visit(node.expr)
         return not_bool(val)
 
-    def visit_BoolNotEqual(self, node: BoolNotEqual):
+    def visit_BoolOp(self, node: BoolOp):
+        # comparisons
         left = self.visit(node.left)
         right = self.visit(node.right)
-        return not_equal(left, right)
+        return comparison(node)(left, right)
+
+    visit_BoolNotEqual = visit_BoolGreaterThan = visit_BoolGreaterThanOrEqual = visit_BoolOp
+    visit_BoolLessThan = visit_BoolLessThanOrEqual = visit_BoolIsEqual = visit_BoolOp
 
     def visit_BoolOr(self, node: BoolOr):
+        # the right operand is evaluated only if the left one is False;
+        # operands that are not booleans are false
         left = self.visit(node.left)
-        right = self.visit(node.right)
-        return bool_or(left, right)
+        return left is True or (left is False and self.visit(node.right) is True)
 
     def visit_BoolAnd(self, node: BoolAnd):
-        left = self.visit(node.left)
-        right = self.visit(node.right)
-        return bool_and(left, right)
-
-    def visit_BoolGreaterThan(self, node: BoolGreaterThan):
-        left = self.visit(node.left)
-        right = self.visit(node.right)
-        return bool_greater_than(left, right)
-
-    def visit_BoolGreaterThanOrEqual(self, node: BoolGreaterThanOrEqual):
-        left = self.visit(node.left)
-        right = self.visit(node.right)
-        return bool_greater_than_or_equal(left, right)
-
-    def visit_BoolLessThan(self, node: BoolLessThan):
-        left = self.visit(node.left)
-        right = self.visit(node.right)
-        return bool_less_than(left, right)
-
-    def visit_BoolLessThanOrEqual(self, node: BoolLessThanOrEqual):
-        left = self.visit(node.left)
-        right = self.visit(node.right)
-        return bool_less_than_or_equal(left, right)
-
-    def visit_BoolIsEqual(self, node: BoolIsEqual):
-        left = self.visit(node.left)
-        right = self.visit(node.right)
-        return bool_is_equal(left, right)
-
-    def visit_IfBlock(self, node: IfBlock):
-        flag = self.visit(node.expr)
-        if flag is TRUE:
-            self.define_new_scope()
-            self.visit(node.block)
-            self.destroy_current_scope()
-            return True
-        return False
+        return self.visit(node.left) is True and self.visit(node.right) is True
 
     def visit_IfStat(self, node: IfStat):
         for if_block in node.if_blocks:
-            visited: bool = self.visit(if_block)
-            if visited is True:
-                return
+            if self.visit(if_block.expr) is True:
+                self.clear_slots(if_block.scope)
+                return self.visit(if_block.block)
         if node.else_block is not None:
-            self.visit(node.else_block)
+            return self.visit(node.else_block)
 
-    def visit_Break(self, node: Break):
-        if len(self.call_stack) < 1:
-            self.error("Break is used outside of for-loop (0 len)")
-        last_node = self.call_stack[-1]
-        if last_node is not FOR:
-            self.error("Break is used outside of for-loop")
-        self.terminated_call_stack.append(BREAK)
-        return None
+    @staticmethod
+    def visit_Break(node: Break):
+        return BREAK
 
     def visit_ForLoop(self, node: ForLoop):
         def before_for_loop():
-            self.define_new_scope()
+            self.clear_slots(node.scope)
+            self.clear_slots(node.invariants)
             base: Assign = node.base
-            # var i e.i i
-            var = base.left.value
             # i = 5 e.i 5
             val = self.visit(base.right)
-            # save new var in symbol table
-            self.symbol_table.define(Symbol(var, val, FLOAT))
+            # the loop variable has a slot of its own
+            self.frame[base.left.slot] = val
+            for slot, factor, _ in node.inductions:
+                self.frame[slot] = val * factor
 
         def run_loop():
-
-            def before_loop():
-                self.call_stack.append(FOR)
-
-            def can_loop():
-                if len(self.terminated_call_stack) > 0:
-                    if self.terminated_call_stack[-1] == BREAK:
-                        # this means "break" is used inside for-loop
-                        self.terminated_call_stack.pop()
-                    return False
-
-                return self.visit(node.bool_expr) is TRUE
-
-            def loop():
-                self.visit(node.block)
-                self.visit(node.then)
-
-            def after_loop():
-                last_node = self.call_stack.pop()
-                if last_node is not FOR:
-                    self.error("Something illegal happened in ForLoop")
-
-            def too_much_call_check(counter):
-                if counter + 1 > MAX_INT:
-                    self.error("too much calls from while")
-
             cnt = 0
-            before_loop()
-            while can_loop():
-                loop()
+            while self.visit(node.bool_expr) is True:
+                signal = self.visit(node.block)
+                if signal is not None:
+                    if signal is BREAK:
+                        break
+                    # return from the function the loop is in
+                    return signal
+                self.visit(node.then)
+                frame = self.frame
+                for slot, _, step in node.inductions:
+                    frame[slot] += step
                 cnt += 1
-                too_much_call_check(cnt)
-
-            after_loop()
-
-        def after_for_loop():
-            self.destroy_current_scope()
+                if cnt + 1 > MAX_INT:
+                    self.error("too much calls from while")
 
         before_for_loop()
-        run_loop()
-        after_for_loop()
-
-        return None
+        try:
+            return run_loop()
+        except BreakOut:
+            # break in a function called from the loop
+            return None
 
     @staticmethod
     def visit_NoneType(node):
         return None
 
     def visit_ReturnStat(self, node: ReturnStat):
-        self.terminated_call_stack.append(RETURN)
-        self.function_return_stat_list.append(node)
+        call = node.base_expr
+        if call.__class__ is FunctionCall and call.tail is not None \
+                and function_of(self.display[call.depth][call.slot]) is call.tail:
+            return self.tail_call(call)
+        # the value is evaluated here, in the frame of the function returning
+        return Return(self.visit(call))
+
+    def tail_call(self, node: FunctionCall):
+        # arguments of a call of the running function itself, which
+        # run_function binds to the parameters of its frame
+        visit = self.visit
+        arguments = [visit(param) for param in node.actual_params]
+        function = node.tail
+        for index, param_type in node.guards:
+            if not self.can_assign(param_type, arguments[index]):
+                self.can_not_assign_error(function.params[index].name, arguments[index], param_type, node)
+        return TailCall(arguments)
 
     def interpret(self):
         return self.visit(self.tree)
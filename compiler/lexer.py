@@ -1,32 +1,94 @@
+import codecs
+import re
+
 from utils.constants import *
 from utils.data_classes import Token
 from utils.errors import LexerError, ErrorCode
-from system.reserved import RESERVED_KEYWORDS
+from utils.source_index import SourceIndex
+from system.reserved import RESERVED_WORDS
+
+# declarative token spec: (group name, regular expression), tried in order.
+# all of them are joined into a single master pattern, so every token costs
+# one regex match instead of a chain of character comparisons
+TOKEN_SPEC = (
+    ('NUMBER', r'\d[\d.]*'),
+    ('STRING', r'"[^"]*"|\'[^\']*\''),
+    ('WORD', r'[^\W\d_][^\W_]*'),
+    ('COMMENT', r'\{\{'),
+    ('OPERATOR', r'!=|>=|<=|==|[-+*/().;{}:,<>=!]'),
+)
+
+# whitespace, one line comments (// ...) and multi-line comments ({{ ... }})
+SKIP_SPEC = (
+    r'\s+',
+    r'//[^\n]*(?:\n|\Z)',
+    r'\{\{[^}]*\}\}',
+)
+
+MASTER_PATTERN = re.compile('|'.join('(?P<{}>{})'.format(name, regex) for name, regex in TOKEN_SPEC))
+SKIP_PATTERN = re.compile('(?:{})+'.format('|'.join(SKIP_SPEC)))
+
+# operators and punctuation: lexeme -> (token kind, token value)
+OPERATORS = {
+    '+': (K_PLUS, '+'),
+    '-': (K_MINUS, '-'),
+    '*': (K_MULT, '*'),
+    '/': (K_FLOAT_DIV, '/'),
+    '(': (K_LPARENT, '('),
+    ')': (K_RPARENT, ')'),
+    '.': (K_DOT, DOT),
+    ';': (K_SEMI, SEMI),
+    '{': (K_LCBRACE, LCBRACE),
+    '}': (K_RCBRACE, RCBRACE),
+    ':': (K_COLON, COLON),
+    ',': (K_COMMA, COMMA),
+    '!=': (K_NOT_EQUAL, NOT_EQUAL),
+    '>=': (K_GREATER_THAN_OR_EQUAL, GREATER_THAN_OR_EQUAL),
+    '<=': (K_LESS_THAN_OR_EQUAL, LESS_THAN_OR_EQUAL),
+    '>': (K_GREATER_THAN, GREATER_THAN),
+    '<': (K_LESS_THAN, LESS_THAN),
+    '==': (K_IS_EQUAL, IS_EQUAL),
+    '=': (K_ASSIGN, ASSIGN),
+    '!': (K_NOT, NOT),
+}
+
+# number of characters read at once by StreamLexer
+DEFAULT_CHUNK_SIZE = 1 << 16
+
+# case-sensitive operator words, matched as whole words only
+WORD_OPERATORS = {
+    'or': (K_OR, OR),
+    'and': (K_AND, AND),
+    'if': (K_IF, IF),
+    'elif': (K_ELIF, ELIF),
+    'else': (K_ELSE, ELSE),
+}
 
 
 class Lexer(object):
-    def __init__(self, text):
+    def __init__(self, text, source_index=None):
         self.pos = 0
         self.text = text
-        self.lineno = 1
-        self.column = 1
+        # offset of text[0] in the source
+        self.offset = 0
+        # line and column of a position are only worked out when reported
+        self.source_index = source_index if source_index is not None else SourceIndex(text)
         self._saved_states = list()
+        # spelling -> (token kind, token value); identifiers with the same
+        # spelling share one value string and are classified only once
+        self.words = dict()
         self.current_token = None
         self.get_next_token()
 
     def error(self, message):
         s = f'Lexer error on {self.get_current_character()};' \
-            f' line: {self.lineno};' \
-            f' column: {self.column} ' \
             f' message: {message}'
 
-        raise LexerError(ErrorCode, s)
+        raise LexerError(ErrorCode.LEXER_ERROR, s, self.get_position(), self.source_index)
 
     def save_current_state(self):
         self._saved_states.append({
             "pos": self.pos,
-            "lineno": self.lineno,
-            "column": self.column,
             "current_token": self.current_token,
         })
 
@@ -48,23 +110,35 @@ class Lexer(object):
         return pos >= len(self.text)
 
     def get_position(self):
-        return self.pos
+        return self.offset + self.pos
 
     def get_current_token(self) -> Token:
         return self.current_token
 
     def peek_next_token(self):
-        cur_pos = self.pos
-        current_token = self.get_current_token()
+        self.save_current_state()
         next_token = self.get_next_token()
-        self.pos = cur_pos
-        self.current_token = current_token
+        self.use_saved_state()
         return next_token
 
+    def seek(self, pos):
+        # continue lexing from a known token boundary
+        self.pos = pos
+        self.get_next_token()
+
     def go_forward(self):
         # this will match next token and save it in current_token variable
         self.get_next_token()
 
+    def tokens(self):
+        # lazily yields tokens, starting from the current one and ending with EOF
+        while True:
+            token = self.get_current_token()
+            yield token
+            if token.kind == K_EOF:
+                return
+            self.go_forward()
+
     def get_character(self, pos):
         if pos == len(self.text):
             return None
@@ -75,250 +149,148 @@ class Lexer(object):
     def get_current_character(self) -> str:
         return self.get_character(self.pos)
 
-    def next_characters_are(self, chars):
-        self.save_current_state()
-
-        for char in chars:
-            cur = self.get_character(self.pos)
-            if cur != char:
-                self.use_saved_state()
-                return False
-            self.advance()
-        self.use_saved_state()
-        return True
+    def skip(self):
+        # skip whitespaces and comments
+        match = SKIP_PATTERN.match(self.text, self.pos)
+        if match is not None:
+            self.pos = match.end()
 
     @staticmethod
-    def is_digit(num):
-        if isinstance(num, str):
-            return num.isdigit()
-        return False
+    def classify_word(value):
+        word = WORD_OPERATORS.get(value)
+        if word is not None:
+            return word
 
-    def is_not_digit(self, s):
-        return self.is_digit(s) is False
+        token = RESERVED_WORDS.get(value.lower())
+        if token is not None:
+            return token.kind, token.value
 
-    @staticmethod
-    def is_operator(p):
-        return p in "+-*/()"
-
-    def get_char_type(self, p):
-        types = {
-            "+": PLUS,
-            "-": MINUS,
-            "*": MULT,
-            "/": FLOAT_DIV,
-            "(": LPARENT,
-            ")": RPARENT
-        }
-
-        element_type = types.get(p, None)
-        if element_type is None:
-            self.error("Unsupported character " + p)
-
-        return element_type
-
-    def advance(self, num_of_chars=1):
-        for _ in range(num_of_chars):
-            if self.get_current_character() == '\n':
-                self.lineno += 1
-                self.column = 1
-            else:
-                self.column += 1
-
-            self.pos = self.pos + 1
-
-    def peek(self):
-        if self.is_pointer_out_of_text(self.get_position() + 1):
-            return None
-        return self.get_character(self.get_position() + 1)
+        return K_ID, value
 
-    @staticmethod
-    def get_reserved_keyword_token(token_type):
-        return RESERVED_KEYWORDS.get(token_type)
-
-    def _id(self):
-        result = ""
-        while self.get_current_character() is not None and self.get_current_character().isalnum():
-            result += self.get_current_character()
-            self.advance()
-
-        if result.upper() in RESERVED_KEYWORDS:
-            result = result.upper()
-            return self.get_reserved_keyword_token(result)
-        elif result.lower() in RESERVED_KEYWORDS:
-            result = result.lower()
-            return self.get_reserved_keyword_token(result)
-
-        return Token(ID, result)
-
-    def _string(self):
-        cur_char = self.get_current_character()
-        string = ""
-        self.advance()
-        while self.get_current_character() != cur_char:
-            string += self.get_current_character()
-            self.advance()
-        self.advance()
-        return Token(STRING, string)
-
-    def _number(self):
-        cur_char = self.get_current_character()
-        while True:
-            self.advance()
-            char = self.get_current_character()
-            if self.is_digit(char) or char == '.':
-                cur_char += char
-            else:
-                break
+    def word(self, value, pos) -> Token:
+        word = self.words.get(value)
+        if word is None:
+            word = self.words[value] = self.classify_word(value)
+        return Token(word[0], word[1], pos)
 
-        cnt = cur_char.count('.')
+    def number(self, value, pos) -> Token:
+        cnt = value.count('.')
         if cnt > 1:
-            self.error('incorrect number ' + cur_char)
+            self.error('incorrect number ' + value)
 
         if cnt == 0:
-            num = int(cur_char)
-            return Token(INTEGER, num)
-        else:
-            num = float(cur_char)
-            return Token(FLOAT, num)
+            return Token(K_INTEGER, int(value), pos)
+        return Token(K_FLOAT, float(value), pos)
 
-    def skip_comment(self):
-        while self.get_current_character() != "}":
-            self.advance()
+    @staticmethod
+    def string(value, pos) -> Token:
+        return Token(K_STRING, value[1:-1], pos)
 
-        # skip '}'
-        cur_char = self.get_current_character()
-        self.advance()
+    def get_next_token(self) -> Token:
+        self.skip()
+
+        match = MASTER_PATTERN.match(self.text, self.pos)
+        if match is None:
+            cur_char = self.get_current_character()
+            if cur_char is None:
+                self.current_token = Token(K_EOF, EOF, self.offset + self.pos)
+                return self.current_token
+            if cur_char in ("'", '"'):
+                self.error('unterminated string')
+            self.error('syntax error "' + cur_char + '" is not valid character')
 
-        # peek next character
-        next_char = self.get_current_character()
+        group = match.lastgroup
+        value = match.group()
+        # tokens store their offset in the source only
+        pos = self.offset + self.pos
+        self.pos = match.end()
+
+        if group == 'WORD':
+            self.current_token = self.word(value, pos)
+        elif group == 'OPERATOR':
+            kind, value = OPERATORS[value]
+            self.current_token = Token(kind, value, pos)
+        elif group == 'NUMBER':
+            self.current_token = self.number(value, pos)
+        elif group == 'STRING':
+            self.current_token = self.string(value, pos)
+        else:
+            # complete comments are consumed by skip(), so this one is not closed
+            self.pos = match.start()
+            self.error("Expected '}}' for comment")
 
-        # commend should end with '}}'
-        if cur_char != next_char or cur_char != "}":
-            return self.error("Expected ']}' for comment, got {}".format(cur_char + next_char))
+        return self.current_token
 
-        self.advance()
 
-    def skip_one_line_comment(self):
-        while self.get_current_character() != "\n":
-            self.advance()
-        self.advance()
+class StreamLexer(Lexer):
+    """
+    Lexer which reads its input from a file object or a mmap in chunks.
+
+    Only a window of the source is kept in `text`; consumed characters are
+    dropped once no state is saved, so memory is bounded by the chunk size
+    (and the longest token) instead of the file size; only the offsets of
+    line starts, one machine word per line, are kept for error messages.
+    A token touching the end of the window may continue in the next chunk
+    (identifiers, strings, {{ }} comments, '<' vs '<='), so it is matched
+    again after reading more.
+    """
+
+    def __init__(self, source, chunk_size=DEFAULT_CHUNK_SIZE):
+        self.source = source
+        self.chunk_size = chunk_size
+        self.exhausted = False
+        self._decoder = codecs.getincrementaldecoder('utf-8')()
+        super().__init__('')
+
+    def read_chunk(self):
+        data = self.source.read(self.chunk_size)
+        while isinstance(data, bytes):
+            # mmap and binary files; a chunk may end inside a multibyte character
+            text = self._decoder.decode(data, final=not data)
+            if text or not data:
+                data = text
+                break
+            data = self.source.read(self.chunk_size)
+        if not data:
+            self.exhausted = True
+        return data
+
+    def fill(self):
+        chunk = self.read_chunk()
+        # the index keeps the line starts of the chunks dropped from text
+        self.source_index.extend(chunk)
+        self.text += chunk
+
+    def discard_consumed(self):
+        # positions stored in saved states must stay valid
+        if self._saved_states or self.pos < self.chunk_size:
+            return
+
+        self.text = self.text[self.pos:]
+        self.offset += self.pos
+        self.pos = 0
+
+    def is_pointer_out_of_text(self, pos=None):
+        if pos is None:
+            pos = self.pos
+
+        return self.exhausted and pos >= len(self.text)
 
     def get_next_token(self) -> Token:
-        cur_char = self.get_current_character()
-        if cur_char is None:
-            self.current_token = Token(EOF, EOF)
-            return self.current_token
-        if self.is_digit(cur_char):
-            # NUMBER
-            self.current_token = self._number()
-            return self.current_token
-        elif cur_char in ("'", '"'):
-            # STRING
-            self.current_token = self._string()
-            return self.current_token
-        elif self.next_characters_are("//"):
-            # one line comment
-            self.skip_one_line_comment()
-            return self.get_next_token()
-        elif self.next_characters_are("or"):
-            self.advance(2)
-            self.current_token = Token(OR, OR)
-            return self.current_token
-        elif self.next_characters_are("and"):
-            self.advance(3)
-            self.current_token = Token(AND, AND)
-            return self.current_token
-        elif self.next_characters_are("if"):
-            self.advance(2)
-            self.current_token = Token(IF, IF)
-            return self.current_token
-        elif self.next_characters_are("elif"):
-            self.advance(4)
-            self.current_token = Token(ELIF, ELIF)
-            return self.current_token
-        elif self.next_characters_are("else"):
-            self.advance(4)
-            self.current_token = Token(ELSE, ELSE)
-            return self.current_token
-        elif cur_char.isalpha():
-            # ID
-            self.current_token = self._id()
-            return self.current_token
-        elif self.is_operator(cur_char):
-            # OPERATOR (+-*/())
-            self.advance()
-            self.current_token = Token(self.get_char_type(cur_char), cur_char)
-            return self.current_token
-        elif cur_char == '.':
-            # DOT
-            self.advance()
-            self.current_token = Token(DOT, DOT)
-            return self.current_token
-        elif cur_char == ';':
-            # SEMI
-            self.advance()
-            self.current_token = Token(SEMI, SEMI)
-            return self.current_token
-        elif self.next_characters_are("{{"):
-            self.skip_comment()
-            return self.get_next_token()
-        elif cur_char == "{":
-            self.advance()
-            self.current_token = Token(LCBRACE, LCBRACE)
-            return self.current_token
-        elif cur_char == "}":
-            self.advance()
-            self.current_token = Token(RCBRACE, RCBRACE)
-            return self.current_token
-        elif cur_char == ":":
-            self.advance()
-            self.current_token = Token(COLON, COLON)
-            return self.current_token
-        elif cur_char == ',':
-            self.advance()
-            self.current_token = Token(COMMA, COMMA)
-            return self.current_token
-        elif cur_char == '.':
-            self.advance()
-            self.current_token = Token(DOT, DOT)
-            return self.current_token
-        elif self.next_characters_are("!="):
-            self.advance(2)
-            self.current_token = Token(NOT_EQUAL, NOT_EQUAL)
-            return self.current_token
-        elif self.next_characters_are(">="):
-            self.advance(2)
-            self.current_token = Token(GREATER_THAN_OR_EQUAL, GREATER_THAN_OR_EQUAL)
-            return self.current_token
-        elif self.next_characters_are("<="):
-            self.advance(2)
-            self.current_token = Token(LESS_THAN_OR_EQUAL, LESS_THAN_OR_EQUAL)
-            return self.current_token
-        elif cur_char == ">":
-            self.advance()
-            self.current_token = Token(GREATER_THAN, GREATER_THAN)
-            return self.current_token
-        elif cur_char == "<":
-            self.advance()
-            self.current_token = Token(LESS_THAN, LESS_THAN)
-            return self.current_token
-        elif self.next_characters_are('=='):
-            self.advance(2)
-            self.current_token = Token(IS_EQUAL, IS_EQUAL)
-            return self.current_token
-        elif cur_char == "=":
-            # ASSIGNMENT
-            self.advance()
-            self.current_token = Token(ASSIGN, ASSIGN)
-            return self.current_token
-        elif cur_char == "!":
-            self.advance()
-            self.current_token = Token(NOT, NOT)
-            return self.current_token
-        else:
-            if cur_char.isspace():
-                while self.get_current_character() is not None and self.get_current_character().isspace():
-                    self.advance()
-                return self.get_next_token()
-            self.error('syntax error "' + cur_char + '" is not valid character')
-        self.error('unrecognized character ' + cur_char)
+        self.discard_consumed()
+
+        while not self.exhausted:
+            pos, current_token = self.pos, self.current_token
+            try:
+                super().get_next_token()
+                if self.pos < len(self.text):
+                    return self.current_token
+            except LexerError:
+                # only strings and comments can be cut in a way that fails to match
+                if self.get_current_character() not in ('"', "'", '{'):
+                    raise
+
+            self.pos, self.current_token = pos, current_token
+            self.fill()
+
+        return super().get_next_token()
@@ -0,0 +1,200 @@
+from utils.constants import K_ID, K_PLUS, K_MINUS, K_MULT
+from utils.data_classes import *
+from compiler.walker import StatementWalker, ProgramWalker, map_operands
+
+# expressions worth keeping in a slot instead of evaluating them again
+COMPUTED = (BinOp, UnaryOp, StrOp, NotOp, BoolOp, Inlined)
+CONSTANTS = (Num, Str, BooleanSymbol, Hoisted)
+
+
+class LoopWrites(StatementWalker):
+    """
+    Variables written by the statements of a loop, as (depth, slot) pairs,
+    and whether they call functions of the program, which can write any
+    variable they see.
+    """
+
+    def __init__(self, depth):
+        super().__init__(depth)
+        self.writes = set()
+        self.calls = False
+
+    def expression(self, node):
+        if isinstance(node, FunctionCall) and node.slot is not None:
+            self.calls = True
+        elif isinstance(node, Inlined):
+            # arguments of an inlined function are kept in slots of the frame
+            for slot in node.slots:
+                self.write(self.depth, slot)
+            self.expression(node.expr)
+        return map_operands(node, self.expression)
+
+    def write(self, depth, slot):
+        self.writes.add((depth, slot))
+
+
+class Hoister(StatementWalker):
+    """
+    Replaces the expressions of a loop that read no variable the loop writes
+    by Hoisted nodes, and the products of its induction variable and an
+    integer by variables the loop updates by addition.
+    """
+
+    def __init__(self, optimizer, writes, induction=None):
+        super().__init__(optimizer.depth)
+        self.optimizer = optimizer
+        self.writes = writes
+        # (variable, step) of an integer loop variable changed only by 'then'
+        self.induction = induction
+        # factor -> (Var, step) of the derived induction variables
+        self.derived = {}
+
+    def expression(self, node):
+        node, invariant = self.hoist(node)
+        return self.keep(node) if invariant else node
+
+    def visit_Inlined(self, node: Inlined):
+        # a call statement, whose value nothing uses: only its operands are kept
+        return self.hoist(node)[0]
+
+    def keep(self, node):
+        if isinstance(node, COMPUTED):
+            return Hoisted(node, self.optimizer.allocate())
+        return node
+
+    def hoist(self, node):
+        # returns node with its invariant subexpressions hoisted, and whether
+        # the whole node is invariant
+        if isinstance(node, CONSTANTS):
+            return node, True
+        if isinstance(node, Var):
+            return node, (node.depth, node.slot) not in self.writes
+
+        if isinstance(node, BinOp):
+            derived = self.derive(node)
+            if derived is not None:
+                return derived, False
+        if isinstance(node, (BinOp, StrOp, BoolOp)):
+            node.left, left = self.hoist(node.left)
+            node.right, right = self.hoist(node.right)
+            if left and right:
+                return node, True
+            if left:
+                node.left = self.keep(node.left)
+            if right:
+                node.right = self.keep(node.right)
+            return node, False
+        if isinstance(node, (UnaryOp, NotOp)):
+            node.expr, invariant = self.hoist(node.expr)
+            return node, invariant
+        if isinstance(node, Inlined):
+            return node, self.hoist_inlined(node)
+        if isinstance(node, FunctionCall):
+            map_operands(node, self.expression)
+        return node, False
+
+    def hoist_inlined(self, node: Inlined):
+        # the call is invariant when its arguments and the variables its
+        # expression reads besides the parameters are
+        arguments = [self.hoist(param) for param in node.call.actual_params]
+        node.call.actual_params = [param for param, _ in arguments]
+        parameters = {(self.depth, slot) for slot in node.slots}
+        if all(invariant for _, invariant in arguments):
+            writes = self.writes
+            self.writes = writes - parameters
+            node.expr, invariant = self.hoist(node.expr)
+            self.writes = writes
+            if invariant:
+                return True
+        else:
+            node.expr = self.expression(node.expr)
+        node.call.actual_params = [self.keep(param) if invariant else param for param, invariant in arguments]
+        return False
+
+    def derive(self, node: BinOp):
+        # i * c or c * i, where i is the induction variable and c an integer
+        if self.induction is None or node.op != K_MULT:
+            return None
+        var, step = self.induction
+        for left, right in ((node.left, node.right), (node.right, node.left)):
+            if isinstance(left, Var) and (left.depth, left.slot) == (var.depth, var.slot) and is_integer(right):
+                factor = right.value
+                if factor not in self.derived:
+                    derived = Var(Token(K_ID, f'{var.value} * {factor}', node.pos))
+                    derived.depth, derived.slot = self.depth, self.optimizer.allocate()
+                    self.derived[factor] = derived, step * factor
+                return self.derived[factor][0]
+        return None
+
+
+def is_integer(node):
+    return isinstance(node, Num) and type(node.value) is int
+
+
+def induction_step(node: ForLoop):
+    """
+    Step of a loop whose variable starts at an integer and changes only by
+    'i = i + n' or 'i = i - n' in 'then'; None for other loops. Products of
+    such a variable and an integer are exact when updated by addition.
+    """
+    base, then = node.base, node.then
+    if not is_integer(base.right) or not isinstance(then, Assign):
+        return None
+    var, value = then.left, then.right
+    if (var.depth, var.slot) != (base.left.depth, base.left.slot) or not isinstance(value, BinOp):
+        return None
+
+    def is_var(operand):
+        return isinstance(operand, Var) and (operand.depth, operand.slot) == (var.depth, var.slot)
+
+    if value.op == K_PLUS and is_var(value.left) and is_integer(value.right):
+        return value.right.value
+    if value.op == K_PLUS and is_var(value.right) and is_integer(value.left):
+        return value.left.value
+    if value.op == K_MINUS and is_var(value.left) and is_integer(value.right):
+        return -value.right.value
+    return None
+
+
+class LoopOptimizer(ProgramWalker):
+    """
+    Hoists the invariant expressions of for loops and reduces products of
+    their induction variables to additions. Runs after the Optimizer has
+    folded constants, on trees resolved to frame slots.
+
+    A Hoisted expression is evaluated where it is first reached in a run of
+    its loop, so it fails exactly when and where the original expression
+    would; later iterations read the value from its slot. Loops calling
+    functions of the program are left alone, as any variable may change
+    during a call.
+    """
+
+    def visit_ForLoop(self, node: ForLoop):
+        body = LoopWrites(self.depth)
+        body.expression(node.bool_expr)
+        body.visit(node.block)
+        then = LoopWrites(self.depth)
+        then.visit(node.then)
+
+        if not body.calls and not then.calls:
+            var = node.base.left
+            writes = body.writes | then.writes | {(var.depth, var.slot)}
+            step = None
+            if (var.depth, var.slot) not in body.writes:
+                step = induction_step(node)
+            hoister = Hoister(self, writes, None if step is None else (var, step))
+
+            start = self.function.frame_size
+            node.bool_expr = hoister.expression(node.bool_expr)
+            node.block = hoister.visit(node.block)
+            node.then = hoister.visit(node.then)
+            node.invariants = range(start, self.function.frame_size)
+            node.inductions = tuple(
+                (derived.slot, factor, derived_step) for factor, (derived, derived_step) in hoister.derived.items())
+
+        # loops nested in this one
+        node.block = self.visit(node.block)
+        return node
+
+    def optimize(self):
+        return self.visit(self.tree)
@@ -2,46 +2,107 @@ import os.path
 from os.path import exists
 from pprint import pprint
 
+from compiler.cache import CompileCache
+from compiler.closure_compiler import ClosureCompiler
 from compiler.interpreter import Interpreter
+from compiler.memo import MEMO_SIZE
+from compiler.optimizer import Optimizer, O0, INLINE_SIZE
 from compiler.parser import Parser
 from compiler.semantic_analyzer import SemanticAnalyzer
+from compiler.stackless import StacklessInterpreter, STACK_SIZE
+from compiler.transpiler import PythonTranspiler
+from compiler.vm import VirtualMachine
 from utils.errors import *
 
 
+# engines a tree can be run with, and the options of Dy.interpret each one
+# takes after the tree and memo_size
+ENGINES = {
+    'interpreter': (Interpreter, ()),
+    'closures': (ClosureCompiler, ()),
+    'bytecode': (VirtualMachine, ()),
+    'python': (PythonTranspiler, ()),
+    'stackless': (StacklessInterpreter, ('stack_size',)),
+}
+
+
 # Dy -> Dynamic Language
 class Dy:
     @staticmethod
-    def compile(code: str):
+    def compile(code, optimize=O0, inline_size=INLINE_SIZE, engine='interpreter', memo_size=MEMO_SIZE,
+                stack_size=STACK_SIZE):
+        # optimize is the optimization level, like python's -O; inline_size
+        # the largest function body inlined from O2 on, 0 to inline none;
+        # engine one of ENGINES; memo_size the number of results kept per
+        # pure function, 0 to keep none; stack_size the entries the stacks
+        # of the stackless engine may hold
         try:
-            # lexer = Lexer(string)
-            # while lexer.get_current_token().type is not EOF:
-            #     print(lexer.get_current_token())
-            #     lexer.go_forward()
-
-            parser = Parser(code)
-            tree = parser.parse()
-            # print(tree)
-
-            # check for errors
-            semantic_analyzer = SemanticAnalyzer(tree)
-            semantic_analyzer.analyze()
-
-            # interpret language
-            interpreter = Interpreter(tree)
-            interpreter.interpret()
-            # print(interpreter.get_recursion_count())
+            tree = Dy.analyze(code, optimize, inline_size)
+            Dy.interpret(tree, engine, memo_size, stack_size)
         except (ParserError, SemanticError, LexerError) as ex:
             print(ex)
         except Exception as e:
             print(e)
 
     @staticmethod
-    def compile_file(path: str):
-        code = Dy.read_file(path)
-        Dy.compile(code)
+    def analyze(code, optimize=O0, inline_size=INLINE_SIZE):
+        # lexer = Lexer(string)
+        # while lexer.get_current_token().type is not EOF:
+        #     print(lexer.get_current_token())
+        #     lexer.go_forward()
+
+        parser = Parser(code)
+        tree = parser.parse()
+        # print(tree)
+
+        # check for errors
+        semantic_analyzer = SemanticAnalyzer(tree)
+        semantic_analyzer.analyze()
+
+        return Optimizer(tree, optimize, inline_size).optimize()
 
     @staticmethod
-    def read_file(path: str):
+    def interpret(tree, engine='interpreter', memo_size=MEMO_SIZE, stack_size=STACK_SIZE):
+        # returns the engine, whose memos count the cache hits and misses
+        engine_class, option_names = ENGINES[engine]
+        options = {'stack_size': stack_size}
+        interpreter = engine_class(tree, memo_size, **{name: options[name] for name in option_names})
+        interpreter.interpret()
+        return interpreter
+
+    @staticmethod
+    def compile_file(path: str, use_cache=True, optimize=O0, inline_size=INLINE_SIZE, engine='interpreter',
+                     memo_size=MEMO_SIZE, stack_size=STACK_SIZE):
+        file_path = Dy.get_file_path(path)
+        try:
+            tree = Dy.load_file(file_path, use_cache, optimize, inline_size)
+            Dy.interpret(tree, engine, memo_size, stack_size)
+        except (ParserError, SemanticError, LexerError) as ex:
+            print(ex)
+        except Exception as e:
+            print(e)
+
+    @staticmethod
+    def load_file(file_path: str, use_cache=True, optimize=O0, inline_size=INLINE_SIZE):
+        # analyzed tree of an unchanged file comes from __dycache__
+        cache = key = None
+        if use_cache:
+            cache = CompileCache.for_source(file_path)
+            key = cache.key(file_path, {'optimize': optimize, 'inline_size': inline_size})
+            tree = cache.load(key)
+            if tree is not None:
+                return tree
+
+        # source is streamed to the lexer in chunks instead of being read at once
+        with open(file_path, 'r') as f:
+            tree = Dy.analyze(f, optimize, inline_size)
+
+        if cache is not None:
+            cache.store(key, tree)
+        return tree
+
+    @staticmethod
+    def get_file_path(path: str):
         # provided path should not include extension
         path = "{}.dy".format(path)
         if not path.startswith('src/'):
@@ -50,8 +111,16 @@ class Dy:
         if not exists(path):
             raise FileNotFoundError(path + " does not exist")
 
+        return path
+
+    @staticmethod
+    def open_file(path: str):
+        return open(Dy.get_file_path(path), 'r')
+
+    @staticmethod
+    def read_file(path: str):
         content = ""
-        with open(path, 'r') as f:
+        with Dy.open_file(path) as f:
             content = f.read()
 
         return content
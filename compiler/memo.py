@@ -0,0 +1,94 @@
+from collections import OrderedDict, namedtuple
+from functools import lru_cache
+
+from utils.data_classes import FunctionDecl
+
+# results kept per pure function, as passed to Dy; 0 disables memoization
+MEMO_SIZE = 1024
+
+CacheInfo = namedtuple('CacheInfo', ['hits', 'misses', 'maxsize', 'currsize'])
+# result of Table.get for arguments not in the table
+MISSING = object()
+
+
+class Table:
+    """
+    Least recently used results of one function, for the engines that do
+    not run a call as one python call (see stackless): they look the
+    arguments up before the call and add the result when it returns.
+    Keys are typed and counted like the ones of an lru_cache.
+    """
+
+    __slots__ = ('results', 'maxsize', 'hits', 'misses')
+
+    def __init__(self, maxsize):
+        self.results = OrderedDict()
+        self.maxsize = maxsize
+        self.hits = self.misses = 0
+
+    @staticmethod
+    def key(arguments):
+        return (*arguments, *map(type, arguments))
+
+    def get(self, key):
+        value = self.results.get(key, MISSING)
+        if value is MISSING:
+            self.misses += 1
+        else:
+            self.hits += 1
+            self.results.move_to_end(key)
+        return value
+
+    def put(self, key, value):
+        results = self.results
+        results[key] = value
+        if len(results) > self.maxsize:
+            results.popitem(last=False)
+
+    def cache_info(self):
+        return CacheInfo(self.hits, self.misses, self.maxsize, len(self.results))
+
+    def cache_clear(self):
+        self.results.clear()
+        self.hits = self.misses = 0
+
+
+class Memos:
+    """
+    Results of the calls of the pure functions of a program (see purity),
+    in one least recently used cache per function.
+
+    A cache is an lru_cache around a callable that runs the function with
+    the given arguments. Arguments of different types are different keys,
+    so 1 and 1.0 are not mixed up, and calls that fail are not kept.
+    """
+
+    def __init__(self, size=MEMO_SIZE):
+        self.size = size
+        # FunctionDecl -> cached callable, or Table
+        self.caches = {}
+
+    def get(self, function: FunctionDecl):
+        # the cached callable of function, or None before add
+        return self.caches.get(function)
+
+    def add(self, function: FunctionDecl, run):
+        # run(*arguments) runs function; returns it memoized
+        cache = self.caches[function] = lru_cache(self.size, typed=True)(run)
+        return cache
+
+    def table(self, function: FunctionDecl):
+        # the Table of function, made on first use
+        table = self.caches.get(function)
+        if table is None:
+            table = self.caches[function] = Table(self.size)
+        return table
+
+    def info(self):
+        # hits, misses, maxsize and currsize of the cache of every function
+        # called so far, by name
+        return {function.name: cache.cache_info() for function, cache in self.caches.items()}
+
+    def clear(self):
+        for cache in self.caches.values():
+            cache.cache_clear()
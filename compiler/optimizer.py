@@ -0,0 +1,195 @@
+from compiler.interpreter import Interpreter
+from compiler.inliner import Inliner, INLINE_SIZE
+from compiler.loop_optimizer import LoopOptimizer
+from utils.constants import K_INTEGER, K_FLOAT, K_STRING
+from utils.data_classes import *
+
+# optimization levels, as passed to Dy.compile
+O0 = 0  # run the tree as analyzed
+O1 = 1  # fold constants, drop dead branches and unreachable statements
+O2 = 2  # and inline small functions and optimize loops
+
+LITERALS = (Num, Str, BooleanSymbol)
+
+
+def number_literal(value):
+    return Num(Token(K_FLOAT if isinstance(value, float) else K_INTEGER, value))
+
+
+def string_literal(value):
+    return Str(Token(K_STRING, value))
+
+
+class Optimizer(NodeVisitor):
+    """
+    Simplifies a tree checked by the SemanticAnalyzer before it is run.
+
+    Visiting a node returns the node that replaces it. Expressions whose
+    operands are all literals are folded into a literal by evaluating them
+    with the interpreter, so that they have exactly the value they would
+    have at runtime; the ones that fail (e.g. a division by zero) are kept
+    and fail at runtime as before.
+    """
+
+    def __init__(self, tree, level=O1, inline_size=INLINE_SIZE):
+        self.tree = tree
+        self.level = level
+        self.inline_size = inline_size
+        self.evaluator = Interpreter(None)
+
+    def fold(self, node, literal):
+        # literal of the value of node, or node itself if evaluating it fails
+        try:
+            value = self.evaluator.visit(node)
+        except Exception:
+            return node
+        return literal(value)
+
+    def visit_BinOp(self, node: BinOp):
+        node.left = self.visit(node.left)
+        node.right = self.visit(node.right)
+        if isinstance(node.left, Num) and isinstance(node.right, Num):
+            return self.fold(node, number_literal)
+        return node
+
+    def visit_UnaryOp(self, node: UnaryOp):
+        node.expr = self.visit(node.expr)
+        if isinstance(node.expr, Num):
+            return self.fold(node, number_literal)
+        return node
+
+    @staticmethod
+    def visit_Num(node: Num):
+        return node
+
+    @staticmethod
+    def visit_Str(node: Str):
+        return node
+
+    def visit_StrOp(self, node: StrOp):
+        node.left = self.visit(node.left)
+        node.right = self.visit(node.right)
+        if isinstance(node.left, Str) and isinstance(node.right, Str):
+            return self.fold(node, string_literal)
+        return node
+
+    def visit_Compound(self, node: Compound):
+        children = []
+        for child in node.get_children():
+            child = self.visit(child)
+            if isinstance(child, NoOp):
+                continue
+            children.append(child)
+            if isinstance(child, (ReturnStat, Break)):
+                # the rest of the block is never run
+                break
+        node.children = children
+        return node
+
+    def visit_Assign(self, node: Assign):
+        node.right = self.visit(node.right)
+        return node
+
+    @staticmethod
+    def visit_Var(node: Var):
+        return node
+
+    @staticmethod
+    def visit_NoOp(node):
+        return node
+
+    def visit_Program(self, node: Program):
+        node.block = self.visit(node.block)
+        return node
+
+    def visit_Block(self, node: Block):
+        node.var_decs = [self.visit(declaration) for declaration in node.var_decs]
+        node.compound_statement = self.visit(node.compound_statement)
+        return node
+
+    def visit_VarDecs(self, node: VarDecs):
+        node.value = self.visit(node.value)
+        return node
+
+    def visit_FunctionDecl(self, node: FunctionDecl):
+        node.block = self.visit(node.block)
+        return node
+
+    def visit_FunctionCall(self, node: FunctionCall):
+        node.actual_params = [self.visit(param) for param in node.actual_params]
+        return node
+
+    @staticmethod
+    def visit_BooleanSymbol(node: BooleanSymbol):
+        return node
+
+    def visit_NotOp(self, node: NotOp):
+        node.expr = self.visit(node.expr)
+        if isinstance(node.expr, LITERALS):
+            return self.fold(node, BooleanSymbol)
+        return node
+
+    def visit_BoolOp(self, node: BoolOp):
+        # every comparison and logical operator
+        node.left = self.visit(node.left)
+        node.right = self.visit(node.right)
+        if isinstance(node.left, LITERALS) and isinstance(node.right, LITERALS):
+            return self.fold(node, BooleanSymbol)
+        return node
+
+    visit_BoolNotEqual = visit_BoolOr = visit_BoolAnd = visit_BoolOp
+    visit_BoolGreaterThan = visit_BoolGreaterThanOrEqual = visit_BoolOp
+    visit_BoolLessThan = visit_BoolLessThanOrEqual = visit_BoolIsEqual = visit_BoolOp
+
+    def visit_IfBlock(self, node: IfBlock):
+        node.expr = self.visit(node.expr)
+        node.block = self.visit(node.block)
+        return node
+
+    def visit_IfStat(self, node: IfStat):
+        if_blocks = []
+        for if_block in node.if_blocks:
+            if_block = self.visit(if_block)
+            if not isinstance(if_block.expr, LITERALS):
+                if_blocks.append(if_block)
+            elif if_block.expr.value is True:
+                # always taken: the blocks after it and the else block are not
+                if_blocks.append(if_block)
+                node.if_blocks = if_blocks
+                node.else_block = None
+                return node
+            # blocks whose condition is never true are dropped
+
+        node.if_blocks = if_blocks
+        if node.else_block is not None:
+            node.else_block = self.visit(node.else_block)
+        if not if_blocks and node.else_block is None:
+            return NoOp()
+        return node
+
+    def visit_ForLoop(self, node: ForLoop):
+        node.base.right = self.visit(node.base.right)
+        node.bool_expr = self.visit(node.bool_expr)
+        node.then = self.visit(node.then)
+        node.block = self.visit(node.block)
+        return node
+
+    @staticmethod
+    def visit_Break(node: Break):
+        return node
+
+    @staticmethod
+    def visit_NoneType(node):
+        return node
+
+    def visit_ReturnStat(self, node: ReturnStat):
+        node.base_expr = self.visit(node.base_expr)
+        return node
+
+    def optimize(self):
+        if self.level > O0:
+            self.tree = self.visit(self.tree)
+        if self.level >= O2:
+            self.tree = Inliner(self.tree, self.inline_size).optimize()
+            self.tree = LoopOptimizer(self.tree).optimize()
+        return self.tree
@@ -1,8 +1,48 @@
-from compiler.lexer import Lexer
+from compiler.lexer import Lexer, StreamLexer
+from compiler.token_buffer import TokenBuffer
 from utils.constants import *
 from utils.data_classes import *
 from utils.errors import ParserError, ErrorCode
 
+# binding power of binary operators; OR and AND share one level
+BINARY_PRECEDENCE = {
+    K_OR: 1,
+    K_AND: 1,
+    K_GREATER_THAN: 2,
+    K_GREATER_THAN_OR_EQUAL: 2,
+    K_LESS_THAN: 2,
+    K_LESS_THAN_OR_EQUAL: 2,
+    K_NOT_EQUAL: 2,
+    K_IS_EQUAL: 2,
+    K_PLUS: 3,
+    K_MINUS: 3,
+    K_MULT: 4,
+    K_FLOAT_DIV: 4,
+    K_INTEGER_DIV: 4,
+}
+
+# operand of NOT is a comparison, operand of unary PLUS/MINUS a single factor:
+# a prefix operator takes the binary operators binding tighter than this
+PREFIX_PRECEDENCE = {
+    K_NOT: 1,
+    K_PLUS: 4,
+    K_MINUS: 4,
+}
+
+# kinds of entries on the operator stack of base_expr
+PREFIX, BINARY, PARENTHESIS = range(3)
+
+BOOL_NODES = {
+    K_OR: BoolOr,
+    K_AND: BoolAnd,
+    K_GREATER_THAN: BoolGreaterThan,
+    K_GREATER_THAN_OR_EQUAL: BoolGreaterThanOrEqual,
+    K_LESS_THAN: BoolLessThan,
+    K_LESS_THAN_OR_EQUAL: BoolLessThanOrEqual,
+    K_NOT_EQUAL: BoolNotEqual,
+    K_IS_EQUAL: BoolIsEqual,
+}
+
 
 class Parser:
     """
@@ -26,86 +66,75 @@ class Parser:
     empty:
     return: RETURN base_expr
     assignment_statement: variable ASSIGN base_expr
-    base_expr: expr | str_expr | bool_expr
-    bool_expr: bool_term ((OR, AND) bool_term)*
-    bool_term: bool_factor ((>, >=, <, <=, !=, ==) bool_factor)*
-    bool_factor: NOT bool_term | LPARENT bool_expr RPARENT | TRUE | FALSE | ID | function_call
-    str_expr: STRING (PLUS (STRING|variable))*
-    expr: term ((PLUS, MINUS) term)*
-    term: factor ((DIV, MULT, FLOAT_DIV) factor)*
-    factor: PLUS factor | MINUS factor | INTEGER | REAL_INTEGER | LPARENT expr RPARENT | variable | function_call
+    base_expr: unary_expr (binary_operator unary_expr)*
+        parsed with explicit operand and operator stacks, not recursively;
+        later passes still recurse on the tree, see base_expr
+        binary operators by precedence, lowest first, all left associative:
+        (OR, AND) < (>, >=, <, <=, !=, ==) < (PLUS, MINUS) < (MULT, FLOAT_DIV, DIV)
+        PLUS with a string literal or concatenation on either side is a StrOp
+    unary_expr: (PLUS | MINUS) unary_expr | NOT base_expr_without_or_and | primary
+    primary: INTEGER | FLOAT | STRING | TRUE | FALSE | LPARENT base_expr RPARENT | function_call | variable
     variable: ID
     """
 
     def __init__(self, text):
-        self.lexer = Lexer(text)
+        # text is either the source code itself or a file object/mmap to stream it from
+        lexer = Lexer(text) if isinstance(text, str) else StreamLexer(text)
+        # tokens are lexed as the parser reaches them, and dropped behind it
+        self.tokens = TokenBuffer(lexer.tokens())
+        self.source_index = lexer.source_index
+        # nodes with a source position are collected while this is a list
+        self.positioned = None
+        # (token kind, value) -> literal node; literals are never modified,
+        # so equal ones share a single node
+        self.literals = dict()
+
+    @classmethod
+    def from_tokens(cls, tokens: TokenBuffer, source_index=None):
+        # parser over already tokenized source, e.g. to re-parse a part of it
+        parser = cls.__new__(cls)
+        parser.tokens = tokens
+        parser.source_index = source_index
+        parser.positioned = None
+        parser.literals = dict()
+        return parser
 
     @staticmethod
     def emtpy():
         return NoOp()
 
     def print_surrounding_tokens(self):
-        self.lexer.save_current_state()
         print("surrounding tokens")
         print("<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<")
         for i in range(5):
-            if self.lexer.get_current_token().type is not EOF:
-                print(self.lexer.get_current_token())
-                self.lexer.go_forward()
+            token = self.tokens.peek(i)
+            if token.kind != K_EOF:
+                print(token)
         print(">>>>>>>>>>>>>>>>>>>>>>>>>>>")
-        self.lexer.use_saved_state()
 
     def is_function_call(self):
-        return self.next_tokens_are(ID, LPARENT)
-
-    def is_assignment(self):
-        flag = self.next_tokens_are(ID, ASSIGN)
-        return flag
-
-    def is_declaration(self):
-        token = self.lexer.get_current_token()
-        return token.type in (VAR, FUNCTION)
-
-    def next_token_is(self, token_type):
-        return self.next_tokens_are(token_type)
-
-    def next_tokens_are(self, *args):
-        self.lexer.save_current_state()
-        state = True
-        for arg in args:
-            token = self.lexer.get_current_token()
-            if token.type is not arg:
-                state = False
-                break
-            self.lexer.go_forward()
-
-        self.lexer.use_saved_state()
-        return state
-
-    def match_next_tokens_to_any(self, *token_types):
-        self.lexer.save_current_state()
-        token = self.lexer.get_current_token()
-        while token.type is not SEMI and token.type is not LCBRACE and token.type is not EOF \
-                and (token.type is not EOF):
-            token = self.lexer.get_current_token()
-            if token.type in token_types:
-                self.lexer.use_saved_state()
-                return True
-            self.lexer.go_forward()
-        self.lexer.use_saved_state()
-        return False
+        return self.next_tokens_are(K_ID, K_LPARENT)
+
+    def next_token_is(self, kind):
+        return self.next_tokens_are(kind)
+
+    def next_tokens_are(self, *kinds):
+        for offset, kind in enumerate(kinds):
+            if self.tokens.peek(offset).kind != kind:
+                return False
+        return True
 
     def program(self):
-        self.match(PROGRAM)
+        self.match(K_PROGRAM)
         self.variable()
         block = self.block()
-        return Program(block)
+        return Program(block, self.source_index)
 
     def block(self):
-        self.match(LCBRACE)
+        self.match(K_LCBRACE)
         declarations = self.declarations()
         compound_statement = self.compound_statement()
-        self.match(RCBRACE)
+        self.match(K_RCBRACE)
         return Block(declarations, compound_statement)
 
     def function_block(self):
@@ -115,41 +144,48 @@ class Parser:
 
     def function_return_statement(self):
         returns = None
-        if self.next_tokens_are(RETURN):
-            self.match(RETURN)
+        if self.next_tokens_are(K_RETURN):
+            self.match(K_RETURN)
             returns = self.base_expr()
-            self.match(SEMI)
+            self.match(K_SEMI)
         returns = ReturnStat(returns)
         return returns
 
     def declarations(self) -> list:
         declarations = []
 
-        while self.lexer.get_current_token().type in (VAR, FUNCTION):
-            if self.lexer.get_current_token().type is VAR:
-                self.match(VAR)
-                while self.next_tokens_are(ID, COMMA) or self.next_tokens_are(ID, COLON):
-                    # var x, y || var x : integer
-                    declarations.append(self.variable_declaration())
-                    self.match(SEMI)
+        while self.tokens.get_current_token().kind in (K_VAR, K_FUNCTION):
+            declarations.extend(self.declaration())
+
+        return declarations
+
+    def declaration(self) -> list:
+        # one VAR section or one function declaration
+        declarations = []
 
-            while self.lexer.get_current_token().type is FUNCTION:
-                self.match(FUNCTION)
-                proc_name = self.lexer.get_current_token().value
-                self.match(ID)
+        if self.tokens.get_current_token().kind == K_VAR:
+            self.match(K_VAR)
+            while self.next_tokens_are(K_ID, K_COMMA) or self.next_tokens_are(K_ID, K_COLON):
+                # var x, y || var x : integer
+                declarations.append(self.variable_declaration())
+                self.match(K_SEMI)
+        else:
+            self.match(K_FUNCTION)
+            proc_name = self.tokens.get_current_token().value
+            self.match(K_ID)
 
-                parameters_list = []
-                if self.lexer.current_token.type is LPARENT:
-                    self.match(LPARENT)
-                    parameters_list = self.parameters_list()
-                    self.match(RPARENT)
+            parameters_list = []
+            if self.tokens.get_current_token().kind == K_LPARENT:
+                self.match(K_LPARENT)
+                parameters_list = self.parameters_list()
+                self.match(K_RPARENT)
 
-                self.match(LCBRACE)
-                block = self.function_block()
-                self.match(RCBRACE)
+            self.match(K_LCBRACE)
+            block = self.function_block()
+            self.match(K_RCBRACE)
 
-                function_decl = FunctionDecl(proc_name, parameters_list, block)
-                declarations.append(function_decl)
+            function_decl = FunctionDecl(proc_name, parameters_list, block)
+            declarations.append(function_decl)
 
         return declarations
 
@@ -160,177 +196,157 @@ class Parser:
 
         declarations = []
 
-        if self.lexer.get_current_token().type is RPARENT:
+        if self.tokens.get_current_token().kind == K_RPARENT:
             return declarations
 
-        var = self.lexer.get_current_token().value
+        var = self.tokens.get_current_token().value
         declarations.append(var)
-        self.match(ID)
+        self.match(K_ID)
 
-        while self.lexer.get_current_token().type is COMMA:
-            self.match(COMMA)
-            var = self.lexer.get_current_token().value
+        while self.tokens.get_current_token().kind == K_COMMA:
+            self.match(K_COMMA)
+            var = self.tokens.get_current_token().value
             declarations.append(var)
-            self.match(ID)
+            self.match(K_ID)
 
-        self.match(COLON)
+        self.match(K_COLON)
         base_type = self.base_type()
         declarations = list(map(lambda x: VarSymbol(x, base_type.value), declarations))
 
-        if self.lexer.get_current_token().type is not RPARENT:
-            self.match(SEMI)
+        if self.tokens.get_current_token().kind != K_RPARENT:
+            self.match(K_SEMI)
             declarations.extend(self.parameters_list())
 
         return declarations
 
     def variable_declaration(self):
         variables = []
-        if self.lexer.get_current_token().type is not ID:
-            self.error('should be ID, got: ' + self.lexer.get_current_token().type)
+        if self.tokens.get_current_token().kind != K_ID:
+            self.error('should be ID, got: ' + self.tokens.get_current_token().type)
 
-        variables.append(self.lexer.get_current_token())
-        self.lexer.go_forward()
+        variables.append(self.tokens.get_current_token())
+        self.tokens.go_forward()
 
-        while self.lexer.get_current_token().type is COMMA:
-            self.lexer.go_forward()
-            var = self.lexer.get_current_token()
-            if var.type is not ID:
-                self.error('should be ID, got: ' + self.lexer.get_current_token().type)
+        while self.tokens.get_current_token().kind == K_COMMA:
+            self.tokens.go_forward()
+            var = self.tokens.get_current_token()
+            if var.kind != K_ID:
+                self.error('should be ID, got: ' + self.tokens.get_current_token().type)
             variables.append(var)
-            self.lexer.go_forward()
+            self.tokens.go_forward()
 
-        self.match(COLON)
+        self.match(K_COLON)
         base_type = self.base_type()
 
         val = None
-        if self.next_token_is(ASSIGN):
-            self.match(ASSIGN)
+        if self.next_token_is(K_ASSIGN):
+            self.match(K_ASSIGN)
             val = self.base_expr()
 
-        return VarDecs(variables, base_type, val)
+        return self.track(VarDecs(variables, base_type, val))
 
     def base_type(self):
-        token = self.lexer.get_current_token()
-        if token.type in (INTEGER, REAL, STRING, BOOLEAN, OBJECT):
-            self.lexer.go_forward()
+        token = self.tokens.get_current_token()
+        if token.kind in (K_INTEGER, K_REAL, K_STRING, K_BOOLEAN, K_OBJECT):
+            self.tokens.go_forward()
             return token
 
         self.error('should be integer|real|string|boolean|object, got ' + token.type)
 
     def integer_type(self):
-        token = self.lexer.get_current_token()
-        if token.type in (INTEGER, REAL):
-            self.lexer.go_forward()
+        token = self.tokens.get_current_token()
+        if token.kind in (K_INTEGER, K_REAL):
+            self.tokens.go_forward()
             return token
 
         self.error('should be integer|real, got ' + token.type)
 
     def compound_statement(self):
-        nodes = self.statement_list()
-        compound = Compound()
-        for node in nodes:
-            compound.add(node)
+        # the statement list becomes the children as it is, without copying
+        return Compound(self.statement_list())
 
-        return compound
-
-    def is_if_statement(self):
-        return self.next_tokens_are(IF)
-
-    def is_for_loop(self):
-        return self.next_tokens_are(FOR)
-
-    def is_break(self):
-        return self.next_tokens_are(BREAK)
-
-    def is_return_stat(self):
-        return self.next_token_is(RETURN)
+    def statement_method(self):
+        """
+        predicts the statement starting at the current token: its kind decides,
+        only identifiers need one more token (function call or assignment).
+        Returns None when no statement starts here
+        """
+        kind = self.tokens.get_current_token().kind
+        if kind == K_ID:
+            return self.ID_STATEMENTS.get(self.tokens.peek().kind)
+        return self.STATEMENTS.get(kind)
 
     def is_compound_statement(self):
-        return self.is_function_call()\
-               or self.is_assignment() \
-               or self.is_declaration() \
-               or self.is_if_statement() \
-               or self.is_for_loop() \
-               or self.is_break() \
-                or self.is_return_stat()
+        return self.statement_method() is not None
 
     def statement_list(self):
         children = []
-        statement = self.statement()
-        if isinstance(statement, list):
-            for node in statement:
-                children.append(node)
-        else:
-            children.append(statement)
+        self.add_statement(children, self.statement())
 
-        while self.is_compound_statement():
-            statement = self.statement_list()
-            if isinstance(statement, list):
-                for node in statement:
-                    children.append(node)
-            else:
-                children.append(statement)
+        method = self.statement_method()
+        while method is not None:
+            self.add_statement(children, method(self))
+            method = self.statement_method()
 
         return children
 
+    @staticmethod
+    def add_statement(children, statement):
+        if isinstance(statement, list):
+            children.extend(statement)
+        else:
+            children.append(statement)
+
     def statement(self):
-        token = self.lexer.get_current_token()
-
-        if self.is_function_call():
-            # function call
-            node = self.function_call()
-            self.match(SEMI)
-            return node
-        elif self.is_assignment():
-            # assignment
-            node = self.assignment_statement()
-            self.match(SEMI)
-            return node
-        elif self.is_declaration():
-            # variable or function declaration
-            return self.declarations()
-        elif self.is_if_statement():
-            #
-            return self.if_statement()
-        elif self.is_for_loop():
-            #
-            return self.for_loop()
-        elif self.is_break():
-            self.match(BREAK)
-            self.match(SEMI)
-            return Break()
-        elif self.is_return_stat():
-            #
-            return self.function_return_statement()
-        elif token.type == RCBRACE:
+        method = self.statement_method()
+        if method is not None:
+            return method(self)
+
+        token = self.tokens.get_current_token()
+        if token.kind == K_RCBRACE:
             return self.emtpy()
 
         print(token)
         self.error("should be ID or LPARENT, got {}".format(token))
 
+    def function_call_statement(self):
+        node = self.function_call()
+        self.match(K_SEMI)
+        return node
+
+    def assignment(self):
+        node = self.assignment_statement()
+        self.match(K_SEMI)
+        return node
+
+    def break_statement(self):
+        self.match(K_BREAK)
+        self.match(K_SEMI)
+        return Break()
+
     def for_loop(self):
-        self.match(FOR)
+        self.match(K_FOR)
         base = self.assignment_statement()
-        self.match(SEMI)
-        bool_expr = self.bool_expr()
-        self.match(SEMI)
+        self.match(K_SEMI)
+        bool_expr = self.base_expr()
+        self.match(K_SEMI)
         then = self.assignment_statement()
         block = self.block()
         return ForLoop(base, bool_expr, then, block)
 
     def if_statement(self):
-        self.match(IF)
-        bool_expr = self.bool_expr()
+        self.match(K_IF)
+        bool_expr = self.base_expr()
         block = self.block()
         if_blocks = [IfBlock(bool_expr, block)]
         else_block = None
-        while self.lexer.get_current_token().type is ELIF:
-            self.match(ELIF)
-            bool_expr = self.bool_expr()
+        while self.tokens.get_current_token().kind == K_ELIF:
+            self.match(K_ELIF)
+            bool_expr = self.base_expr()
             block = self.block()
             if_blocks.append(IfBlock(bool_expr, block))
-        if self.lexer.get_current_token().type is ELSE:
-            self.match(ELSE)
+        if self.tokens.get_current_token().kind == K_ELSE:
+            self.match(K_ELSE)
             else_block = self.block()
         return IfStat(if_blocks, else_block)
 
@@ -338,156 +354,141 @@ class Parser:
         """
         function_call: ID LPARENT (base_expr (COMMA base_expr)*)* RPARENT
         """
-        current_token = self.lexer.get_current_token()
-        proc_name = self.lexer.get_current_token().value
-        self.match(ID)
-        self.match(LPARENT)
-        if self.lexer.get_current_token().type is RPARENT:
-            self.match(RPARENT)
+        current_token = self.tokens.get_current_token()
+        proc_name = self.tokens.get_current_token().value
+        self.match(K_ID)
+        self.match(K_LPARENT)
+        if self.tokens.get_current_token().kind == K_RPARENT:
+            self.match(K_RPARENT)
             # no parameters
-            return FunctionCall(proc_name, [], current_token)
+            return self.track(FunctionCall(proc_name, [], current_token))
         else:
             params = [self.base_expr()]
-            while self.lexer.get_current_token().type is COMMA:
-                self.match(COMMA)
+            while self.tokens.get_current_token().kind == K_COMMA:
+                self.match(K_COMMA)
                 params.append(self.base_expr())
-            self.match(RPARENT)
-            return FunctionCall(proc_name, params, current_token)
+            self.match(K_RPARENT)
+            return self.track(FunctionCall(proc_name, params, current_token))
 
     def assignment_statement(self):
         var = self.variable()
-        self.match(ASSIGN)
+        self.match(K_ASSIGN)
         base_expr = self.base_expr()
-        return Assign(var, Token(ASSIGN, Assign), base_expr)
-
-    def is_next_function_call(self):
-        return self.next_tokens_are(ID, LPARENT)
-
-    def is_next_bool_expr(self):
-        return self.match_next_tokens_to_any(AND, OR, BOOLEAN, NOT, NOT_EQUAL, GREATER_THAN, GREATER_THAN_OR_EQUAL,
-                                             LESS_THAN, LESS_THAN_OR_EQUAL, IS_EQUAL)
-
-    def is_next_expr(self):
-        return self.match_next_tokens_to_any(MULT, DIV, FLOAT_DIV, MINUS, PLUS, ID, INTEGER, FLOAT)
-
-    def is_next_str_expr(self):
-        node = self.match_next_tokens_to_any(STRING)
-        return node
+        return Assign(var, base_expr)
 
     def base_expr(self):
-        if self.is_next_str_expr():
-            return self.str_expr()
-        elif self.is_next_bool_expr():
-            return self.bool_expr()
-        elif self.is_next_expr():
-            return self.expr()
-
-        print(self.lexer.get_current_token())
-        self.error("can't decide current expression type")
-
-    @staticmethod
-    def is_boolean_token_type(token_type):
-        return token_type in (
-            OR, AND, GREATER_THAN, GREATER_THAN_OR_EQUAL, LESS_THAN, LESS_THAN_OR_EQUAL, NOT_EQUAL, IS_EQUAL)
-
-    def bool_expr(self):
-        #  bool_expr: bool_term ((OR, AND) bool_term)*
-        bool_term = self.bool_term()
-        while self.lexer.get_current_token().type in (OR, AND):
-            op: Token = self.lexer.get_current_token()
-            self.lexer.go_forward()
-            if op.type is OR:
-                bool_term = BoolOr(bool_term, self.bool_term())
-            elif op.type is AND:
-                bool_term = BoolAnd(bool_term, self.bool_term())
-            else:
-                self.error('not supported boolean token')
-
-        return bool_term
-
-    def bool_term(self):
-        # bool_term: bool_factor ((>, >=, <, <=, !=, ==) bool_factor)*
-        bool_factor = self.bool_factor()
-        while self.lexer.get_current_token().type in (
-                GREATER_THAN, GREATER_THAN_OR_EQUAL, LESS_THAN, LESS_THAN_OR_EQUAL, NOT_EQUAL, IS_EQUAL):
-
-            op: Token = self.lexer.get_current_token()
-            self.lexer.go_forward()
-
-            if op.type is NOT_EQUAL:
-                bool_factor = BoolNotEqual(bool_factor, self.bool_factor())
-            elif op.type is GREATER_THAN:
-                bool_factor = BoolGreaterThan(bool_factor, self.bool_factor())
-            elif op.type is GREATER_THAN_OR_EQUAL:
-                bool_factor = BoolGreaterThanOrEqual(bool_factor, self.bool_factor())
-            elif op.type is LESS_THAN:
-                bool_factor = BoolLessThan(bool_factor, self.bool_factor())
-            elif op.type is LESS_THAN_OR_EQUAL:
-                bool_factor = BoolLessThanOrEqual(bool_factor, self.bool_factor())
-            elif op.type is IS_EQUAL:
-                bool_factor = BoolIsEqual(bool_factor, self.bool_factor())
+        """
+        precedence climbing without recursion: operands and pending operators
+        are kept on explicit stacks, so neither long operator chains nor deeply
+        nested parentheses and prefix operators grow the Python stack.
+        Only parsing is flat: the SemanticAnalyzer, the Optimizer and the
+        engines visit the tree recursively, so a chain of about 500 operators
+        still raises a RecursionError after parsing
+        """
+        operands = []
+        # pending operators: (PREFIX, token, operand precedence),
+        # (BINARY, token, precedence) or (PARENTHESIS, token, 0)
+        operators = []
+        open_parentheses = 0
+        while True:
+            # operand, after any prefix operators and opening parentheses
+            token = self.tokens.get_current_token()
+            while token.kind in PREFIX_PRECEDENCE or token.kind == K_LPARENT:
+                if token.kind == K_LPARENT:
+                    operators.append((PARENTHESIS, token, 0))
+                    open_parentheses += 1
+                else:
+                    operators.append((PREFIX, token, PREFIX_PRECEDENCE[token.kind]))
+                self.tokens.go_forward()
+                token = self.tokens.get_current_token()
+            operands.append(self.primary())
+
+            # binary operators and closing parentheses after the operand
+            while True:
+                op: Token = self.tokens.get_current_token()
+                precedence = BINARY_PRECEDENCE.get(op.kind, 0)
+                self.reduce(operands, operators, precedence)
+                if precedence:
+                    operators.append((BINARY, op, precedence))
+                    self.tokens.go_forward()
+                    break
+                if op.kind == K_RPARENT and open_parentheses:
+                    operators.pop()
+                    open_parentheses -= 1
+                    self.tokens.go_forward()
+                    continue
+                if open_parentheses:
+                    self.match(K_RPARENT)
+                return operands.pop()
+
+    def reduce(self, operands, operators, precedence):
+        # builds nodes for the pending operators binding at least as tight as
+        # the next binary operator; stops at an unclosed parenthesis
+        while operators:
+            kind, op, op_precedence = operators[-1]
+            if kind == PARENTHESIS or precedence > op_precedence:
+                return
+            operators.pop()
+            if kind == PREFIX:
+                operands.append(self.track(self.prefix_node(op, operands.pop())))
             else:
-                self.error('not supported boolean token')
-
-        return bool_factor
+                right = operands.pop()
+                operands.append(self.track(self.binary_node(operands.pop(), op, right)))
 
-    def bool_factor(self):
-        #  bool_term: NOT bool_term | LPARENT bool_expr RPARENT | TRUE | FALSE | ID | function_call
-        token = self.lexer.get_current_token()
-        if token.type is NOT:
-            self.match(NOT)
-            return NotOp(self.bool_term())
+    @staticmethod
+    def binary_node(left, op: Token, right):
+        bool_node = BOOL_NODES.get(op.kind)
+        if bool_node is not None:
+            return bool_node(left, right, op.pos)
 
-        if token.type is BOOLEAN:
-            self.match(BOOLEAN)
-            return BooleanSymbol(token.value)
+        if op.kind == K_PLUS and (isinstance(left, (Str, StrOp)) or isinstance(right, (Str, StrOp))):
+            return StrOp(left, op, right)
+        return BinOp(left, op, right)
 
-        if self.is_next_function_call():
+    @staticmethod
+    def prefix_node(op: Token, operand):
+        if op.kind == K_NOT:
+            return NotOp(operand, op.pos)
+        return UnaryOp(op, operand)
+
+    def primary(self):
+        token = self.tokens.get_current_token()
+        if token.kind in (K_INTEGER, K_FLOAT, K_STRING, K_BOOLEAN):
+            self.tokens.go_forward()
+            return self.literal(token)
+        elif self.is_function_call():
             return self.function_call()
+        elif token.kind == K_ID:
+            self.tokens.go_forward()
+            return self.track(Var(token))
 
-        if token.type is ID:
-            self.match(ID)
-            return Var(token)
-
-        if token.type is INTEGER:
-            self.match(INTEGER)
-            return Num(token)
-
-        if token.type is FLOAT:
-            self.match(FLOAT)
-            return Num(token)
-
-        if token.type is LPARENT:
-            self.match(LPARENT)
-            node = self.bool_expr()
-            self.match(RPARENT)
-            return node
-
-        self.error("error in bool_term, got {}".format(token))
-
-    def str_expr(self):
-        var = self.lexer.current_token
-        if var.type is STRING:
-            var = Str(var)
-        elif self.is_next_function_call():
-            return self.function_call()
-        elif var.type is ID:
-            var = Var(var)
-        else:
-            self.error("string assignment can only contain string literals")
+        print(token)
+        self.error("incorrect expression, got {}".format(token))
 
-        self.lexer.go_forward()
-        while self.lexer.get_current_token().type is PLUS:
-            self.match(PLUS)
-            var = StrOp(var, Token(PLUS, PLUS), self.str_expr())
+    def track(self, node):
+        # lets the incremental parser move the positions of reused nodes
+        if self.positioned is not None:
+            self.positioned.append(node)
+        return node
 
-        return var
+    def literal(self, token: Token):
+        key = (token.kind, token.value)
+        node = self.literals.get(key)
+        if node is None:
+            if token.kind == K_STRING:
+                node = Str(token)
+            elif token.kind == K_BOOLEAN:
+                node = BooleanSymbol(token.value == TRUE)
+            else:
+                node = Num(token)
+            self.literals[key] = node
+        return node
 
     def variable(self):
-        token = self.lexer.get_current_token()
-        if token.type is ID:
-            self.lexer.go_forward()
-            return Var(token)
+        token = self.tokens.get_current_token()
+        if token.kind == K_ID:
+            self.tokens.go_forward()
+            return self.track(Var(token))
 
         self.error("error in variable")
 
@@ -499,68 +500,41 @@ class Parser:
         raise ParserError(
             error_code=error_code,
             message=f'{error_code.value} -> {message}',
+            pos=self.tokens.get_current_token().pos,
+            source_index=self.source_index,
         )
 
-    def match(self, token_type: str):
-        token = self.lexer.get_current_token()
-        if token.type is not token_type:
+    def match(self, kind: int):
+        token = self.tokens.get_current_token()
+        if token.kind != kind:
             print('-----------------------')
             print(token)
-            print('should be: ' + token_type)
+            print('should be: ' + TOKEN_TYPES[kind])
             print('-----------------------')
             self.error("incorrect expression")
-        self.lexer.go_forward()
-
-    def expr(self):
-        node = self.term()
-        while self.lexer.get_current_token().type in (PLUS, MINUS):
-            current_op_token = self.lexer.get_current_token()
-            self.lexer.go_forward()
-            node = BinOp(node, current_op_token, self.term())
-        return node
-
-    def term(self):
-        node = self.factor()
-        while self.lexer.get_current_token().type in (MULT, FLOAT_DIV, INTEGER_DIV):
-            current_op_token = self.lexer.get_current_token()
-            self.lexer.go_forward()
-            node = BinOp(node, current_op_token, self.factor())
-        return node
-
-    def factor(self):
-        token = self.lexer.get_current_token()
-        if token.type is PLUS:
-            self.match(PLUS)
-            node = UnaryOp(token, self.factor())
-            return node
-        elif token.type is MINUS:
-            self.match(MINUS)
-            node = UnaryOp(token, self.factor())
-            return node
-        elif token.type == INTEGER:
-            self.lexer.go_forward()
-            return Num(token)
-        elif token.type == FLOAT:
-            self.lexer.go_forward()
-            return Num(token)
-        elif token.type is LPARENT:
-            self.match(LPARENT)
-            node = self.expr()
-            self.match(RPARENT)
-            return node
-        elif self.is_function_call():
-            return self.function_call()
-        elif token.type is ID:
-            self.lexer.go_forward()
-            return Var(token)
-        else:
-            self.error("incorrect expression: (from factor)")
+        self.tokens.go_forward()
 
     def parse(self):
         program = self.program()
 
-        if self.lexer.is_pointer_out_of_text():
-            # all characters consumed
+        if self.tokens.is_exhausted():
+            # all tokens consumed
             return program
 
-        self.error("Syntax error at position " + str(self.lexer.get_position()))
+        self.error("Syntax error at position " + str(self.tokens.get_position()))
+
+    # statement parsing methods by the kind of the first token
+    STATEMENTS = {
+        K_VAR: declarations,
+        K_FUNCTION: declarations,
+        K_IF: if_statement,
+        K_FOR: for_loop,
+        K_BREAK: break_statement,
+        K_RETURN: function_return_statement,
+    }
+
+    # statements starting with ID, by the kind of the second token
+    ID_STATEMENTS = {
+        K_LPARENT: function_call_statement,
+        K_ASSIGN: assignment,
+    }
@@ -0,0 +1,91 @@
+from compiler.inliner import FunctionIndex
+from compiler.walker import ProgramWalker, map_operands
+from utils.data_classes import *
+
+
+class Purity(ProgramWalker):
+    """
+    Marks the pure functions of a program: the ones that read no variable
+    of an enclosing scope, assign none, declare no function, call no
+    system function (print) and no function through a variable, do not
+    break out of the loop they are called from and call only pure
+    functions. The result of a call of
+    a pure function depends on its arguments only, so the engines may keep
+    it (see memo).
+
+    A function is impure as soon as its body does any of these things; the
+    functions calling an impure one are then dropped until none is left,
+    which keeps recursive functions pure.
+    """
+
+    def __init__(self, tree: Program):
+        super().__init__(tree)
+        # functions and the (depth, slot) of the functions they call
+        self.calls = {}
+        self.impure = set()
+        # loops of the current function around the visited statements
+        self.loops = 0
+        self.index = None
+        self.functions = {}
+
+    def expression(self, node):
+        if self.function is not self.tree:
+            if isinstance(node, Var) and node.depth < self.depth:
+                self.impure.add(self.function)
+            elif isinstance(node, FunctionCall):
+                # system functions and the values of variables, which may be
+                # any function
+                if node.slot is None or node.guards is None:
+                    self.impure.add(self.function)
+                else:
+                    self.calls[self.function].add((node.depth, node.slot))
+        return map_operands(node, self.expression)
+
+    def write(self, depth, slot):
+        if depth < self.depth:
+            self.impure.add(self.function)
+
+    def visit_Break(self, node: Break):
+        if self.loops == 0 and self.function is not self.tree:
+            self.impure.add(self.function)
+        return node
+
+    def visit_ForLoop(self, node: ForLoop):
+        self.loops += 1
+        super().visit_ForLoop(node)
+        self.loops -= 1
+        return node
+
+    def visit_FunctionDecl(self, node: FunctionDecl):
+        if self.function is not self.tree:
+            # every call creates a new closure of the nested function, with
+            # variables of its own
+            self.impure.add(self.function)
+        self.calls[node] = set()
+        loops, self.loops = self.loops, 0
+        super().visit_FunctionDecl(node)
+        self.loops = loops
+        return node
+
+    def callee(self, depth, slot):
+        # function a call resolves to, if its slot holds no other
+        if self.index.writes[depth, slot] != 1:
+            return None
+        return self.functions.get((depth, slot))
+
+    def analyze(self):
+        self.index = FunctionIndex(self.tree)
+        self.index.visit(self.tree)
+        self.functions = {(function.depth - 1, function.slot): function for function in self.index.functions}
+        self.visit(self.tree)
+
+        pure = {function for function in self.calls if function not in self.impure}
+        changed = True
+        while changed:
+            changed = False
+            for function in list(pure):
+                if any(self.callee(depth, slot) not in pure for depth, slot in self.calls[function]):
+                    pure.discard(function)
+                    changed = True
+        for function in pure:
+            function.pure = True
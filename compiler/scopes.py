@@ -1,13 +1,95 @@
-from compiler.symbol_table import SymbolTable
+class Undefined:
+    # value of a slot whose declaration has not been executed yet
+    __slots__ = ()
 
+    def __repr__(self):
+        return 'UNDEFINED'
 
-class NestedScopeable:
-    def __init__(self, symbol_table: SymbolTable):
-        self.symbol_table = symbol_table
 
-    def define_new_scope(self):
-        nested_scope = SymbolTable(enclosed_parent=self.symbol_table)
-        self.symbol_table = nested_scope
+UNDEFINED = Undefined()
 
-    def destroy_current_scope(self):
-        self.symbol_table = self.symbol_table.enclosed_parent
+
+class Closure:
+    """
+    Value of a function: its declaration and the frames of the scopes it was
+    declared in, display[:function.depth] when the declaration ran.
+    """
+    __slots__ = ('function', 'frames')
+
+    def __init__(self, function, frames):
+        self.function = function
+        self.frames = frames
+
+    def __str__(self):
+        return str(self.function)
+
+
+def function_of(value):
+    # declaration of a function value, or None for any other value
+    return value.function if value.__class__ is Closure else None
+
+
+def enter_closure(display, closure: Closure):
+    # puts the frames of the scopes of the function of closure in the
+    # display; returns the ones they replaced, for leave_closure
+    frames = closure.frames
+    previous = display[:len(frames)]
+    display[:len(frames)] = frames
+    return previous
+
+
+def leave_closure(display, previous):
+    display[:len(previous)] = previous
+
+
+class FunctionScope:
+    """
+    Frame layout of one function, or of the program itself, worked out by the
+    semantic analyzer: every parameter, variable and nested function declared
+    in the body, if and for blocks included, gets a slot of its own.
+    """
+
+    def __init__(self, depth):
+        self.depth = depth
+        self.size = 0
+
+    def allocate(self):
+        slot = self.size
+        self.size += 1
+        return slot
+
+
+class Framed:
+    """
+    Frames of the running functions, indexed by lexical depth (a display).
+
+    A variable resolved to (depth, slot) is display[depth][slot]. A function
+    called by name is called from its own scope or a nested one, so the
+    frames below its depth are the ones of the scopes it was declared in; a
+    call only has to swap the frame at its own depth and put the previous
+    one back when it returns. A function called through a variable may be
+    called from anywhere: its Closure has the frames of its scopes, which
+    the call puts in the display as well (see enter_closure).
+    """
+
+    def __init__(self):
+        self.display = []
+        # frame of the function being executed
+        self.frame = None
+
+    def enter_frame(self, depth, frame):
+        previous = self.frame, self.display[depth] if depth < len(self.display) else None
+        if depth == len(self.display):
+            self.display.append(frame)
+        else:
+            self.display[depth] = frame
+        self.frame = frame
+        return previous
+
+    def leave_frame(self, depth, previous):
+        self.frame, self.display[depth] = previous
+
+    def clear_slots(self, scope: range):
+        # declarations of a block start undefined every time it is entered
+        if scope:
+            self.frame[scope.start:scope.stop] = [UNDEFINED] * len(scope)
@@ -1,72 +1,172 @@
-from utils.constants import PLUS, TRUE, FALSE
-from system.builtin_functions.main import is_system_function
+from utils.constants import K_PLUS, FLOAT
+from system.builtin_functions.main import is_system_function, is_val_of_type, to_string
+from compiler.comparisons import operands_type
 from utils.data_classes import *
 from utils.errors import SemanticError, ErrorCode
+from compiler.purity import Purity
+from compiler.scopes import FunctionScope
 from compiler.symbol_table import SymbolTable
+from compiler.type_inference import *
 
 
 class SemanticAnalyzer(NodeVisitor):
+    """
+    Checks the program and resolves every variable, assignment target and
+    function call to a (depth, slot) of a frame, so that the interpreter
+    does not look names up at runtime.
+
+    Scopes are lexical: the program and each function have a frame, and the
+    blocks of if statements and for loops only reserve slots in the frame of
+    their function. Bodies of functions are resolved when the scope they are
+    declared in ends, so they see every name declared in it.
+
+    Visiting an expression returns the type inferred for it (see
+    type_inference). Assignments, declarations and arguments whose value is
+    known to be valid for the declared type are not checked again at
+    runtime, and the ones known to be invalid are reported here.
+    """
+
     def __init__(self, tree):
         self.tree = tree
+        self.source_index = getattr(tree, 'source_index', None)
         self.symbol_table = SymbolTable()
+        self.function_scope = None
+        # function whose body is being resolved; None in the program
+        self.function = None
+        # functions declared in each open scope, resolved when it ends
+        self.pending_functions = []
 
-    def error(self, error_code, message):
+    def error(self, error_code, message, node=None):
         raise SemanticError(
             error_code=error_code,
             message=f'{error_code.value} -> {message}',
+            pos=getattr(node, 'pos', None),
+            source_index=self.source_index,
         )
 
+    def is_guarded(self, declared_type, value_node, inferred_type, name, node):
+        """
+        Whether a value assigned to a variable of declared_type has to be type
+        checked at runtime. Values that can never be assigned are reported.
+        """
+        if declared_type not in CHECKED_TYPES:
+            return True
+
+        if isinstance(value_node, (Num, Str, BooleanSymbol)):
+            valid = is_val_of_type(value_node.value, declared_type)
+            value = to_string(value_node.value)
+        elif is_always_valid(declared_type, inferred_type):
+            valid = True
+        elif is_never_valid(declared_type, inferred_type):
+            valid = False
+            value = f'a value of type {inferred_type}'
+        else:
+            return True
+
+        if not valid:
+            self.error(ErrorCode.TYPE_ERROR,
+                       "can't assign {} to var {} as type of {} is {}".format(value, name, name, declared_type), node)
+        return False
+
+    def check_number_operand(self, inferred_type, node):
+        # booleans are ints in python, but no numbers in Dy
+        if inferred_type in (BOOL, BOOLEAN):
+            self.error(ErrorCode.TYPE_ERROR, "booleans can not be operands of arithmetic operators", node)
+
     def visit_BinOp(self, node: BinOp):
-        self.visit(node.left)
-        self.visit(node.right)
+        left = self.visit(node.left)
+        right = self.visit(node.right)
+        self.check_number_operand(left, node)
+        self.check_number_operand(right, node)
+        return binary_type(node.op, left, right)
 
     def visit_UnaryOp(self, node: UnaryOp):
-        expr = node.expr
-        self.visit(expr)
-        self.visit(expr)
+        inferred_type = self.visit(node.expr)
+        self.check_number_operand(inferred_type, node)
+        return unary_type(inferred_type)
 
     @staticmethod
     def visit_Num(node: Num):
-        pass
+        return INT if isinstance(node.value, int) else REAL_NUMBER
 
     @staticmethod
     def visit_Str(node: Str):
-        pass
+        return STR
 
     def visit_StrOp(self, node: StrOp):
         self.visit(node.left)
-        if node.add.type is not PLUS:
-            self.error(ErrorCode.SEMANTIC_ERROR, "only '+' sign can be used for strings' concatenation")
+        if node.add != K_PLUS:
+            self.error(ErrorCode.SEMANTIC_ERROR, "only '+' sign can be used for strings' concatenation", node)
         self.visit(node.right)
+        return STR
 
     def visit_Compound(self, node: Compound):
         for sub_node in node.get_children():
             self.visit(sub_node)
 
     def visit_Assign(self, node: Assign):
-        var_name = node.left.value
-        self.visit(node.right)
+        inferred_type = self.visit(node.right)
 
-        if self.symbol_table.is_defined(var_name):
-            return None
-        else:
-            self.error(error_code=ErrorCode.ID_NOT_FOUND, message=f"value {var_name} is not defined")
+        var = node.left
+        symbol = self.resolve(var)
+        node.type = symbol.type if isinstance(symbol, Symbol) else None
+        node.guarded = self.is_guarded(node.type, node.right, inferred_type, var.value, var)
 
     def visit_Var(self, node: Var):
+        symbol = self.resolve(node)
+        return symbol.inferred_type if isinstance(symbol, SlotSymbol) else None
+
+    def resolve(self, node: Var):
         var_name = node.value
-        if self.symbol_table.is_defined(var_name) is None:
-            self.error(error_code=ErrorCode.ID_NOT_FOUND, message=f"value {var_name} is not defined")
+        symbol = self.symbol_table.lookup(var_name)
+        if symbol is None:
+            self.error(error_code=ErrorCode.ID_NOT_FOUND, message=f"value {var_name} is not defined", node=node)
+
+        if isinstance(symbol, FunctionDecl):
+            # a function used as a value
+            node.depth, node.slot = symbol.depth - 1, symbol.slot
+        else:
+            node.depth, node.slot = symbol.depth, symbol.slot
+        return symbol
+
+    def declare(self, name, symbol_type, inferred_type=None):
+        # a name declared again in the same scope keeps its slot
+        previous = self.symbol_table.get_symbols().get(name)
+        if previous is not None:
+            slot = previous.slot
+            if not isinstance(previous, SlotSymbol) or previous.inferred_type != inferred_type:
+                # bodies of functions see the last declaration, but may run
+                # while the slot still holds a value of an earlier one
+                inferred_type = None
+        else:
+            slot = self.function_scope.allocate()
+        self.symbol_table.define(SlotSymbol(name, symbol_type, self.function_scope.depth, slot, inferred_type))
+        return slot
+
+    def enter_scope(self):
+        self.symbol_table = SymbolTable(enclosed_parent=self.symbol_table)
+        self.pending_functions.append([])
+        return self.function_scope.size
+
+    def leave_scope(self, start):
+        # returns the range of slots declared in the scope
+        for function in self.pending_functions.pop():
+            self.visit_function_body(function)
+        self.symbol_table = self.symbol_table.enclosed_parent
+        return range(start, self.function_scope.size)
 
     def visit_NoOp(self, node):
         pass
 
     def visit_Program(self, node: Program):
-        nested_symbol_table = SymbolTable(enclosed_parent=None)
-        self.symbol_table = nested_symbol_table
+        self.symbol_table = None
+        self.function_scope = FunctionScope(0)
+        start = self.enter_scope()
 
         self.visit(node.block)
 
-        self.symbol_table = self.symbol_table.enclosed_parent
+        self.leave_scope(start)
+        node.frame_size = self.function_scope.size
 
     def visit_Block(self, node: Block):
         for declaration in node.var_decs:
@@ -74,112 +174,124 @@ class SemanticAnalyzer(NodeVisitor):
         self.visit(node.compound_statement)
 
     def visit_VarDecs(self, node: VarDecs):
-        declarations = node.get_declarations()
-        symbol_type = node.get_type()
-        val = node.get_value()
-        # print(symbol_type)
-        for var in declarations:
-            symbol = VarSymbol(var.value, val, symbol_type.value)
-            self.symbol_table.define(symbol)
-
-    def visit_VarSymbol(self, node: VarSymbol):
-        self.symbol_table.define(node)
+        # the value is evaluated before the variables exist
+        value = node.get_value()
+        inferred_type = self.visit(value)
+        if value is not None:
+            node.guarded = self.is_guarded(node.get_type(), value, inferred_type, node.get_var_names(), node)
+
+        base_type = node.get_type()
+        node.slots = [self.declare(var, base_type, variable_type(base_type)) for var in node.get_declarations()]
 
     def visit_FunctionDecl(self, node: FunctionDecl):
+        # the function is a name of the current scope from here on; its body
+        # is resolved when the scope ends
+        node.slot = self.declare(node.name, None)
+        node.depth = self.function_scope.depth + 1
+        self.symbol_table.define(node)
+        self.pending_functions[-1].append(node)
+
+    def visit_function_body(self, node: FunctionDecl):
         """
         function declaration creates a new scope
         """
-        nested_scope = SymbolTable(enclosed_parent=self.symbol_table)
-        self.symbol_table = nested_scope
-        params = node.params
-        for param in params:
-            self.visit(param)
+        function_scope, function = self.function_scope, self.function
+        self.function_scope = FunctionScope(node.depth)
+        self.function = node
+        start = self.enter_scope()
 
-        block = node.block
-        self.visit(block)
+        # parameters take the first slots, in order; arguments are checked
+        # against their types when the function is called
+        for param, param_type in zip(node.params, parameter_types(node)):
+            self.symbol_table.define(
+                SlotSymbol(param.name, param.value, node.depth, self.function_scope.allocate(), param_type))
+
+        self.visit(node.block)
 
         """
         when we leave the function, the scope is finished as well 
         """
-        self.symbol_table = self.symbol_table.enclosed_parent
-
-        self.symbol_table.define(node)
+        self.leave_scope(start)
+        node.frame_size = self.function_scope.size
+        self.function_scope, self.function = function_scope, function
 
     def visit_FunctionCall(self, node: FunctionCall):
-        if self.symbol_table.is_defined(node.name):
-            function: FunctionDecl = self.symbol_table.lookup(node.name)
+        inferred_types = [self.visit(param) for param in node.actual_params]
+
+        function = self.symbol_table.lookup(node.name)
+        if isinstance(function, FunctionDecl):
             parameter_names = function.params
             parameter_values = node.actual_params
             if len(parameter_names) != len(parameter_values):
                 self.error(ErrorCode.NUMBER_OF_ARGUMENTS_MISMATCH_ERROR,
                            "Number of arguments passed does not match "
-                           "with the function arguments count")
+                           "with the function arguments count", node)
+            node.depth, node.slot = function.depth - 1, function.slot
+
+            arguments = zip(parameter_names, parameter_types(function), parameter_values, inferred_types)
+            node.guards = tuple(
+                (index, param_type)
+                for index, (param, param_type, value, inferred_type) in enumerate(arguments)
+                if param_type is not None and self.is_guarded(param_type, value, inferred_type, param.name, node)
+            )
+        elif function is not None:
+            # a variable: its value, if it is a function, is called in the
+            # scopes it was declared in, and its arguments are all checked
+            # (no guards)
+            node.depth, node.slot = function.depth, function.slot
         elif is_system_function(node.name):
-            pass
+            node.depth = node.slot = None
         else:
-            self.error(ErrorCode.ID_NOT_FOUND, "function {} is not defined".format(node.name))
+            self.error(ErrorCode.ID_NOT_FOUND, "function {} is not defined".format(node.name), node)
 
     def visit_BooleanSymbol(self, node: BooleanSymbol):
-        if node.value not in (TRUE, FALSE):
+        if node.value is not True and node.value is not False:
             self.error(ErrorCode.SEMANTIC_ERROR, "BooleanSymbol got value {}".format(node.value))
+        return BOOL
 
     def visit_BoolOp(self, node: BoolOp):
-        self.visit(node.left)
-        self.visit(node.right)
+        # every comparison and logical operator
+        node.operands = operands_type(self.visit(node.left), self.visit(node.right))
+        return BOOL
+
+    visit_BoolNotEqual = visit_BoolOr = visit_BoolAnd = visit_BoolOp
+    visit_BoolGreaterThan = visit_BoolGreaterThanOrEqual = visit_BoolOp
+    visit_BoolLessThan = visit_BoolLessThanOrEqual = visit_BoolIsEqual = visit_BoolOp
 
     def visit_NotOp(self, node: NotOp):
         self.visit(node.expr)
-
-    def visit_BoolNotEqual(self, node: BoolNotEqual):
-        self.visit(node.left)
-        self.visit(node.right)
-
-    def visit_BoolOr(self, node: BoolOr):
-        self.visit(node.left)
-        self.visit(node.right)
-
-    def visit_BoolAnd(self, node: BoolAnd):
-        self.visit(node.left)
-        self.visit(node.right)
-
-    def visit_BoolGreaterThan(self, node: BoolGreaterThan):
-        self.visit(node.left)
-        self.visit(node.right)
-
-    def visit_BoolGreaterThanOrEqual(self, node: BoolGreaterThanOrEqual):
-        self.visit(node.left)
-        self.visit(node.right)
-
-    def visit_BoolLessThan(self, node: BoolLessThan):
-        self.visit(node.left)
-        self.visit(node.right)
-
-    def visit_BoolLessThanOrEqual(self, node: BoolLessThanOrEqual):
-        self.visit(node.left)
-        self.visit(node.right)
-
-    def visit_BoolIsEqual(self, node: BoolIsEqual):
-        self.visit(node.left)
-        self.visit(node.right)
+        return BOOL
 
     def visit_IfBlock(self, node: IfBlock):
-        self.visit(node.block)
         self.visit(node.expr)
+        start = self.enter_scope()
+        self.visit(node.block)
+        node.scope = self.leave_scope(start)
 
     def visit_IfStat(self, node: IfStat):
         for if_block in node.if_blocks:
             self.visit(if_block)
         if node.else_block is not None:
+            # declarations of the else block belong to the enclosing scope
             self.visit(node.else_block)
 
     def visit_ForLoop(self, node: ForLoop):
         base = node.base
-        var = base.left.value
-        self.symbol_table.define(Symbol(var, None))
-        self.visit(node.base)
+        inferred_type = self.visit(base.right)
+        start = self.enter_scope()
+        # the loop variable is a new one, even if a variable of the same name
+        # exists outside of the loop; its first value is not type checked
+        if isinstance(base.right, (Num, Str, BooleanSymbol)):
+            valid = is_val_of_type(base.right.value, FLOAT)
+        else:
+            valid = is_always_valid(FLOAT, inferred_type)
+        self.declare(base.left.value, FLOAT, FLOAT if valid else None)
+        self.resolve(base.left)
+        base.type = FLOAT
         self.visit(node.bool_expr)
         self.visit(node.then)
         self.visit(node.block)
+        node.scope = self.leave_scope(start)
 
     def visit_Break(self, node):
         pass
@@ -188,7 +300,14 @@ class SemanticAnalyzer(NodeVisitor):
         pass
 
     def visit_ReturnStat(self, node: ReturnStat):
-        pass
+        self.visit(node.base_expr)
+
+        # a call of the function itself in tail position runs in its frame
+        call = node.base_expr
+        if isinstance(call, FunctionCall) and self.function is not None \
+                and self.symbol_table.lookup(call.name) is self.function:
+            call.tail = self.function
 
     def analyze(self):
-        return self.visit(self.tree)
+        self.visit(self.tree)
+        Purity(self.tree).analyze()
@@ -0,0 +1,31 @@
+# Completion values of statements: running a statement returns None when the
+# statements after it run as usual, or a Signal when they do not.
+
+
+class Signal:
+    __slots__ = ()
+
+
+class Return(Signal):
+    __slots__ = ('value',)
+
+    def __init__(self, value):
+        self.value = value
+
+
+class TailCall(Signal):
+    # return of a call of the running function itself, with the arguments
+    # to run it again with in the same frame
+    __slots__ = ('arguments',)
+
+    def __init__(self, arguments):
+        self.arguments = arguments
+
+
+BREAK = Signal()
+
+
+class BreakOut(Exception):
+    # break outside of a loop of its function, stopping the loop the
+    # function was called from
+    pass
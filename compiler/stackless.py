@@ -0,0 +1,482 @@
+import operator
+
+from compiler.comparisons import COMPARISONS, comparison
+from compiler.memo import Memos, MEMO_SIZE, MISSING
+from compiler.scopes import UNDEFINED, Closure, function_of, enter_closure, leave_closure
+from compiler.type_inference import parameter_guards
+from system.builtin_functions.main import *
+from utils.constants import *
+from utils.data_classes import *
+from utils.errors import InterpreterError, ErrorCode
+
+# entries the task and value stacks and the frames of the running calls may
+# hold together; recursion deeper than that is an error, not a crash
+STACK_SIZE = 10 ** 7
+
+# A task is a node to evaluate, or one of these steps, which is an int:
+# the step is pushed above the entries it takes (the node it is a step of,
+# then the nodes of its operands), and pops them when it runs.
+# kinds of the nodes, see NODE_KINDS
+VAR_NODE = 0
+CONSTANT_NODE = 1
+BINARY_NODE = 2
+COMPARE_NODE = 3
+CALL_NODE = 4
+IF_NODE = 5
+ASSIGN_NODE = 6
+SEQUENCE_NODE = 7
+RETURN_NODE = 8
+FOR_NODE = 9
+STR_NODE = 10
+UNARY_NODE = 11
+NOT_NODE = 12
+HOISTED_NODE = 13
+INLINED_NODE = 14
+DECLARATION_NODE = 15
+FUNCTION_NODE = 16
+BREAK_NODE = 17
+OR_NODE = 18
+AND_NODE = 19
+NONE_NODE = 20
+NO_NODE = 21
+# steps taken once the operands of a node are on the value stack
+BINARY = 22
+COMPARE = 23
+CALL = 24  # call the function below the arguments
+CALL_SYSTEM = 25
+RETURN = 26  # leave the running call with the topmost value
+TAIL = 27  # run the running call again with the arguments
+IF_TEST = 28  # node, index of the if block: enter it if the condition holds
+ASSIGN = 29
+DECLARE = 30
+LOOP_START = 31  # set the loop variable to the initial value
+LOOP_TEST = 32
+LOOP_STEP = 33  # after the block and the step of the loop variable
+CONCAT = 34
+POSITIVE = 35
+NEGATIVE = 36
+INVERT = 37
+OR_ELSE = 38  # node: evaluate the right operand if the left one is False
+AND_THEN = 39  # node: evaluate the right operand if the left one is True
+TEST_TRUE = 40  # replace the topmost value by whether it is True
+STORE_HOISTED = 41
+ENTER_INLINED = 42
+POP = 43
+
+NODE_KINDS = {
+    Var: VAR_NODE,
+    Num: CONSTANT_NODE,
+    Str: CONSTANT_NODE,
+    BooleanSymbol: CONSTANT_NODE,
+    BinOp: BINARY_NODE,
+    FunctionCall: CALL_NODE,
+    IfStat: IF_NODE,
+    Assign: ASSIGN_NODE,
+    Block: SEQUENCE_NODE,
+    Compound: SEQUENCE_NODE,
+    ReturnStat: RETURN_NODE,
+    ForLoop: FOR_NODE,
+    StrOp: STR_NODE,
+    UnaryOp: UNARY_NODE,
+    NotOp: NOT_NODE,
+    Hoisted: HOISTED_NODE,
+    Inlined: INLINED_NODE,
+    VarDecs: DECLARATION_NODE,
+    FunctionDecl: FUNCTION_NODE,
+    Break: BREAK_NODE,
+    BoolOr: OR_NODE,
+    BoolAnd: AND_NODE,
+    type(None): NONE_NODE,
+    NoOp: NO_NODE,
+}
+for _comparison in COMPARISONS:
+    NODE_KINDS[_comparison] = COMPARE_NODE
+
+OPERATORS = {
+    K_PLUS: operator.add,
+    K_MINUS: operator.sub,
+    K_MULT: operator.mul,
+    K_INTEGER_DIV: operator.floordiv,
+    K_FLOAT_DIV: operator.truediv,
+}
+
+
+class StacklessInterpreter:
+    """
+    Runs a tree checked by the SemanticAnalyzer without recursion in
+    python: the nodes still to evaluate and the steps to take after them
+    are tasks on a list, and the values of expressions are on a stack, so
+    a Dy call takes a few entries of these lists and no python frame.
+
+    Entering a function or a loop records the heights of the stacks, which
+    a return or a break cuts them back to. The stacks and the frames of the
+    running calls hold at most stack_size entries, which is what limits
+    the recursion of Dy code.
+
+    Only running the tree is iterative: the SemanticAnalyzer, the type
+    inference and the Optimizer still visit expressions recursively, so an
+    expression nested a few hundred levels deep, such as a sum of about 500
+    terms, raises a RecursionError before it reaches this engine.
+    """
+
+    def __init__(self, tree, memo_size=MEMO_SIZE, stack_size=STACK_SIZE):
+        self.tree = tree
+        self.source_index = getattr(tree, 'source_index', None)
+        self.stack_size = stack_size
+        self.display = []
+        # tasks of the statements of every block run so far
+        self.sequences = {}
+        # results of the pure functions
+        self.memos = Memos(memo_size)
+
+    def error(self, message, node=None):
+        raise InterpreterError(ErrorCode.INTERPRETER_ERROR, message, getattr(node, 'pos', None), self.source_index)
+
+    def can_not_assign_error(self, var_name, value, base_type, node=None):
+        self.error("can't assign {} to var {} as type of {} is {}".format(
+            to_string(value), var_name, var_name, base_type), node)
+
+    def sequence(self, node):
+        # tasks running the declarations and statements of a Block or a
+        # Compound in order, the values of calls popped
+        statements = node.get_children() if isinstance(node, Compound) \
+            else node.var_decs + node.compound_statement.get_children()
+        tasks = []
+        for statement in reversed(statements):
+            if isinstance(statement, (FunctionCall, Inlined)):
+                tasks.append(POP)
+            tasks.append(statement)
+        self.sequences[node] = tasks
+        return tasks
+
+    def run(self, program: Program):
+        display, error, sequences = self.display, self.error, self.sequences
+        memoize, stack_size = self.memos.size > 0, self.stack_size
+        frame = [UNDEFINED] * program.frame_size
+        display.append(frame)
+
+        tasks = [RETURN, None, program.block]
+        values = []
+        # [task height, value height, loop height, depth, frame the call
+        # replaced at its depth, frame of the caller, memo table, key, frame
+        # size, frames a call through a variable replaced below its depth]
+        # of the running calls, the program first
+        calls = [[0, 0, 0, 0, None, None, None, None, program.frame_size, None]]
+        # [task height, value height, iterations] of the running loops
+        loops = []
+        # entries of the frames of the running calls
+        slots = program.frame_size
+        add_task, next_task, push, pop = tasks.append, tasks.pop, values.append, values.pop
+
+        while tasks:
+            item = next_task()
+            kind = item if item.__class__ is int else NODE_KINDS[item.__class__]
+
+            if kind == VAR_NODE:
+                value = display[item.depth][item.slot]
+                if value is UNDEFINED:
+                    error("variable '" + item.value + "' is not defined", item)
+                push(value)
+            elif kind == CONSTANT_NODE:
+                push(item.value)
+            elif kind == BINARY_NODE:
+                left, right = item.left, item.right
+                if left.__class__ is Var and right.__class__ is Num:
+                    # a variable and a constant, the commonest operands, are
+                    # read in place
+                    value = display[left.depth][left.slot]
+                    if value is UNDEFINED:
+                        error("variable '" + left.value + "' is not defined", left)
+                    try:
+                        push(OPERATORS[item.op](value, right.value))
+                    except (ArithmeticError, TypeError) as ex:
+                        error(str(ex), item)
+                else:
+                    tasks += item, BINARY, right, left
+            elif kind == BINARY:
+                node = next_task()
+                right = pop()
+                try:
+                    values[-1] = OPERATORS[node.op](values[-1], right)
+                except (ArithmeticError, TypeError) as ex:
+                    # e.g. division by zero or an operand of a wrong type
+                    error(str(ex), node)
+            elif kind == ASSIGN_NODE:
+                tasks += item, ASSIGN, item.right
+            elif kind == ASSIGN:
+                node = next_task()
+                value = pop()
+                var = node.left
+                target = display[var.depth]
+                if target[var.slot] is UNDEFINED:
+                    error(f"value {var.value} is not defined", var)
+                # type checking, unless the semantic analyzer proved the value valid
+                if node.guarded and not is_val_of_type(value, node.type):
+                    self.can_not_assign_error(var.value, value, node.type, var)
+                target[var.slot] = value
+            elif kind == SEQUENCE_NODE:
+                sequence = sequences.get(item)
+                tasks += sequence if sequence is not None else self.sequence(item)
+            elif kind == COMPARE_NODE:
+                left, right = item.left, item.right
+                if left.__class__ is Var and right.__class__ is Num:
+                    value = display[left.depth][left.slot]
+                    if value is UNDEFINED:
+                        error("variable '" + left.value + "' is not defined", left)
+                    push(comparison(item)(value, right.value))
+                else:
+                    tasks += item, COMPARE, right, left
+            elif kind == COMPARE:
+                node = next_task()
+                right = pop()
+                values[-1] = comparison(node)(values[-1], right)
+            elif kind == FOR_NODE:
+                for scope in (item.scope, item.invariants):
+                    if scope:
+                        frame[scope.start:scope.stop] = [UNDEFINED] * len(scope)
+                tasks += item, LOOP_START, item.base.right
+            elif kind == LOOP_START:
+                node = next_task()
+                # the loop variable has a slot of its own
+                value = frame[node.base.left.slot] = pop()
+                for slot, factor, _ in node.inductions:
+                    frame[slot] = value * factor
+                loops.append([len(tasks), len(values), 0])
+                tasks += node, LOOP_TEST, node.bool_expr
+            elif kind == LOOP_TEST:
+                node = next_task()
+                if pop() is True:
+                    tasks += node, LOOP_STEP, node.then, node.block
+                else:
+                    loops.pop()
+            elif kind == LOOP_STEP:
+                node = next_task()
+                for slot, _, step in node.inductions:
+                    frame[slot] += step
+                loop = loops[-1]
+                loop[2] += 1
+                if loop[2] + 1 > MAX_INT:
+                    error("too much calls from while")
+                tasks += node, LOOP_TEST, node.bool_expr
+            elif kind == CALL_NODE:
+                if item.slot is None:
+                    # system function call
+                    tasks += item, CALL_SYSTEM
+                else:
+                    closure = display[item.depth][item.slot]
+                    if closure.__class__ is not Closure:
+                        error("no such function: " + item.name, item)
+                    push(closure)
+                    tasks += item, CALL
+                tasks.extend(reversed(item.actual_params))
+            elif kind == CALL:
+                node = next_task()
+                argc = len(node.actual_params)
+                start = len(values) - argc
+                closure = values[start - 1]
+                function = closure.function
+                # parameters are the first slots of the new frame
+                callee = [UNDEFINED] * function.frame_size
+                callee[:argc] = values[start:]
+                del values[start - 1:]
+
+                guards = node.guards
+                if guards is None:
+                    # a function stored in a variable
+                    guards = parameter_guards(function, argc)
+                for index, param_type in guards:
+                    if not is_val_of_type(callee[index], param_type):
+                        self.can_not_assign_error(function.params[index].name, callee[index], param_type, node)
+
+                table = key = None
+                if function.pure and memoize:
+                    table = self.memos.table(function)
+                    key = table.key(callee[:argc])
+                    value = table.get(key)
+                    if value is not MISSING:
+                        push(value)
+                        continue
+
+                slots += function.frame_size
+                if len(tasks) + len(values) + slots > stack_size:
+                    error(f"maximum recursion depth exceeded, the stacks hold more than {stack_size} entries", node)
+                # called from any scope, a function stored in a variable runs
+                # in the ones it was declared in
+                frames = enter_closure(display, closure) if node.guards is None else None
+                depth = function.depth
+                if depth == len(display):
+                    display.append(None)
+                calls.append([len(tasks), len(values), len(loops), depth, display[depth], frame, table, key,
+                              function.frame_size, frames])
+                display[depth] = frame = callee
+                # a body ending without a return returns None
+                tasks += RETURN, None, function.block
+            elif kind == IF_NODE:
+                if item.if_blocks:
+                    tasks += item, 0, IF_TEST, item.if_blocks[0].expr
+                elif item.else_block is not None:
+                    add_task(item.else_block)
+            elif kind == IF_TEST:
+                index = next_task()
+                node = next_task()
+                if pop() is True:
+                    if_block = node.if_blocks[index]
+                    scope = if_block.scope
+                    if scope:
+                        # declarations of a block start undefined every time it is entered
+                        frame[scope.start:scope.stop] = [UNDEFINED] * len(scope)
+                    add_task(if_block.block)
+                elif index + 1 < len(node.if_blocks):
+                    tasks += node, index + 1, IF_TEST, node.if_blocks[index + 1].expr
+                elif node.else_block is not None:
+                    add_task(node.else_block)
+            elif kind == POP:
+                pop()
+            elif kind == RETURN_NODE:
+                call = item.base_expr
+                if call.__class__ is FunctionCall and call.tail is not None \
+                        and function_of(display[call.depth][call.slot]) is call.tail:
+                    # a call of the running function itself runs in its frame
+                    tasks += call, TAIL
+                    tasks.extend(reversed(call.actual_params))
+                else:
+                    tasks += RETURN, call
+            elif kind == RETURN:
+                value = pop()
+                task_height, value_height, loop_height, depth, previous, frame, table, key, size, frames = calls.pop()
+                del tasks[task_height:]
+                del values[value_height:]
+                del loops[loop_height:]
+                display[depth] = previous
+                if frames is not None:
+                    leave_closure(display, frames)
+                slots -= size
+                if table is not None:
+                    table.put(key, value)
+                push(value)
+            elif kind == TAIL:
+                node = next_task()
+                function = node.tail
+                argc = len(node.actual_params)
+                arguments = values[len(values) - argc:]
+                for index, param_type in node.guards:
+                    if not is_val_of_type(arguments[index], param_type):
+                        self.can_not_assign_error(function.params[index].name, arguments[index], param_type, node)
+
+                task_height, value_height, loop_height = calls[-1][:3]
+                del tasks[task_height:]
+                del values[value_height:]
+                del loops[loop_height:]
+                # a new frame, as closures declared by the previous run keep theirs
+                display[function.depth] = frame = [*arguments, *[UNDEFINED] * (function.frame_size - argc)]
+                tasks += RETURN, None, function.block
+            elif kind == BREAK_NODE:
+                if not loops:
+                    error("Break is used outside of for-loop (0 len)")
+                task_height, value_height, _ = loops.pop()
+                # a break outside of the loops of a function stops the loop
+                # it was called from, leaving the calls in between
+                while calls[-1][0] > task_height:
+                    _, _, _, depth, previous, frame, _, _, size, frames = calls.pop()
+                    display[depth] = previous
+                    if frames is not None:
+                        leave_closure(display, frames)
+                    slots -= size
+                del tasks[task_height:]
+                del values[value_height:]
+            elif kind == STR_NODE:
+                tasks += item, CONCAT, item.right, item.left
+            elif kind == CONCAT:
+                node = next_task()
+                right = pop()
+                left = values[-1]
+                if type(left) is not str or type(right) is not str:
+                    error("can only concatenate string and string", node)
+                values[-1] = left + right
+            elif kind == UNARY_NODE:
+                tasks += POSITIVE if item.op == K_PLUS else NEGATIVE, item.expr
+            elif kind == POSITIVE:
+                values[-1] = +values[-1]
+            elif kind == NEGATIVE:
+                values[-1] = -values[-1]
+            elif kind == NOT_NODE:
+                tasks += INVERT, item.expr
+            elif kind == INVERT:
+                values[-1] = not_bool(values[-1])
+            elif kind == OR_NODE:
+                tasks += item, OR_ELSE, item.left
+            elif kind == OR_ELSE:
+                node = next_task()
+                value = values[-1]
+                if value is False:
+                    pop()
+                    tasks += TEST_TRUE, node.right
+                elif value is not True:
+                    # operands that are not booleans are false
+                    values[-1] = False
+            elif kind == AND_NODE:
+                tasks += item, AND_THEN, item.left
+            elif kind == AND_THEN:
+                node = next_task()
+                if values[-1] is True:
+                    pop()
+                    tasks += TEST_TRUE, node.right
+                else:
+                    values[-1] = False
+            elif kind == TEST_TRUE:
+                values[-1] = values[-1] is True
+            elif kind == HOISTED_NODE:
+                value = frame[item.slot]
+                if value is UNDEFINED:
+                    tasks += item, STORE_HOISTED, item.expr
+                else:
+                    push(value)
+            elif kind == STORE_HOISTED:
+                frame[next_task().slot] = values[-1]
+            elif kind == INLINED_NODE:
+                call = item.call
+                if function_of(display[call.depth][call.slot]) is not item.function:
+                    # the function is not declared yet
+                    add_task(call)
+                else:
+                    tasks += item, ENTER_INLINED
+                    tasks.extend(reversed(call.actual_params))
+            elif kind == ENTER_INLINED:
+                node = next_task()
+                call = node.call
+                start = len(values) - len(call.actual_params)
+                for slot, value in zip(node.slots, values[start:]):
+                    frame[slot] = value
+                del values[start:]
+                for index, param_type in call.guards:
+                    value = frame[node.slots[index]]
+                    if not is_val_of_type(value, param_type):
+                        self.can_not_assign_error(node.function.params[index].name, value, param_type, call)
+                add_task(node.expr)
+            elif kind == CALL_SYSTEM:
+                node = next_task()
+                start = len(values) - len(node.actual_params)
+                arguments = values[start:]
+                del values[start:]
+                push(call_system_function(node.name, *arguments))
+            elif kind == DECLARATION_NODE:
+                tasks += item, DECLARE, item.get_value()
+            elif kind == DECLARE:
+                node = next_task()
+                value = pop()
+                if value is not None and node.guarded and not is_val_of_type(value, node.get_type()):
+                    self.can_not_assign_error(node.get_var_names(), value, node.get_type(), node)
+                for slot in node.slots:
+                    frame[slot] = value
+            elif kind == FUNCTION_NODE:
+                frame[item.slot] = Closure(item, display[:item.depth])
+            elif kind == NONE_NODE:
+                push(None)
+            elif kind != NO_NODE:
+                error(f"unknown task {kind}")
+
+    def interpret(self):
+        try:
+            self.run(self.tree)
+        finally:
+            self.display.clear()
@@ -0,0 +1,99 @@
+from itertools import islice
+from sys import maxsize
+
+from utils.constants import EOF, K_EOF
+from utils.data_classes import Token
+
+# tokens read from a source at a time
+PULL_SIZE = 1024
+# tokens behind the cursor are dropped from the buffer once there are this many
+TRIM_SIZE = 4096
+
+
+class TokenBuffer:
+    """
+    Tokens of a source read through an integer cursor.
+
+    Lookahead is an index into the buffer, so no token is ever lexed twice.
+
+    A list of tokens is kept whole, and the cursor can be reset to any of
+    them. Tokens of any other iterable, such as the generator of a
+    (Stream)Lexer, are pulled when the cursor or a lookahead reaches them,
+    and the ones behind the cursor are dropped: parsing a large source
+    holds a window of its tokens, not all of them.
+    """
+
+    def __init__(self, tokens):
+        if isinstance(tokens, list):
+            # a list is used as is, so its owner can keep editing it
+            if len(tokens) == 0 or tokens[-1].kind != K_EOF:
+                tokens.append(Token(K_EOF, EOF))
+            self._tokens, self._source = tokens, None
+            self._trim_at = maxsize
+        else:
+            self._tokens, self._source = [], iter(tokens)
+            self._trim_at = TRIM_SIZE
+        # position of _tokens[0] among all the tokens of the source, and the
+        # cursor, an index into _tokens
+        self._base = 0
+        self._index = 0
+        self._end = len(self._tokens)
+        if self._end == 0:
+            self._pull()
+
+    def _pull(self):
+        # reads more tokens from the source, if it did not end yet
+        source = self._source
+        if source is None:
+            return
+        tokens = self._tokens
+        tokens.extend(islice(source, PULL_SIZE))
+        if len(tokens) == self._end:
+            # the source ended without an EOF token
+            tokens.append(Token(K_EOF, EOF))
+        if tokens[-1].kind == K_EOF:
+            self._source = None
+        self._end = len(tokens)
+
+    def _trim(self):
+        # drops the tokens behind the cursor
+        count = self._index
+        del self._tokens[:count]
+        self._base += count
+        self._index = 0
+        self._end -= count
+
+    def get_position(self):
+        return self._base + self._index
+
+    def get_current_token(self) -> Token:
+        return self._tokens[self._index]
+
+    def peek(self, offset=1) -> Token:
+        # tokens past the end of the source are all EOF
+        index = self._index + offset
+        while index >= self._end:
+            if self._source is None:
+                return self._tokens[-1]
+            self._pull()
+        return self._tokens[index]
+
+    def go_forward(self):
+        index = self._index + 1
+        if index >= self._end:
+            self._pull()
+            if index >= self._end:
+                # the cursor stays on EOF
+                return
+        self._index = index
+        if index >= self._trim_at:
+            self._trim()
+
+    def reset(self, position: int):
+        # moves the cursor to the token at a position of get_position()
+        if position < self._base:
+            raise ValueError(f'token {position} was dropped from the buffer')
+        self._index = position - self._base
+
+    def is_exhausted(self):
+        return self._tokens[self._index].kind == K_EOF
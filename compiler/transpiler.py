@@ -0,0 +1,704 @@
+import math
+import operator
+
+from compiler.comparisons import COMPARISONS, comparison
+from compiler.memo import Memos, MEMO_SIZE
+from compiler.scopes import UNDEFINED
+from compiler.signals import BreakOut
+from compiler.type_inference import parameter_guards
+from compiler.walker import ProgramWalker, map_operands
+from system.builtin_functions.main import *
+from utils.constants import *
+from utils.data_classes import *
+from utils.errors import InterpreterError, ErrorCode
+
+OPERATORS = {
+    K_PLUS: '+',
+    K_MINUS: '-',
+    K_MULT: '*',
+    K_INTEGER_DIV: '//',
+    K_FLOAT_DIV: '/',
+}
+
+# comparison functions written as python operators
+SYMBOLS = {
+    operator.eq: '==',
+    operator.ne: '!=',
+    operator.is_: 'is',
+    operator.is_not: 'is not',
+    operator.gt: '>',
+    operator.ge: '>=',
+    operator.lt: '<',
+    operator.le: '<=',
+}
+
+# the other ones, called by name
+COMPARISON_FUNCTIONS = {function.__name__: function for functions in COMPARISONS.values()
+                        for function in functions.values() if function not in SYMBOLS}
+
+# nodes whose value is always a bool
+BOOLEANS = (BoolOp, NotOp, BooleanSymbol)
+
+# file name of the generated code, which tells its frames in a traceback
+FILENAME = '<dy>'
+
+
+class Failure(Exception):
+    # runtime error raised by the generated code, located by the source map
+    # at the instruction that raised it, or at no position at all
+    def __init__(self, message, located=True):
+        super().__init__(message)
+        self.message = message
+        self.located = located
+
+
+def dy_value(value):
+    # functions are shown as their FunctionDecl, as the Closures of the
+    # other engines are
+    return getattr(value, 'declaration', value)
+
+
+def can_not_assign(var_name, value, base_type):
+    return "can't assign {} to var {} as type of {} is {}".format(
+        to_string(dy_value(value)), var_name, var_name, base_type)
+
+
+def checked(value, base_type, var_name):
+    if not is_val_of_type(value, base_type):
+        raise Failure(can_not_assign(var_name, value, base_type))
+    return value
+
+
+def declared(value, base_type, var_names):
+    if value is not None and not is_val_of_type(value, base_type):
+        raise Failure(can_not_assign(var_names, value, base_type))
+    return value
+
+
+def checked_arguments(values, guards, function):
+    # guards are (index, type) of the parameters of function to check
+    for index, param_type in guards:
+        if not is_val_of_type(values[index], param_type):
+            raise Failure(can_not_assign(function.declaration.params[index].name, values[index], param_type))
+    return values
+
+
+def call(function, name, *args):
+    # call of a function stored in a variable
+    declaration = getattr(function, 'declaration', None)
+    if not isinstance(declaration, FunctionDecl):
+        raise Failure("no such function: " + name)
+    return function(*checked_arguments(args, parameter_guards(declaration, len(args)), function))
+
+
+def concat(left, right):
+    if type(left) is not str or type(right) is not str:
+        raise Failure("can only concatenate string and string")
+    return left + right
+
+
+def fail(message):
+    raise Failure(message, False)
+
+
+def break_out():
+    raise BreakOut()
+
+
+def system_function(name):
+    function = get_system_function(name)
+    return lambda *args: function(*map(dy_value, args))
+
+
+def memoizer(memos: Memos):
+    def memoized(function):
+        # function, or the cache of its results if memoization is enabled;
+        # the functions declared again keep the cache of the first one, as
+        # they depend on their arguments only
+        if not memos.size:
+            return function
+        return memos.get(function.declaration) or memos.add(function.declaration, function)
+    return memoized
+
+
+def namespace(functions, memos: Memos):
+    # globals of the generated code, which reads the FunctionDecls of the
+    # program from functions
+    names = {name: globals()[name] for name in (
+        'UNDEFINED', 'MAX_INT', 'checked', 'declared', 'checked_arguments', 'call', 'concat', 'fail',
+        'break_out', 'BreakOut', 'not_bool')}
+    names.update(COMPARISON_FUNCTIONS)
+    names['__builtins__'] = {'float': float}
+    names['functions'] = functions
+    names['memoized'] = memoizer(memos)
+    for name in dir(BuiltinFunctions):
+        if not name.startswith('_'):
+            names['system_' + name] = system_function(name)
+    return names
+
+
+class Captures(ProgramWalker):
+    """
+    Variables and functions used by functions nested in the one they belong
+    to, as (function, slot) -> name.
+    """
+
+    def __init__(self, tree: Program):
+        super().__init__(tree)
+        # Program and FunctionDecls enclosing the visited statements by depth
+        self.enclosing = [tree]
+        self.captured = {}
+
+    def capture(self, depth, slot, name):
+        if depth < self.depth:
+            self.captured[self.enclosing[depth], slot] = name
+
+    def expression(self, node):
+        if isinstance(node, Var):
+            self.capture(node.depth, node.slot, node.value)
+        elif isinstance(node, FunctionCall) and node.slot is not None:
+            self.capture(node.depth, node.slot, node.name)
+        elif isinstance(node, Inlined):
+            self.capture(node.call.depth, node.call.slot, node.call.name)
+            self.expression(node.expr)
+        return map_operands(node, self.expression)
+
+    def visit_Assign(self, node: Assign):
+        self.capture(node.left.depth, node.left.slot, node.left.value)
+        return super().visit_Assign(node)
+
+    def visit_FunctionDecl(self, node: FunctionDecl):
+        self.enclosing.append(node)
+        super().visit_FunctionDecl(node)
+        self.enclosing.pop()
+        return node
+
+
+class Line:
+    __slots__ = ('level', 'text', 'spans')
+
+    def __init__(self, level, text, spans):
+        self.level = level
+        self.text = text
+        # (start, end, node) of the text generated from a node
+        self.spans = spans
+
+
+class SourceMap:
+    """
+    Nodes the code on every line of the generated source was generated
+    from, by column, used to find the .dy position of the instruction a
+    python traceback stops at.
+    """
+
+    def __init__(self, lines, source_index=None):
+        self.source_index = source_index
+        # line number -> spans, with columns of the line as it is indented
+        self.spans = {number: [(line.level * 4 + start, line.level * 4 + end, node)
+                               for start, end, node in line.spans]
+                      for number, line in enumerate(lines, 1) if line.spans}
+
+    def node_at(self, lineno, column, end_column):
+        # innermost node whose code contains the given columns of a line
+        found = None
+        for start, end, node in self.spans.get(lineno, ()):
+            if start <= column and end_column <= end and (found is None or end - start <= found[1] - found[0]):
+                found = start, end, node
+        return found[2] if found is not None else None
+
+    def node_of_line(self, lineno):
+        # outermost node of a line, the statement it was generated from
+        found = None
+        for start, end, node in self.spans.get(lineno, ()):
+            if found is None or end - start > found[1] - found[0]:
+                found = start, end, node
+        return found[2] if found is not None else None
+
+    def node_of(self, tb):
+        # node of the instruction a traceback entry of generated code stops at
+        code = tb.tb_frame.f_code
+        if not hasattr(code, 'co_positions'):
+            # python before 3.11 has the line of an instruction, not its columns
+            return self.node_of_line(tb.tb_lineno)
+        positions = list(code.co_positions())[tb.tb_lasti // 2]
+        lineno, _, column, end_column = positions
+        if lineno is None:
+            return self.node_of_line(tb.tb_lineno)
+        if column is None:
+            return self.node_of_line(lineno)
+        return self.node_at(lineno, column, end_column)
+
+    def frames(self, tb):
+        # traceback entries of generated code, outermost first
+        while tb is not None:
+            if tb.tb_frame.f_code.co_filename == FILENAME:
+                yield tb
+            tb = tb.tb_next
+
+    def positions(self, tb):
+        # (line, column) in the .dy source of every generated frame of a
+        # traceback, outermost first
+        positions = []
+        for entry in self.frames(tb):
+            node = self.node_of(entry)
+            pos = getattr(node, 'pos', None)
+            if pos is not None and self.source_index is not None:
+                positions.append(self.source_index.line_and_column(pos))
+            else:
+                positions.append(None)
+        return positions
+
+
+class PythonTranspiler(NodeVisitor):
+    """
+    Runs a tree checked by the SemanticAnalyzer by translating it to python
+    source, which is compiled with compile() and run natively.
+
+    The program and every function become python functions; a variable is
+    a local of the function of its depth, which functions nested in it use
+    as a free variable. A variable that is not defined yet is an unbound
+    local, which python refuses to read, the same way the frame slot holding
+    UNDEFINED is refused by the other engines. Type checks, comparisons and
+    string concatenation call the same builtins as the interpreter, but
+    comparisons of operands of a known type are python operators. Runtime
+    errors are reported at the .dy position the SourceMap finds for the
+    python instruction that failed.
+    """
+
+    def __init__(self, tree: Program, memo_size=MEMO_SIZE):
+        self.tree = tree
+        self.source_index = getattr(tree, 'source_index', None)
+        # results of the pure functions
+        self.memos = Memos(memo_size)
+        self.lines = []
+        self.level = 0
+        # text and spans of the line being generated
+        self.parts = []
+        self.column = 0
+        self.spans = []
+        self.depth = 0
+        # Program or FunctionDecl being generated
+        self.function = tree
+        # index of the def line of the function being generated and the
+        # variables of enclosing functions it assigns
+        self.function_line = None
+        self.nonlocals = None
+        # whether the code being generated is in a loop of its function,
+        # and whether it calls functions of the program
+        self.in_loop = False
+        self.calls = False
+        self.loops = 0
+        self.captured = {}
+        # FunctionDecls of the generated functions
+        self.declarations = []
+        self.source_map = None
+
+    def error(self, message, node=None):
+        raise InterpreterError(ErrorCode.INTERPRETER_ERROR, message, getattr(node, 'pos', None), self.source_index)
+
+    def write(self, text):
+        self.parts.append(text)
+        self.column += len(text)
+
+    def mark(self, start, node):
+        # the text written since column start was generated from node
+        self.spans.append((start, self.column, node))
+
+    def end_line(self):
+        self.lines.append(Line(self.level, ''.join(self.parts), self.spans))
+        self.parts, self.column, self.spans = [], 0, []
+
+    def line(self, text):
+        self.write(text)
+        self.end_line()
+
+    def name(self, name, depth, slot):
+        # python name of a frame slot
+        if not name.isidentifier() or not name.isascii():
+            name = 'tmp'
+        return f'{name}_{depth}_{slot}'
+
+    def var_name(self, node: Var):
+        return self.name(node.value, node.depth, node.slot)
+
+    def body(self, node):
+        # statements of a block, indented
+        self.level += 1
+        start = len(self.lines)
+        self.visit(node)
+        if len(self.lines) == start:
+            self.line('pass')
+        self.level -= 1
+
+    def unbind(self, scope):
+        # slots of a block read by nested functions are unbound every time
+        # it is entered, as the other engines reset them to UNDEFINED
+        for slot in scope or ():
+            if (self.function, slot) in self.captured:
+                name = self.name(self.captured[self.function, slot], self.depth, slot)
+                self.line(f'{name} = UNDEFINED; del {name}')
+
+    def visit_BinOp(self, node: BinOp):
+        self.write('(')
+        start = self.column
+        self.visit(node.left)
+        self.write(f' {OPERATORS[node.op]} ')
+        self.visit(node.right)
+        self.mark(start, node)
+        self.write(')')
+
+    def visit_UnaryOp(self, node: UnaryOp):
+        self.write('(+' if node.op == K_PLUS else '(-')
+        self.visit(node.expr)
+        self.write(')')
+
+    def visit_Num(self, node: Num):
+        value = node.value
+        if isinstance(value, float) and not math.isfinite(value):
+            self.write(f"float('{value}')")
+        elif value < 0:
+            self.write(f'({value!r})')
+        else:
+            self.write(repr(value))
+
+    def visit_Str(self, node):
+        self.write(ascii(node.value))
+
+    def visit_BooleanSymbol(self, node: BooleanSymbol):
+        self.write(repr(node.value))
+
+    def visit_NoneType(self, node):
+        self.write('None')
+
+    def visit_StrOp(self, node: StrOp):
+        start = self.column
+        self.write('concat(')
+        self.visit(node.left)
+        self.write(', ')
+        self.visit(node.right)
+        self.write(')')
+        self.mark(start, node)
+
+    def visit_NotOp(self, node: NotOp):
+        self.write('not_bool(')
+        self.visit(node.expr)
+        self.write(')')
+
+    def visit_BoolOp(self, node: BoolOp):
+        # comparisons of operands of a known type are python operators
+        function = comparison(node)
+        symbol = SYMBOLS.get(function)
+        if symbol is not None:
+            self.write('(')
+            self.visit(node.left)
+            self.write(f' {symbol} ')
+            self.visit(node.right)
+        else:
+            self.write(function.__name__ + '(')
+            self.visit(node.left)
+            self.write(', ')
+            self.visit(node.right)
+        self.write(')')
+
+    visit_BoolNotEqual = visit_BoolGreaterThan = visit_BoolGreaterThanOrEqual = visit_BoolOp
+    visit_BoolLessThan = visit_BoolLessThanOrEqual = visit_BoolIsEqual = visit_BoolOp
+
+    def visit_BoolOr(self, node: BoolOr):
+        self.write('(')
+        if isinstance(node.left, BOOLEANS):
+            self.visit(node.left)
+            self.write(' or ')
+        else:
+            # operand holds the left value until it is tested, before the
+            # right one is evaluated
+            self.write('True if (operand := ')
+            self.visit(node.left)
+            self.write(') is True else operand is False and ')
+        self.truth(node.right)
+        self.write(')')
+
+    def visit_BoolAnd(self, node: BoolAnd):
+        self.write('(')
+        self.truth(node.left)
+        self.write(' and ')
+        self.truth(node.right)
+        self.write(')')
+
+    def truth(self, node):
+        # expression that is True if the value of node is True, else False:
+        # values that are not booleans are false
+        if isinstance(node, (Num, Str)):
+            self.write('False')
+            return
+        self.visit(node)
+        if not isinstance(node, BOOLEANS):
+            self.write(' is True')
+
+    def visit_Var(self, node: Var):
+        start = self.column
+        self.write(self.var_name(node))
+        self.mark(start, node)
+
+    def visit_Hoisted(self, node: Hoisted):
+        name = self.name('tmp', self.depth, node.slot)
+        self.write(f'({name} if {name} is not UNDEFINED else ({name} := ')
+        self.visit(node.expr)
+        self.write('))')
+
+    def visit_Assign(self, node: Assign):
+        var = node.left
+        name = self.var_name(var)
+        if var.depth < self.depth:
+            self.nonlocals.add(name)
+
+        self.write(name + ' = ')
+        start = self.column
+        if node.guarded:
+            self.write('checked(')
+        if var.depth != self.depth:
+            # the variable has to be defined, which a local of this function is
+            self.write('(')
+            self.visit(node.right)
+            self.write(', ')
+            defined = self.column
+            self.write(name)
+            self.mark(defined, node)
+            self.write(')[0]')
+        else:
+            self.visit(node.right)
+        if node.guarded:
+            self.write(f', {node.type!r}, {var.value!r})')
+            self.mark(start, node)
+        self.end_line()
+
+    def visit_VarDecs(self, node: VarDecs):
+        for slot, name in zip(node.slots, node.variables):
+            self.write(self.name(name, self.depth, slot) + ' = ')
+        start = self.column
+        if node.guarded:
+            self.write('declared(')
+        self.visit(node.get_value())
+        if node.guarded:
+            self.write(f', {node.get_type()!r}, {node.get_var_names()!r})')
+            self.mark(start, node)
+        self.end_line()
+
+    def visit_Block(self, node: Block):
+        for declaration in node.var_decs:
+            self.visit(declaration)
+        self.visit(node.compound_statement)
+
+    def visit_Compound(self, node: Compound):
+        for child in node.get_children():
+            self.visit(child)
+            if isinstance(child, (FunctionCall, Inlined)):
+                self.end_line()
+
+    def visit_NoOp(self, node):
+        pass
+
+    def visit_Program(self, node: Program):
+        self.function_line, self.nonlocals = None, set()
+        self.line('def program():')
+        self.body(node.block)
+
+    def visit_FunctionDecl(self, node: FunctionDecl):
+        name = self.name(node.name, self.depth, node.slot)
+        params = [self.name(param.name, node.depth, slot) for slot, param in enumerate(node.params)]
+
+        state = self.depth, self.function, self.function_line, self.nonlocals, self.in_loop, self.calls, self.loops
+        self.depth, self.function, self.function_line, self.nonlocals = node.depth, node, len(self.lines), set()
+        self.in_loop, self.loops = False, 0
+        self.line(f'def {name}({", ".join(params)}):')
+        self.body(node.block)
+        if self.nonlocals:
+            self.level += 1
+            self.line(f'nonlocal {", ".join(sorted(self.nonlocals))}')
+            self.level -= 1
+            self.lines.insert(self.function_line + 1, self.lines.pop())
+        self.depth, self.function, self.function_line, self.nonlocals, self.in_loop, self.calls, self.loops = state
+
+        self.line(f'{name}.declaration = functions[{len(self.declarations)}]')
+        self.declarations.append(node)
+        if node.pure:
+            self.line(f'{name} = memoized({name})')
+
+    def arguments(self, params):
+        for index, param in enumerate(params):
+            if index:
+                self.write(', ')
+            self.visit(param)
+
+    def visit_FunctionCall(self, node: FunctionCall):
+        start = self.column
+        if node.slot is None:
+            # system function call
+            self.write(f'system_{node.name}(')
+            self.arguments(node.actual_params)
+            self.write(')')
+            return
+
+        self.calls = True
+        name = self.name(node.name, node.depth, node.slot)
+        if node.guards is None:
+            # a function stored in a variable
+            self.write(f'call({name}, {node.name!r}')
+            for param in node.actual_params:
+                self.write(', ')
+                self.visit(param)
+            self.write(')')
+        elif node.guards:
+            self.write(f'{name}(*checked_arguments((')
+            self.arguments(node.actual_params)
+            self.write(f'{"," if len(node.actual_params) == 1 else ""}), {tuple(node.guards)!r}, {name}))')
+        else:
+            self.write(name + '(')
+            self.arguments(node.actual_params)
+            self.write(')')
+        self.mark(start, node)
+
+    def visit_Inlined(self, node: Inlined):
+        # the arguments are kept in slots of this frame; reading the function
+        # fails as the call would if it is not declared yet
+        call = node.call
+        self.calls = True
+        function = self.name(call.name, call.depth, call.slot)
+        self.write('(')
+        start = self.column
+        self.write(function)
+        self.mark(start, call)
+        names = [self.name(param.name, self.depth, slot) for slot, param in zip(node.slots, node.function.params)]
+        for name, param in zip(names, call.actual_params):
+            self.write(f', ({name} := ')
+            self.visit(param)
+            self.write(')')
+        if call.guards:
+            self.write(', ')
+            start = self.column
+            self.write(f'checked_arguments(({", ".join(names)},), {tuple(call.guards)!r}, {function})')
+            self.mark(start, call)
+        self.write(', ')
+        self.visit(node.expr)
+        self.write(')[-1]')
+
+    def visit_IfStat(self, node: IfStat):
+        if not node.if_blocks:
+            # every condition was false when optimized
+            self.visit(node.else_block)
+            return
+        for index, if_block in enumerate(node.if_blocks):
+            self.write('if ' if index == 0 else 'elif ')
+            self.truth(if_block.expr)
+            self.line(':')
+            self.level += 1
+            self.unbind(if_block.scope)
+            self.level -= 1
+            self.body(if_block.block)
+        if node.else_block is not None:
+            self.line('else:')
+            self.body(node.else_block)
+
+    def visit_Break(self, node: Break):
+        self.line('break' if self.in_loop else 'break_out()')
+
+    def visit_ReturnStat(self, node: ReturnStat):
+        self.write('return ')
+        self.visit(node.base_expr)
+        self.end_line()
+
+    def visit_ForLoop(self, node: ForLoop):
+        self.unbind(node.scope)
+        for slot in node.invariants or ():
+            self.line(self.name('tmp', self.depth, slot) + ' = UNDEFINED')
+        var = node.base.left
+        var_name = self.var_name(var)
+        self.write(var_name + ' = ')
+        self.visit(node.base.right)
+        self.end_line()
+        for slot, factor, _ in node.inductions:
+            self.line(f'{self.name("tmp", self.depth, slot)} = {var_name} * {factor}')
+
+        count = f'count_{self.loops}'
+        self.loops += 1
+        self.line(count + ' = 0')
+        start = len(self.lines)
+        state = self.in_loop, self.calls
+        self.in_loop, self.calls = True, False
+
+        self.write('while ')
+        self.truth(node.bool_expr)
+        self.line(':')
+        self.body(node.block)
+        self.level += 1
+        self.visit(node.then)
+        for slot, _, step in node.inductions:
+            self.line(f'{self.name("tmp", self.depth, slot)} += {step}')
+        self.line(count + ' += 1')
+        self.line(f'if {count} + 1 > MAX_INT:')
+        self.level += 1
+        self.line("fail('too much calls from while')")
+        self.level -= 2
+
+        if self.calls:
+            # break in a function called from the loop
+            for line in self.lines[start:]:
+                line.level += 1
+            self.lines.insert(start, Line(self.level, 'try:', []))
+            self.line('except BreakOut:')
+            self.level += 1
+            self.line('pass')
+            self.level -= 1
+        self.in_loop, self.calls = state[0], state[1] or self.calls
+
+    def transpile(self):
+        # python source of the program, and its SourceMap
+        captures = Captures(self.tree)
+        captures.visit(self.tree)
+        self.captured = captures.captured
+
+        self.visit(self.tree)
+        source = '\n'.join('    ' * line.level + line.text for line in self.lines) + '\n'
+        self.source_map = SourceMap(self.lines, self.source_index)
+        return source
+
+    def compile(self):
+        return compile(self.transpile(), FILENAME, 'exec')
+
+    def interpret(self):
+        names = namespace(self.declarations, self.memos)
+        exec(self.compile(), names)
+
+        try:
+            names['program']()
+        except BreakOut:
+            self.error("Break is used outside of for-loop (0 len)")
+        except Failure as ex:
+            node = None
+            if ex.located:
+                entries = list(self.source_map.frames(ex.__traceback__))
+                node = self.source_map.node_of(entries[-1]) if entries else None
+                if isinstance(node, Assign):
+                    node = node.left
+            self.error(ex.message, node)
+        except (NameError, ArithmeticError, TypeError) as ex:
+            self.native_error(ex)
+
+    def native_error(self, ex):
+        # error raised by an instruction of the generated code itself, as
+        # the other engines report it
+        tb = ex.__traceback__
+        while tb.tb_next is not None:
+            tb = tb.tb_next
+        node = self.source_map.node_of(tb) if tb.tb_frame.f_code.co_filename == FILENAME else None
+
+        if isinstance(ex, NameError):
+            if isinstance(node, Var):
+                self.error("variable '" + node.value + "' is not defined", node)
+            if isinstance(node, Assign):
+                self.error(f"value {node.left.value} is not defined", node.left)
+        if isinstance(ex, (NameError, TypeError)) and isinstance(node, FunctionCall):
+            self.error("no such function: " + node.name, node)
+        if isinstance(ex, (ArithmeticError, TypeError)) and isinstance(node, BinOp):
+            # e.g. division by zero or an operand of a wrong type
+            self.error(str(ex), node)
+        raise ex
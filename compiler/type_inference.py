@@ -0,0 +1,99 @@
+from utils.constants import K_PLUS, K_MULT, K_FLOAT_DIV, INTEGER, FLOAT, STRING, BOOLEAN
+
+# Types the semantic analyzer infers for expressions. An expression that can
+# not be typed statically (a function call, an untyped parameter, ...) has
+# the type None.
+#
+# Lowercase types are the python type of every value the expression can
+# evaluate to; it never evaluates to None.
+INT = 'integer'
+REAL_NUMBER = 'float'
+NUMBER = 'number'  # an int or a float
+STR = 'string'
+BOOL = 'boolean'  # True or False
+NUMBERS = (INT, REAL_NUMBER, NUMBER)
+
+# A variable has its declared type, one of the types below: its value is None
+# or any value is_val_of_type accepts for that type, which is looser than the
+# name suggests (an INTEGER variable may hold '12' or 1e+20).
+CHECKED_TYPES = (INTEGER, FLOAT, STRING, BOOLEAN)
+
+# inferred types whose values always pass the runtime check of a declared type
+_ALWAYS_VALID = {
+    INTEGER: (INT, INTEGER),
+    FLOAT: (INT, REAL_NUMBER, NUMBER, INTEGER, FLOAT),
+    STRING: (STR, STRING),
+    BOOLEAN: (BOOL, BOOLEAN),
+}
+
+# inferred types whose values never do
+_NEVER_VALID = {
+    INTEGER: (BOOL,),
+    FLOAT: (BOOL,),
+    STRING: (*NUMBERS, BOOL),
+    BOOLEAN: (*NUMBERS, STR),
+}
+
+
+def variable_type(declared_type):
+    return declared_type if declared_type in CHECKED_TYPES else None
+
+
+def is_always_valid(declared_type, inferred_type):
+    return inferred_type in _ALWAYS_VALID.get(declared_type, ())
+
+
+def is_never_valid(declared_type, inferred_type):
+    return inferred_type in _NEVER_VALID.get(declared_type, ())
+
+
+def _number_operand(inferred_type, other, op):
+    """
+    Type of an operand of an arithmetic operation that did not fail.
+
+    Numeric variables may hold strings or None; those make the operation
+    fail, unless both operands are strings and the operation is '+', or one
+    of them is an int and the operation is '*'.
+    """
+    if inferred_type in NUMBERS:
+        return inferred_type
+    if inferred_type not in (INTEGER, FLOAT):
+        return None
+    if op == K_PLUS and other not in NUMBERS:
+        return None
+    if op == K_MULT and other != REAL_NUMBER:
+        return None
+    return NUMBER
+
+
+def binary_type(op, left, right):
+    left, right = _number_operand(left, right, op), _number_operand(right, left, op)
+    if left is None or right is None:
+        return None
+
+    if op == K_FLOAT_DIV or REAL_NUMBER in (left, right):
+        return REAL_NUMBER
+    if left == INT and right == INT:
+        return INT
+    return NUMBER
+
+
+def unary_type(inferred_type):
+    if inferred_type in NUMBERS:
+        return inferred_type
+    if inferred_type in (INTEGER, FLOAT):
+        # '-' fails for strings and None
+        return NUMBER
+    return None
+
+
+def parameter_types(function):
+    # parameters are VarSymbols whose value is the name of their type
+    return [variable_type(param.value) for param in function.params]
+
+
+def parameter_guards(function, count):
+    # (index, type) of the typed parameters among the first count, which a
+    # call through a variable checks as nothing was proved about them
+    return [(index, param_type) for index, param_type in enumerate(parameter_types(function)[:count])
+            if param_type is not None]
@@ -0,0 +1,296 @@
+import operator
+
+from compiler.bytecode import *
+from compiler.memo import Memos, MEMO_SIZE
+from compiler.scopes import Closure, function_of, enter_closure, leave_closure
+from compiler.signals import BreakOut
+from compiler.type_inference import parameter_guards
+from utils.errors import InterpreterError, ErrorCode
+
+# functions of the BINARY arguments
+BINARY_FUNCTIONS = tuple({
+    K_PLUS: operator.add,
+    K_MINUS: operator.sub,
+    K_MULT: operator.mul,
+    K_INTEGER_DIV: operator.floordiv,
+    K_FLOAT_DIV: operator.truediv,
+}[op] for op in OPERATORS)
+
+
+class VirtualMachine:
+    """
+    Runs a tree checked by the SemanticAnalyzer by compiling it to bytecode
+    first (see compiler.bytecode) and running that on a value stack.
+
+    Every call of a function runs its Code in a new frame, with a stack and
+    loops of its own; frames of the running functions are kept in a display
+    by depth, as in the other engines.
+    """
+
+    def __init__(self, tree, memo_size=MEMO_SIZE):
+        self.tree = tree
+        self.source_index = getattr(tree, 'source_index', None)
+        self.display = []
+        self.codes = {}
+        # instructions of every Code, unpacked to a list, which is faster to
+        # index than the array they are kept in
+        self.instructions = {}
+        # results of the pure functions
+        self.memos = Memos(memo_size)
+
+    def error(self, message, node=None):
+        raise InterpreterError(ErrorCode.INTERPRETER_ERROR, message, getattr(node, 'pos', None), self.source_index)
+
+    def can_not_assign_error(self, var_name, value, base_type, node=None):
+        self.error("can't assign {} to var {} as type of {} is {}".format(
+            to_string(value), var_name, var_name, base_type), node)
+
+    def run(self, code: Code, frame):
+        display, error = self.display, self.error
+        memoized, memoize = self.memos.get, self.memos.size > 0
+        instructions, constants, nodes = self.instructions[code], code.constants, code.nodes
+        stack = []
+        push, pop = stack.append, stack.pop
+        # [POP_LOOP offset, stack height, iterations] of the running loops
+        loops = []
+        pc = 0
+
+        while True:
+            try:
+                while True:
+                    opcode = instructions[pc]
+                    arg = instructions[pc + 1]
+                    pc += 2
+
+                    if opcode == LOAD_LOCAL:
+                        value = frame[arg]
+                        if value is UNDEFINED:
+                            error("variable '" + nodes[pc - 2 >> 1].value + "' is not defined", nodes[pc - 2 >> 1])
+                        push(value)
+                    elif opcode == LOAD_CONST:
+                        push(constants[arg])
+                    elif opcode == BINARY:
+                        right = pop()
+                        try:
+                            stack[-1] = BINARY_FUNCTIONS[arg](stack[-1], right)
+                        except (ArithmeticError, TypeError) as ex:
+                            # e.g. division by zero or an operand of a wrong type
+                            error(str(ex), nodes[pc - 2 >> 1])
+                    elif opcode == COMPARE:
+                        right = pop()
+                        stack[-1] = constants[arg](stack[-1], right)
+                    elif opcode == JUMP_IF_NOT_TRUE:
+                        if pop() is not True:
+                            pc = arg
+                    elif opcode == JUMP:
+                        pc = arg
+                    elif opcode == ASSIGN_LOCAL:
+                        if frame[arg] is UNDEFINED:
+                            var = nodes[pc - 2 >> 1]
+                            error(f"value {var.value} is not defined", var)
+                        frame[arg] = pop()
+                    elif opcode == LOAD_DEREF:
+                        value = display[arg & 0xffff][arg >> 16]
+                        if value is UNDEFINED:
+                            error("variable '" + nodes[pc - 2 >> 1].value + "' is not defined", nodes[pc - 2 >> 1])
+                        push(value)
+                    elif opcode == COUNT_LOOP:
+                        loop = loops[-1]
+                        loop[2] += 1
+                        if loop[2] + 1 > MAX_INT:
+                            error("too much calls from while")
+                    elif opcode == LOAD_FUNCTION:
+                        site = constants[arg]
+                        closure = display[site.depth][site.slot]
+                        if closure.__class__ is not Closure:
+                            error("no such function: " + nodes[pc - 2 >> 1].name, nodes[pc - 2 >> 1])
+                        push(closure)
+                    elif opcode == CALL:
+                        site = constants[arg]
+                        argc = site.argc
+                        closure = stack[-argc - 1]
+                        function = closure.function
+                        by_name = function is site.function
+                        if by_name:
+                            callee, guards = site.code, site.guards
+                        else:
+                            # a function stored in a variable
+                            callee = self.codes[function]
+                            guards = parameter_guards(function, argc)
+
+                        # parameters are the first slots of the new frame
+                        callee_frame = [UNDEFINED] * function.frame_size
+                        if argc:
+                            callee_frame[:argc] = stack[-argc:]
+                            del stack[-argc:]
+                        for index, param_type in guards:
+                            if not is_val_of_type(callee_frame[index], param_type):
+                                self.can_not_assign_error(function.params[index].name, callee_frame[index],
+                                                          param_type, nodes[pc - 2 >> 1])
+
+                        if not by_name:
+                            stack[-1] = self.run_closure(closure, callee, callee_frame)
+                        elif function.pure and memoize:
+                            cache = memoized(function) or self.memoize(function, callee)
+                            stack[-1] = cache(*callee_frame[:argc])
+                        else:
+                            stack[-1] = self.run_function(function, callee, callee_frame)
+                    elif opcode == CALL_BUILTIN:
+                        function, argc = constants[arg]
+                        if argc:
+                            args = stack[-argc:]
+                            del stack[-argc:]
+                            push(function(*args))
+                        else:
+                            push(function())
+                    elif opcode == POP:
+                        pop()
+                    elif opcode == RETURN_VALUE:
+                        return pop()
+                    elif opcode == LOAD_HOISTED:
+                        slot, target = constants[arg]
+                        value = frame[slot]
+                        if value is not UNDEFINED:
+                            push(value)
+                            pc = target
+                    elif opcode == STORE_HOISTED:
+                        frame[arg] = stack[-1]
+                    elif opcode == STORE_LOCAL:
+                        frame[arg] = pop()
+                    elif opcode == ASSIGN_DEREF:
+                        target_frame = display[arg & 0xffff]
+                        if target_frame[arg >> 16] is UNDEFINED:
+                            var = nodes[pc - 2 >> 1]
+                            error(f"value {var.value} is not defined", var)
+                        target_frame[arg >> 16] = pop()
+                    elif opcode == ASSIGN_CHECKED:
+                        depth, slot, base_type = constants[arg]
+                        value = pop()
+                        target_frame = display[depth]
+                        var = nodes[pc - 2 >> 1]
+                        if target_frame[slot] is UNDEFINED:
+                            error(f"value {var.value} is not defined", var)
+                        if not is_val_of_type(value, base_type):
+                            self.can_not_assign_error(var.value, value, base_type, var)
+                        target_frame[slot] = value
+                    elif opcode == DECLARE:
+                        slots, base_type = constants[arg]
+                        value = pop()
+                        if value is not None and base_type is not None and not is_val_of_type(value, base_type):
+                            node = nodes[pc - 2 >> 1]
+                            self.can_not_assign_error(node.get_var_names(), value, base_type, node)
+                        for slot in slots:
+                            frame[slot] = value
+                    elif opcode == CONCAT:
+                        right = pop()
+                        left = stack[-1]
+                        if type(left) is not str or type(right) is not str:
+                            error("can only concatenate string and string", nodes[pc - 2 >> 1])
+                        stack[-1] = left + right
+                    elif opcode == UNARY_NEGATIVE:
+                        stack[-1] = -stack[-1]
+                    elif opcode == UNARY_POSITIVE:
+                        stack[-1] = +stack[-1]
+                    elif opcode == NOT:
+                        stack[-1] = not_bool(stack[-1])
+                    elif opcode == OR_ELSE:
+                        value = stack[-1]
+                        if value is False:
+                            pop()
+                        else:
+                            if value is not True:
+                                stack[-1] = False
+                            pc = arg
+                    elif opcode == AND_THEN:
+                        if stack[-1] is True:
+                            pop()
+                        else:
+                            stack[-1] = False
+                            pc = arg
+                    elif opcode == TEST_TRUE:
+                        stack[-1] = stack[-1] is True
+                    elif opcode == ENTER_INLINED:
+                        depth, slot, function, fallback = constants[arg]
+                        if function_of(display[depth][slot]) is not function:
+                            # the function is not declared yet
+                            pc = fallback
+                    elif opcode == CHECK_ARGUMENTS:
+                        slots, guards, function = constants[arg]
+                        for index, param_type in guards:
+                            value = frame[slots[index]]
+                            if not is_val_of_type(value, param_type):
+                                self.can_not_assign_error(function.params[index].name, value, param_type,
+                                                          nodes[pc - 2 >> 1])
+                    elif opcode == INDUCTION_INIT:
+                        var_slot, factors = constants[arg]
+                        value = frame[var_slot]
+                        for slot, factor in factors:
+                            frame[slot] = value * factor
+                    elif opcode == INDUCTION_STEP:
+                        for slot, step in constants[arg]:
+                            frame[slot] += step
+                    elif opcode == CLEAR:
+                        start, stop, blank = constants[arg]
+                        frame[start:stop] = blank
+                    elif opcode == SETUP_LOOP:
+                        loops.append([arg, len(stack), 0])
+                    elif opcode == POP_LOOP:
+                        loops.pop()
+                    elif opcode == DECLARE_FUNCTION:
+                        slot, function = constants[arg]
+                        frame[slot] = Closure(function, display[:function.depth])
+                    elif opcode == BREAK_OUT:
+                        raise BreakOut()
+                    else:
+                        error(f"unknown opcode {opcode}")
+            except BreakOut:
+                # break in a function called from a loop of this code
+                if not loops:
+                    raise
+                pc, height, _ = loops[-1]
+                del stack[height:]
+
+    def memoize(self, function: FunctionDecl, code: Code):
+        blank = [UNDEFINED] * (function.frame_size - len(function.params))
+        return self.memos.add(function, lambda *args: self.run_function(function, code, [*args, *blank]))
+
+    def run_closure(self, closure: Closure, code: Code, frame):
+        # a function called from any scope runs in the ones it was declared in
+        function = closure.function
+        previous = enter_closure(self.display, closure)
+        try:
+            if function.pure and self.memos.size:
+                cache = self.memos.get(function) or self.memoize(function, code)
+                return cache(*frame[:len(function.params)])
+            return self.run_function(function, code, frame)
+        finally:
+            leave_closure(self.display, previous)
+
+    def run_function(self, function: FunctionDecl, code: Code, frame):
+        display, depth = self.display, function.depth
+        if depth == len(display):
+            display.append(None)
+        previous = display[depth]
+        display[depth] = frame
+        try:
+            return self.run(code, frame)
+        finally:
+            display[depth] = previous
+
+    def compile(self):
+        compiler = BytecodeCompiler(self.tree)
+        code = compiler.compile()
+        self.codes = compiler.codes
+        self.instructions = {code: code.code.tolist() for code in (code, *compiler.codes.values())}
+        return code
+
+    def interpret(self):
+        code = self.compile()
+        frame = [UNDEFINED] * code.frame_size
+        self.display.append(frame)
+        try:
+            self.run(code, frame)
+        except BreakOut:
+            self.error("Break is used outside of for-loop (0 len)")
+        finally:
+            self.display.pop()
@@ -0,0 +1,130 @@
+from utils.data_classes import *
+
+
+class StatementWalker(NodeVisitor):
+    """
+    Visits the statements of a block, without entering the bodies of the
+    functions declared in it. Every expression is passed to expression(),
+    which returns the node replacing it, and every variable written to
+    write().
+    """
+
+    def __init__(self, depth):
+        # frame depth of the function the statements belong to
+        self.depth = depth
+
+    def expression(self, node):
+        return node
+
+    def write(self, depth, slot):
+        pass
+
+    def visit_Compound(self, node: Compound):
+        node.children = [self.visit(child) for child in node.get_children()]
+        return node
+
+    def visit_Block(self, node: Block):
+        node.var_decs = [self.visit(declaration) for declaration in node.var_decs]
+        node.compound_statement = self.visit(node.compound_statement)
+        return node
+
+    def visit_Assign(self, node: Assign):
+        node.right = self.expression(node.right)
+        self.write(node.left.depth, node.left.slot)
+        return node
+
+    def visit_VarDecs(self, node: VarDecs):
+        if node.value is not None:
+            node.value = self.expression(node.value)
+        for slot in node.slots:
+            self.write(self.depth, slot)
+        return node
+
+    def visit_FunctionDecl(self, node: FunctionDecl):
+        self.write(self.depth, node.slot)
+        return node
+
+    def visit_FunctionCall(self, node: FunctionCall):
+        return self.expression(node)
+
+    def visit_Inlined(self, node: Inlined):
+        # a call statement the Inliner expanded
+        return self.expression(node)
+
+    def visit_IfBlock(self, node: IfBlock):
+        node.expr = self.expression(node.expr)
+        node.block = self.visit(node.block)
+        return node
+
+    def visit_IfStat(self, node: IfStat):
+        node.if_blocks = [self.visit(if_block) for if_block in node.if_blocks]
+        if node.else_block is not None:
+            node.else_block = self.visit(node.else_block)
+        return node
+
+    def visit_ForLoop(self, node: ForLoop):
+        base = node.base
+        base.right = self.expression(base.right)
+        self.write(base.left.depth, base.left.slot)
+        node.bool_expr = self.expression(node.bool_expr)
+        node.then = self.visit(node.then)
+        node.block = self.visit(node.block)
+        return node
+
+    def visit_ReturnStat(self, node: ReturnStat):
+        if node.base_expr is not None:
+            node.base_expr = self.expression(node.base_expr)
+        return node
+
+    @staticmethod
+    def visit_Break(node: Break):
+        return node
+
+    @staticmethod
+    def visit_NoOp(node):
+        return node
+
+
+class ProgramWalker(StatementWalker):
+    """
+    Visits every statement of a program, the bodies of its functions
+    included, keeping track of the function whose frame they run in.
+    """
+
+    def __init__(self, tree: Program):
+        super().__init__(0)
+        self.tree = tree
+        # Program or FunctionDecl whose frame the visited statements use
+        self.function = tree
+
+    def allocate(self):
+        # a new slot in the frame of the current function
+        slot = self.function.frame_size
+        self.function.frame_size += 1
+        return slot
+
+    def visit_Program(self, node: Program):
+        node.block = self.visit(node.block)
+        return node
+
+    def visit_FunctionDecl(self, node: FunctionDecl):
+        self.write(self.depth, node.slot)
+        function, depth = self.function, self.depth
+        self.function, self.depth = node, node.depth
+        node.block = self.visit(node.block)
+        self.function, self.depth = function, depth
+        return node
+
+
+def map_operands(node, function):
+    # replaces the operands of an expression by what function returns for them
+    if isinstance(node, (BinOp, StrOp, BoolOp)):
+        node.left = function(node.left)
+        node.right = function(node.right)
+    elif isinstance(node, (UnaryOp, NotOp, Hoisted)):
+        node.expr = function(node.expr)
+    elif isinstance(node, FunctionCall):
+        node.actual_params = [function(param) for param in node.actual_params]
+    elif isinstance(node, Inlined):
+        node.call.actual_params = [function(param) for param in node.call.actual_params]
+    return node
@@ -1,4 +1,4 @@
-from utils.constants import TRUE, FALSE, OR, AND, INTEGER, REAL, STRING, BOOLEAN, FLOAT
+from utils.constants import TRUE, FALSE, INTEGER, REAL, STRING, BOOLEAN, FLOAT
 
 _delta_for_floats = 1 / 1e8
 
@@ -6,7 +6,7 @@ _delta_for_floats = 1 / 1e8
 class BuiltinFunctions:
     @staticmethod
     def print(*items):
-        print(*items)
+        print(*map(to_string, items))
 
 
 _builtin_functions = BuiltinFunctions()
@@ -19,38 +19,30 @@ def is_system_function(name):
         return False
 
 
-def call_system_function(name, *args, **kwargs):
-    func = getattr(_builtin_functions, name)
-    return func(*args, *kwargs)
-
+def get_system_function(name):
+    return getattr(_builtin_functions, name)
 
-def evaluate_bool_expression(left, op, right):
-    if left not in (TRUE, FALSE):
-        raise ValueError('left not in true,false')
 
-    if right not in (TRUE, FALSE):
-        raise ValueError('right not in true,false')
+def call_system_function(name, *args, **kwargs):
+    func = get_system_function(name)
+    return func(*args, *kwargs)
 
-    if op not in (OR, AND):
-        raise ValueError('op not in or, and')
 
-    if op is OR:
-        if left is TRUE or right is TRUE:
-            return TRUE
-        return FALSE
-    else:
-        if left is TRUE and right is TRUE:
-            return TRUE
+def to_string(value):
+    # booleans are shown as the keywords they are written with
+    if value is True:
+        return TRUE
+    if value is False:
         return FALSE
+    return value
 
 
 def not_bool(bool_val):
-    if bool_val not in (TRUE, FALSE):
-        raise ValueError("value error")
-
-    if bool_val is TRUE:
-        return FALSE
-    return TRUE
+    if bool_val is True:
+        return False
+    if bool_val is False:
+        return True
+    raise ValueError("value error")
 
 
 def is_val_of_type(val, base_type):
@@ -59,6 +51,9 @@ def is_val_of_type(val, base_type):
 
     if val is None:
         return True
+    if val.__class__ is bool:
+        # a bool is an int in python, but not in Dy
+        return base_type == BOOLEAN
 
     if base_type in (INTEGER, FLOAT):
         if base_type == INTEGER:
@@ -71,84 +66,64 @@ def is_val_of_type(val, base_type):
                 return isinstance(float(val), float)
             except Exception as e:
                 return False
-    elif base_type is STRING:
+    elif base_type == STRING:
         return isinstance(val, str)
-    elif base_type is BOOLEAN:
-        try:
-            return str(val).lower() in (TRUE.lower(), FALSE.lower())
-        except Exception as e:
-            return False
+    else:
+        return False
+
+
+def is_number(value):
+    return value.__class__ is int or value.__class__ is float
+
+
+# Comparisons of operands of any type; compiler.comparisons has the ones of
+# operands whose types are known. Numbers are compared with a tolerance for
+# floats and strings by their characters; ordering other values is false,
+# and booleans are never equal to numbers.
+
+def bool_is_equal(left, right):
+    return left == right and (left.__class__ is bool) is (right.__class__ is bool)
 
 
 def not_equal(left, right):
-    try:
-        flag = left != right
-        if flag is True:
-            return TRUE
-        return FALSE
-    except Exception as e:
-        return TRUE
+    return not bool_is_equal(left, right)
 
 
-def bool_or(left, right):
-    try:
-        return evaluate_bool_expression(left, OR, right)
-    except Exception as e:
-        return FALSE
+def number_greater_than(left, right):
+    return left - right > _delta_for_floats
 
 
-def bool_and(left, right):
-    try:
-        return evaluate_bool_expression(left, AND, right)
-    except Exception as e:
-        return FALSE
+def number_greater_than_or_equal(left, right):
+    return left - right > -_delta_for_floats
+
+
+def number_less_than(left, right):
+    return left - right < -_delta_for_floats
+
+
+def number_less_than_or_equal(left, right):
+    return left - right < _delta_for_floats
 
 
 def bool_greater_than(left, right):
-    try:
-        flag = int(left) > int(right) or (float(left) - float(right) > _delta_for_floats)
-        if flag is True:
-            return TRUE
-        return FALSE
-    except Exception as e:
-        return FALSE
+    if is_number(left) and is_number(right):
+        return left - right > _delta_for_floats
+    return left.__class__ is str and right.__class__ is str and left > right
 
 
 def bool_greater_than_or_equal(left, right):
-    try:
-        flag = int(left) >= int(right) and (float(left) - float(right) > -_delta_for_floats)
-        if flag is True:
-            return TRUE
-        return FALSE
-    except Exception as e:
-        return FALSE
+    if is_number(left) and is_number(right):
+        return left - right > -_delta_for_floats
+    return left.__class__ is str and right.__class__ is str and left >= right
 
 
 def bool_less_than(left, right):
-    try:
-        flag = int(left) < int(right) or (float(left) - float(right) < -_delta_for_floats)
-        if flag is True:
-            return TRUE
-        return FALSE
-    except Exception as e:
-        return FALSE
+    if is_number(left) and is_number(right):
+        return left - right < -_delta_for_floats
+    return left.__class__ is str and right.__class__ is str and left < right
 
 
 def bool_less_than_or_equal(left, right):
-    try:
-        flag = int(left) <= int(right) and (float(left) - float(right) < _delta_for_floats)
-        if flag is True:
-            return TRUE
-        return FALSE
-    except Exception as e:
-        return FALSE
-
-
-def bool_is_equal(left, right):
-    try:
-        flag = left == right
-        if flag is True:
-            return TRUE
-        return FALSE
-    except Exception as e:
-        return FALSE
+    if is_number(left) and is_number(right):
+        return left - right < _delta_for_floats
+    return left.__class__ is str and right.__class__ is str and left <= right
@@ -2,26 +2,29 @@ from utils.constants import *
 from utils.data_classes import Token
 
 RESERVED_KEYWORDS = {
-    PROGRAM: Token(PROGRAM, PROGRAM),
-    BEGIN: Token(BEGIN, BEGIN),
-    END: Token(END, END),
-    COMMA: Token(COMMA, COMMA),
-    COLON: Token(COLON, COLON),
-    DIV: Token(INTEGER_DIV, INTEGER_DIV),
-    INTEGER: Token(INTEGER, INTEGER),
-    INT: Token(INTEGER, INTEGER),
-    FLOAT: Token(FLOAT, FLOAT),
-    REAL: Token(REAL, REAL),
-    VAR: Token(VAR, VAR),
-    PROCEDURE: Token(PROCEDURE, PROCEDURE),
-    STRING: Token(STRING, STRING),
-    STR: Token(STRING, STRING),
-    FUNCTION: Token(FUNCTION, FUNCTION),
-    RETURN: Token(RETURN, RETURN),
-    BOOLEAN: Token(BOOLEAN, BOOLEAN),
-    TRUE: Token(BOOLEAN, TRUE),
-    FALSE: Token(BOOLEAN, FALSE),
-    FOR: Token(FOR, FOR),
-    BREAK: Token(BREAK, BREAK),
-    OBJECT: Token(OBJECT, OBJECT),
+    PROGRAM: Token(K_PROGRAM, PROGRAM),
+    BEGIN: Token(K_BEGIN, BEGIN),
+    END: Token(K_END, END),
+    COMMA: Token(K_COMMA, COMMA),
+    COLON: Token(K_COLON, COLON),
+    DIV: Token(K_INTEGER_DIV, INTEGER_DIV),
+    INTEGER: Token(K_INTEGER, INTEGER),
+    INT: Token(K_INTEGER, INTEGER),
+    FLOAT: Token(K_FLOAT, FLOAT),
+    REAL: Token(K_REAL, REAL),
+    VAR: Token(K_VAR, VAR),
+    PROCEDURE: Token(K_PROCEDURE, PROCEDURE),
+    STRING: Token(K_STRING, STRING),
+    STR: Token(K_STRING, STRING),
+    FUNCTION: Token(K_FUNCTION, FUNCTION),
+    RETURN: Token(K_RETURN, RETURN),
+    BOOLEAN: Token(K_BOOLEAN, BOOLEAN),
+    TRUE: Token(K_BOOLEAN, TRUE),
+    FALSE: Token(K_BOOLEAN, FALSE),
+    FOR: Token(K_FOR, FOR),
+    BREAK: Token(K_BREAK, BREAK),
+    OBJECT: Token(K_OBJECT, OBJECT),
 }
+
+# keywords are case insensitive, so a lowercased word is classified with one lookup
+RESERVED_WORDS = {keyword.lower(): token for keyword, token in RESERVED_KEYWORDS.items()}
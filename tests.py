@@ -1,3 +1,37 @@
-from compiler.main import Dy
+import contextlib
+import io
+import sys
+from glob import glob
+
+from compiler.main import Dy, ENGINES
+from compiler.memo import MEMO_SIZE
+from compiler.optimizer import O0, O1, O2
 
 Dy.compile_file('app')
+
+
+def output(path, engine, optimize, memo_size):
+    # what running a program of src/ prints, errors included
+    printed = io.StringIO()
+    with contextlib.redirect_stdout(printed):
+        Dy.compile_file(path, use_cache=False, optimize=optimize, engine=engine, memo_size=memo_size)
+    return printed.getvalue()
+
+
+# every program of the corpus prints its .out file with every engine at
+# every optimization level, with and without memos, so the optimizer, the
+# engines and memoization do not change what a program does
+failures = []
+for program in sorted(glob('src/corpus/*.dy')):
+    path = program[len('src/'):-len('.dy')]
+    with open(program[:-len('.dy')] + '.out') as f:
+        expected = f.read()
+    for engine in ENGINES:
+        for optimize in (O0, O1, O2):
+            for memo_size in (MEMO_SIZE, 0):
+                if output(path, engine, optimize, memo_size) != expected:
+                    failures.append(f'{path} with engine {engine} at O{optimize}, memo_size {memo_size}')
+
+for failure in failures:
+    print('differs from its .out file:', failure)
+sys.exit(1 if failures else 0)
@@ -37,6 +37,101 @@ ELSE = "ELSE"
 FOR = "FOR"
 BREAK = "BREAK"
 MAX_INT = 1e7
+LANGUAGE_VERSION = "0.1"
 OBJECT = "OBJECT"
 INT = "INT"
 STR = "STR"
+
+# integer token kinds; tokens carry one of these so that the lexer and the
+# parser compare small integers instead of token type names
+K_EOF = 0
+K_INTEGER = 1
+K_FLOAT = 2
+K_STRING = 3
+K_ID = 4
+K_PLUS = 5
+K_MINUS = 6
+K_MULT = 7
+K_FLOAT_DIV = 8
+K_INTEGER_DIV = 9
+K_LPARENT = 10
+K_RPARENT = 11
+K_DOT = 12
+K_SEMI = 13
+K_LCBRACE = 14
+K_RCBRACE = 15
+K_COLON = 16
+K_COMMA = 17
+K_ASSIGN = 18
+K_NOT = 19
+K_NOT_EQUAL = 20
+K_GREATER_THAN = 21
+K_GREATER_THAN_OR_EQUAL = 22
+K_LESS_THAN = 23
+K_LESS_THAN_OR_EQUAL = 24
+K_IS_EQUAL = 25
+K_OR = 26
+K_AND = 27
+K_IF = 28
+K_ELIF = 29
+K_ELSE = 30
+K_PROGRAM = 31
+K_BEGIN = 32
+K_END = 33
+K_REAL = 34
+K_VAR = 35
+K_PROCEDURE = 36
+K_FUNCTION = 37
+K_RETURN = 38
+K_BOOLEAN = 39
+K_FOR = 40
+K_BREAK = 41
+K_OBJECT = 42
+
+# token type name of every token kind, indexed by the kind
+TOKEN_TYPES = (
+    EOF,
+    INTEGER,
+    FLOAT,
+    STRING,
+    ID,
+    PLUS,
+    MINUS,
+    MULT,
+    FLOAT_DIV,
+    INTEGER_DIV,
+    LPARENT,
+    RPARENT,
+    DOT,
+    SEMI,
+    LCBRACE,
+    RCBRACE,
+    COLON,
+    COMMA,
+    ASSIGN,
+    NOT,
+    NOT_EQUAL,
+    GREATER_THAN,
+    GREATER_THAN_OR_EQUAL,
+    LESS_THAN,
+    LESS_THAN_OR_EQUAL,
+    IS_EQUAL,
+    OR,
+    AND,
+    IF,
+    ELIF,
+    ELSE,
+    PROGRAM,
+    BEGIN,
+    END,
+    REAL,
+    VAR,
+    PROCEDURE,
+    FUNCTION,
+    RETURN,
+    BOOLEAN,
+    FOR,
+    BREAK,
+    OBJECT,
+)
+TOKEN_KINDS = {token_type: kind for kind, token_type in enumerate(TOKEN_TYPES)}
@@ -2,6 +2,8 @@ import abc
 from enum import Enum
 from typing import List
 
+from utils.constants import TOKEN_TYPES, K_INTEGER, K_FLOAT
+
 
 class SymbolTypes(Enum):
     INTEGER = "INTEGER"
@@ -11,9 +13,17 @@ class SymbolTypes(Enum):
 
 
 class Token:
-    def __init__(self, token_type, value):
-        self.type = token_type
+    __slots__ = ('kind', 'value', 'pos')
+
+    def __init__(self, kind: int, value, pos: int = 0):
+        self.kind = kind
         self.value = value
+        # character offset in the source, see utils.source_index
+        self.pos = pos
+
+    @property
+    def type(self):
+        return TOKEN_TYPES[self.kind]
 
     def __str__(self) -> str:
         return f'Token({self.type}, {self.value})'
@@ -28,26 +38,33 @@ class NodeVisitor(object):
 
 
 class AST:
-    pass
+    # nodes keep only what the passes read: plain values, child nodes and the
+    # source offset, never the tokens they were parsed from, and no
+    # per-instance __dict__
+    __slots__ = ()
 
 
 class Valuable(abc.ABC):
+    __slots__ = ()
+
     def get_value(self):
         pass
 
 
 class Num(AST):
+    __slots__ = ('value',)
+
     def __init__(self, token: Token):
-        self.token = token
         self.value = token.value
 
     def __str__(self):
-        return f'Num({self.token.type}, {self.value})'
+        return f'Num({TOKEN_TYPES[K_FLOAT if isinstance(self.value, float) else K_INTEGER]}, {self.value})'
 
 
 class Str(AST):
+    __slots__ = ('value',)
+
     def __init__(self, token: Token):
-        self.token = token
         self.value = token.value
 
     def __str__(self):
@@ -55,37 +72,51 @@ class Str(AST):
 
 
 class StrOp(AST):
+    __slots__ = ('left', 'add', 'right', 'pos')
+
     def __init__(self, left, add: Token, right):
         self.left = left
-        self.add = add
+        # kind of the operator token
+        self.add = add.kind
         self.right = right
+        self.pos = add.pos
 
     def __str__(self):
-        return f'StrOp({self.left}, {self.add}, {self.right})'
+        return f'StrOp({self.left}, {TOKEN_TYPES[self.add]}, {self.right})'
 
 
 class BinOp(AST):
+    __slots__ = ('left', 'op', 'right', 'pos')
+
     def __init__(self, left, op: Token, right):
         self.left = left
-        self.token = self.op = op
+        # kind of the operator token
+        self.op = op.kind
         self.right = right
+        self.pos = op.pos
 
     def __str__(self):
-        return f'BinOp({self.left}, {self.op.type}, {self.right})'
+        return f'BinOp({self.left}, {TOKEN_TYPES[self.op]}, {self.right})'
 
 
 class UnaryOp(AST):
-    def __init__(self, op, expr):
-        self.token = self.op = op
+    __slots__ = ('op', 'expr', 'pos')
+
+    def __init__(self, op: Token, expr):
+        # kind of the operator token
+        self.op = op.kind
         self.expr = expr
+        self.pos = op.pos
 
     def __str__(self):
-        return f'UnaryOp({self.op}, {self.expr})'
+        return f'UnaryOp({TOKEN_TYPES[self.op]}, {self.expr})'
 
 
 class Compound(AST):
-    def __init__(self):
-        self.children = []
+    __slots__ = ('children',)
+
+    def __init__(self, children=None):
+        self.children = children if children is not None else []
 
     def add(self, node):
         self.children.append(node)
@@ -102,9 +133,14 @@ class Compound(AST):
 
 
 class Var(AST, Valuable):
+    __slots__ = ('value', 'pos', 'depth', 'slot')
+
     def __init__(self, token: Token):
-        self.token = token
         self.value = token.value
+        self.pos = token.pos
+        # frame depth and slot of the variable, set by the semantic analyzer
+        self.depth = None
+        self.slot = None
 
     def get_value(self):
         return self.value
@@ -114,54 +150,76 @@ class Var(AST, Valuable):
 
 
 class Assign(AST):
-    def __init__(self, left: Var, op: Token, right):
+    __slots__ = ('left', 'right', 'type', 'guarded')
+
+    def __init__(self, left: Var, right):
         self.left = left
-        self.token = self.op = op
         self.right = right
+        # declared type of the variable, set by the semantic analyzer, and
+        # whether the value has to be checked against it at runtime
+        self.type = None
+        self.guarded = True
 
     def __str__(self):
         return f'Assign({self.left}, :=, {self.right})'
 
 
 class NoOp(AST):
+    __slots__ = ()
+
     def __str__(self):
         return 'NoOp()'
 
 
 class VarDecs(AST):
-    def __init__(self, variables, base_type: Token, value=None):
-        self.variables = variables
-        self.token = self.type = base_type
+    __slots__ = ('variables', 'type', 'value', 'pos', 'slots', 'guarded')
+
+    def __init__(self, variables: List[Token], base_type: Token, value=None):
+        # names of the declared variables and the name of their type
+        self.variables = [token.value for token in variables]
+        self.type = base_type.value
         self.value = value
+        self.pos = variables[0].pos
+        # slots of the variables in the frame of the enclosing function
+        self.slots = None
+        # whether the value has to be type checked at runtime
+        self.guarded = True
 
-    def get_declarations(self):
+    def get_declarations(self) -> List[str]:
         return self.variables
 
-    def get_type(self) -> Token:
+    def get_type(self) -> str:
         return self.type
 
     def get_value(self):
         return self.value
 
     def get_var_names(self):
-        return ", ".join([token.value for token in self.variables])
+        return ", ".join(self.variables)
 
     def __str__(self):
         res = ""
         for var in self.variables:
-            res += var.value + ', '
-        return f'VarDecs(({res}), {self.type.value}, {self.value})'
+            res += var + ', '
+        return f'VarDecs(({res}), {self.type}, {self.value})'
 
 
 class Program(AST):
-    def __init__(self, block):
+    __slots__ = ('block', 'source_index', 'frame_size')
+
+    def __init__(self, block, source_index=None):
         self.block = block
+        # resolves the positions of the program's nodes for error messages
+        self.source_index = source_index
+        self.frame_size = 0
 
     def __str__(self):
         return f'Program({self.block})'
 
 
 class Block(AST):
+    __slots__ = ('var_decs', 'compound_statement')
+
     def __init__(self, var_decs: list, compound_statement: Compound):
         self.var_decs = var_decs
         self.compound_statement = compound_statement
@@ -174,6 +232,8 @@ class Block(AST):
 
 
 class AbstractSymbol(abc.ABC):
+    __slots__ = ('name',)
+
     def __init__(self, name, *args):
         self.name = name
 
@@ -185,12 +245,21 @@ class AbstractSymbol(abc.ABC):
 
 
 class FunctionDecl(AbstractSymbol, Valuable):
+    __slots__ = ('block', 'params', 'return_expression', 'depth', 'slot', 'frame_size', 'pure')
+
     def __init__(self, proc_name, params, block, return_expression=None):
         super(FunctionDecl, self).__init__(proc_name)
         self.name = proc_name
         self.block = block
         self.params = params if params is not None else []
         self.return_expression = return_expression
+        # depth of the function's frame, its slot in the enclosing frame and
+        # the number of slots of its own frame, set by the semantic analyzer
+        self.depth = None
+        self.slot = None
+        self.frame_size = 0
+        # whether its result depends on its arguments only (see purity)
+        self.pure = False
 
     def get_value(self):
         return str(self)
@@ -200,19 +269,46 @@ class FunctionDecl(AbstractSymbol, Valuable):
 
 
 class FunctionCall(AST):
-    def __init__(self, name, actual_params, token):
+    __slots__ = ('name', 'actual_params', 'pos', 'depth', 'slot', 'guards', 'tail')
+
+    def __init__(self, name, actual_params, token: Token):
         self.name = name
         self.actual_params = actual_params
-        self.token = token
+        self.pos = token.pos
+        # frame depth and slot of the called function; None for builtins
+        self.depth = None
+        self.slot = None
+        # (index, type) of the arguments to type check at runtime; None when
+        # the called function is not known statically
+        self.guards = None
+        # the function returning the result of this call of itself, if any
+        self.tail = None
 
     def __str__(self):
         res = ""
         for param in self.actual_params:
             res += str(param) + ", "
-        return f'FunctionCall({self.name}, {res}, {self.token})'
+        return f'FunctionCall({self.name}, {res})'
+
+
+class Inlined(AST):
+    # call of a small function replaced by the expression it returns, whose
+    # parameters were renamed to new slots of the caller's frame
+    __slots__ = ('call', 'function', 'slots', 'expr')
+
+    def __init__(self, call: FunctionCall, function: FunctionDecl, slots, expr):
+        self.call = call
+        self.function = function
+        self.slots = slots
+        self.expr = expr
+
+    def __str__(self):
+        return f'Inlined({self.call}, {self.expr})'
 
 
 class Symbol(AbstractSymbol):
+    __slots__ = ('value', 'type')
+
     def __init__(self, name, value=None, symbol_type=None):
         super().__init__(name)
         self.name = name
@@ -225,88 +321,137 @@ class Symbol(AbstractSymbol):
     __repr__ = __str__
 
 
+class SlotSymbol(Symbol):
+    # variable resolved by the semantic analyzer to a slot of a frame
+    __slots__ = ('depth', 'slot', 'inferred_type')
+
+    def __init__(self, name, symbol_type, depth, slot, inferred_type=None):
+        super().__init__(name, None, symbol_type)
+        self.depth = depth
+        self.slot = slot
+        # type inferred for the values of the variable, see type_inference
+        self.inferred_type = inferred_type
+
+
 class VarSymbol(Symbol):
+    __slots__ = ()
+
     def __init__(self, name, value, base_type=None):
         super().__init__(name, value, base_type)
 
 
 class BooleanSymbol(Symbol):
+    __slots__ = ()
+
     def __init__(self, value):
         super().__init__(None, value, SymbolTypes.BOOLEAN)
 
 
 class BuiltinTypeSymbol(Symbol):
+    __slots__ = ()
+
     def __init__(self, name):
         super().__init__(name)
 
 
 class NotOp(AST):
-    def __init__(self, expr):
+    __slots__ = ('expr', 'pos')
+
+    def __init__(self, expr, pos=None):
         self.expr = expr
+        self.pos = pos
 
     def __str__(self):
         return f'NotOp({self.expr})'
 
 
 class BoolOp(AST):
-    def __init__(self, left, right):
+    __slots__ = ('left', 'right', 'pos', 'operands')
+
+    def __init__(self, left, right, pos=None):
         self.left = left
         self.right = right
+        self.pos = pos
+        # inferred type of both operands, if comparisons are specialized
+        # for it (see comparisons)
+        self.operands = None
 
     def __str__(self):
         return f'{self.__class__.__name__}({self.left}, {self.right})'
 
 
 class BoolOr(BoolOp):
-    def __init__(self, left, right):
-        super().__init__(left, right)
+    __slots__ = ()
+
+    def __init__(self, left, right, pos=None):
+        super().__init__(left, right, pos)
 
 
 class BoolAnd(BoolOp):
-    def __init__(self, left, right):
-        super().__init__(left, right)
+    __slots__ = ()
+
+    def __init__(self, left, right, pos=None):
+        super().__init__(left, right, pos)
 
 
 class BoolNotEqual(BoolOp):
-    def __init__(self, left, right):
-        super().__init__(left, right)
+    __slots__ = ()
+
+    def __init__(self, left, right, pos=None):
+        super().__init__(left, right, pos)
 
 
 class BoolGreaterThan(BoolOp):
-    def __init__(self, left, right):
-        super().__init__(left, right)
+    __slots__ = ()
+
+    def __init__(self, left, right, pos=None):
+        super().__init__(left, right, pos)
 
 
 class BoolGreaterThanOrEqual(BoolOp):
-    def __init__(self, left, right):
-        super().__init__(left, right)
+    __slots__ = ()
+
+    def __init__(self, left, right, pos=None):
+        super().__init__(left, right, pos)
 
 
 class BoolLessThan(BoolOp):
-    def __init__(self, left, right):
-        super().__init__(left, right)
+    __slots__ = ()
+
+    def __init__(self, left, right, pos=None):
+        super().__init__(left, right, pos)
 
 
 class BoolLessThanOrEqual(BoolOp):
-    def __init__(self, left, right):
-        super().__init__(left, right)
+    __slots__ = ()
+
+    def __init__(self, left, right, pos=None):
+        super().__init__(left, right, pos)
 
 
 class BoolIsEqual(BoolOp):
-    def __init__(self, left, right):
-        super().__init__(left, right)
+    __slots__ = ()
+
+    def __init__(self, left, right, pos=None):
+        super().__init__(left, right, pos)
 
 
 class IfBlock(AST):
+    __slots__ = ('expr', 'block', 'scope')
+
     def __init__(self, expr, block):
         self.expr = expr
         self.block = block
+        # range of the frame slots declared in the block
+        self.scope = None
 
     def __str__(self):
         return f'IfBlock({self.expr}, {self.block})'
 
 
 class IfStat(AST):
+    __slots__ = ('if_blocks', 'else_block')
+
     def __init__(self, if_blocks: List, else_block):
         self.if_blocks = if_blocks
         self.else_block = else_block
@@ -319,17 +464,41 @@ class IfStat(AST):
 
 
 class ForLoop(AST):
+    __slots__ = ('base', 'bool_expr', 'then', 'block', 'scope', 'invariants', 'inductions')
+
     def __init__(self, base: Assign, bool_expr, then, block: Block):
         self.base = base
         self.bool_expr = bool_expr
         self.then = then
         self.block = block
+        # range of the frame slots declared in the loop, its variable included
+        self.scope = None
+        # set by the loop optimizer: range of the slots of the loop's Hoisted
+        # expressions, and (slot, factor, step) of the variables that follow
+        # the loop variable multiplied by factor
+        self.invariants = None
+        self.inductions = ()
 
     def __str__(self):
         return f'ForLoop({self.base}, {self.bool_expr}, {self.then}, {self.block})'
 
 
+class Hoisted(AST):
+    # loop invariant expression, evaluated once per run of its loop and kept
+    # in a frame slot
+    __slots__ = ('expr', 'slot')
+
+    def __init__(self, expr, slot):
+        self.expr = expr
+        self.slot = slot
+
+    def __str__(self):
+        return f'Hoisted({self.expr})'
+
+
 class Break(AST):
+    __slots__ = ()
+
     def __init__(self):
         pass
 
@@ -361,6 +530,8 @@ class BeforeNodeVisitor(NodeVisitor, Breakable, Countable):
 
 
 class ReturnStat(AST):
+    __slots__ = ('base_expr',)
+
     def __init__(self, base_expr):
         self.base_expr = base_expr
 
@@ -10,11 +10,19 @@ class ErrorCode(Enum):
     SEMANTIC_ERROR = "Semantic error"
     INTERPRETER_ERROR = "Interpreter error"
     NUMBER_OF_ARGUMENTS_MISMATCH_ERROR = "Arguments error"
+    TYPE_ERROR = "Type error"
 
 
 class Error(Exception):
-    def __init__(self, error_code, message):
+    def __init__(self, error_code, message, pos=None, source_index=None):
+        # pos is the character offset of the offending token or node, resolved
+        # to a line and a column by the SourceIndex of its program
         self.error_code = error_code
+        self.pos = pos
+        self.lineno = self.column = None
+        if pos is not None and source_index is not None:
+            self.lineno, self.column = source_index.line_and_column(pos)
+            message = f'{message} (line: {self.lineno}; column: {self.column})'
         self.message = f'{self.__class__.__name__}: {message}'
 
     def __str__(self):
@@ -0,0 +1,56 @@
+from array import array
+from bisect import bisect_right
+
+
+class SourceIndex:
+    """
+    Offsets at which the lines of a source start, used to turn the character
+    offset stored in tokens and nodes into a line and a column.
+
+    Nothing is computed while lexing: the offsets are found with str.find the
+    first time a position is resolved (usually for an error message), and a
+    position is resolved by bisection. Streamed sources, whose text is not
+    kept, are indexed chunk by chunk instead.
+    """
+
+    __slots__ = ('text', 'length', 'line_starts')
+
+    def __init__(self, text=''):
+        # text is dropped once the line starts are computed
+        self.text = text
+        self.length = len(text)
+        self.line_starts = None
+
+    def get_line_starts(self):
+        if self.line_starts is None:
+            self.line_starts = array('q', [0])
+            self.add_lines(self.text, 0)
+            self.text = None
+        return self.line_starts
+
+    def add_lines(self, text, base):
+        find = text.find
+        append = self.line_starts.append
+        i = find('\n')
+        while i != -1:
+            append(base + i + 1)
+            i = find('\n', i + 1)
+
+    def extend(self, text):
+        # next chunk of a streamed source
+        self.get_line_starts()
+        self.add_lines(text, self.length)
+        self.length += len(text)
+
+    def line_and_column(self, offset):
+        line_starts = self.get_line_starts()
+        lineno = bisect_right(line_starts, offset)
+        return lineno, offset - line_starts[lineno - 1] + 1
+
+    def __getstate__(self):
+        # cached trees keep the line starts, not the whole source
+        return self.length, self.get_line_starts()
+
+    def __setstate__(self, state):
+        self.text = None
+        self.length, self.line_starts = state